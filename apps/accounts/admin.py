@@ -8,7 +8,7 @@ class UserAdmin(admin.ModelAdmin):
     
 @admin.register(OTP)
 class OTPAdmin(admin.ModelAdmin):
-    list_display = ['otp', 'user']
+    list_display = ['user', 'expires_at', 'attempts']
 
 
 @admin.register(Customer)
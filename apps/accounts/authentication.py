@@ -0,0 +1,28 @@
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from apps.accounts import tokens
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates "Authorization: Bearer <access token>" requests from the
+    token's signed claims alone, no session or user row is read. request.auth
+    holds the claims.
+    """
+
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) != 2:
+            raise AuthenticationFailed("Invalid token header.")
+        try:
+            return tokens.authenticate(header[1].decode())
+        except (tokens.InvalidToken, UnicodeError) as exc:
+            raise AuthenticationFailed(str(exc) or "Token is invalid.")
+
+    def authenticate_header(self, request):
+        return f'{self.keyword} realm="api"'
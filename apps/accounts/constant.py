@@ -18,4 +18,9 @@ CUSTOMER_GROUP_CHOICES = [
     ("Walkin", "Walkin"),
     ("Local", "Local"),
     ("Foreign", "Foreign"),
-]
\ No newline at end of file
+]
+
+# password reset codes, see apps.accounts.otp
+OTP_LENGTH = 6
+OTP_EXPIRY_MINUTES = 10
+OTP_MAX_ATTEMPTS = 5
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from apps.accounts.onboarding import ONBOARDING_KINDS, Onboarder
+from utils.imports import IMPORT_FORMATS, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create customers, suppliers or billers together with their users "
+        "from a CSV or JSONL file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(ONBOARDING_KINDS))
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, dest="file_format")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Processes hashing passwords, defaults to one per CPU.",
+        )
+
+    def handle(self, *args, **options):
+        file_format = options["file_format"] or guess_format(options["path"])
+        onboarder = Onboarder(
+            options["kind"],
+            chunk_size=options["chunk_size"],
+            processes=options["processes"],
+        )
+        with open(options["path"], encoding="utf-8-sig", newline="") as fileobj:
+            report = onboarder.run(read_rows(fileobj, file_format))
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Onboarded {report['created']} {options['kind']}s, "
+                f"{len(report['errors'])} rows failed."
+            )
+        )
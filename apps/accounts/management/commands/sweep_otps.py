@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.accounts.otp import sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired password reset codes, once or every --interval seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--interval", type=float, help="Keep sweeping, this many seconds apart."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = sweep_expired(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired codes."))
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
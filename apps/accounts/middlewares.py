@@ -1,10 +0,0 @@
-class CustomMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        response = self.get_response(request)
-        
-        print("Custom Middleware Called")
-
-        return response
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.5 on 2026-10-18 19:50
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='biller',
+            name='otp',
+        ),
+        migrations.RemoveField(
+            model_name='biller',
+            name='otp_creation_at',
+        ),
+        migrations.RemoveField(
+            model_name='biller',
+            name='otp_expiration_at',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.5 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_biller_otp_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='biller',
+            index=models.Index(fields=['created_on', 'id'], name='biller_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_on', 'id'], name='customer_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(fields=['created_on', 'id'], name='supplier_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined', 'id'], name='user_date_joined_id_idx'),
+        ),
+    ]
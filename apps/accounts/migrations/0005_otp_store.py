@@ -0,0 +1,45 @@
+# Generated by Django 4.2.5 on 2026-10-18 21:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def delete_plain_codes(apps, schema_editor):
+    # plain text codes cannot be verified against hashes, users ask again
+    apps.get_model("accounts", "OTP").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_plain_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='otp',
+            name='otp',
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='code_hash',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='expires_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ),
+    ]
@@ -15,8 +15,9 @@ from utils.validations import (
 from utils.models import (
     CommonInfo,
     Address,
-    OTP,
+    OTP as BaseOTP,
 )
+from utils.phones import PhoneNumberField
 
 import uuid
 
@@ -24,8 +25,9 @@ import uuid
 class User(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     full_name = models.CharField(max_length=100)
-    phone = models.CharField(
-        max_length=15, null=False, unique=True, validators=[validate_mobile_number]
+    # stored in E.164 form
+    phone = PhoneNumberField(
+        null=False, unique=True, validators=[validate_mobile_number]
     )
     email = models.EmailField(unique=True, validators=[valid_emails])
     gender = models.CharField(
@@ -51,6 +53,11 @@ class User(AbstractUser):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["date_joined", "id"], name="user_date_joined_id_idx"),
+        ]
+
     def __str__(self):
         return self.full_name
 
@@ -91,7 +98,25 @@ class Biller(CommonInfo, Address):
         return self.user.full_name
 
 
-class OTP(models.Model):
+class OTP(BaseOTP):
+    # one live code per user, found through the unique user index
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    otp = models.CharField(max_length=8)
-    created_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # expired codes are swept in batches, see apps.accounts.otp
+            models.Index(fields=["expires_at"], name="otp_expires_idx"),
+        ]
+
+
+class RevokedToken(models.Model):
+    # signed access/refresh tokens revoked before they expire, see
+    # apps.accounts.tokens
+    jti = models.CharField(max_length=32, unique=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["expires_at"], name="revoked_expires_idx"),
+        ]
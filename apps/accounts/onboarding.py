@@ -0,0 +1,281 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from apps.accounts.models import Biller, Customer, Supplier, User
+from apps.accounts.serializers import (
+    BillerSerializer,
+    CustomerSerializer,
+    SupplierSerializer,
+    UserSerializer,
+)
+from apps.store.models import Warehouse
+from utils.numbering import BILLER_CODE, SUPPLIER_CODE
+from utils.phones import normalize
+from utils.validations import valid_emails, validate_mobile_number
+
+
+UNIQUE_USER_FIELDS = ("email", "phone", "username")
+
+
+class BulkUserSerializer(UserSerializer):
+    """
+    UserSerializer without its per-row uniqueness queries, uniqueness is
+    checked once per chunk by the Onboarder.
+    """
+
+    class Meta(UserSerializer.Meta):
+        extra_kwargs = {
+            "email": {"validators": [valid_emails]},
+            "phone": {"validators": [validate_mobile_number]},
+            "username": {"validators": []},
+        }
+
+    def validate_phone(self, value):
+        # duplicates within the file are compared in E.164 form
+        return normalize(value)
+
+
+class BulkCustomerSerializer(CustomerSerializer):
+    # existence is checked once per chunk
+    supplier_name = serializers.UUIDField(source="supplier_name_id")
+
+
+class BulkBillerSerializer(BillerSerializer):
+    warehouse = serializers.UUIDField(
+        source="warehouse_id", required=False, allow_null=True
+    )
+
+
+class Kind:
+    def __init__(self, model, serializer_class, references=None, numbering=None):
+        self.model = model
+        self.serializer_class = serializer_class
+        # validated field -> model its ids must exist in
+        self.references = references or {}
+        # (model field, utils.numbering allocator)
+        self.numbering = numbering
+
+
+ONBOARDING_KINDS = {
+    "customer": Kind(
+        Customer,
+        BulkCustomerSerializer,
+        references={"supplier_name_id": Supplier},
+    ),
+    "supplier": Kind(
+        Supplier, SupplierSerializer, numbering=("supplier_code", SUPPLIER_CODE)
+    ),
+    "biller": Kind(
+        Biller,
+        BulkBillerSerializer,
+        references={"warehouse_id": Warehouse},
+        numbering=("biller_code", BILLER_CODE),
+    ),
+}
+
+
+def _setup_worker():
+    # a no-op for forked workers, needed when workers are spawned
+    django.setup()
+
+
+def split_row(row):
+    """
+    (user data, profile data) of one row, either nested like the create
+    endpoints ({"user": {...}, ...}) or flat as in a CSV file, where an
+    empty cell means the field was left out.
+    """
+    if isinstance(row.get("user"), dict):
+        profile = dict(row)
+        return profile.pop("user"), profile
+    user_fields = set(BulkUserSerializer.Meta.fields)
+    user, profile = {}, {}
+    for key, value in row.items():
+        if value == "":
+            continue
+        (user if key in user_fields else profile)[key] = value
+    return user, profile
+
+
+class Onboarder:
+    """
+    Creates users together with their customer, supplier or biller profile
+    in chunks. Each chunk is validated with one query per unique user field
+    and per referenced table, its passwords are hashed in a process pool
+    (PBKDF2 is what makes one-by-one creation slow), and users and profiles
+    are written with one bulk_create each inside one transaction. Invalid
+    rows are reported with their errors, not written.
+    """
+
+    def __init__(self, kind, chunk_size=1000, processes=None):
+        self.kind = ONBOARDING_KINDS[kind]
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.user_validator = BulkUserSerializer()
+        self.profile_validator = self.kind.serializer_class()
+        # unique values of the users written so far
+        self.seen = {field: set() for field in UNIQUE_USER_FIELDS}
+        self.created = 0
+        self.errors = []
+
+    def run(self, rows):
+        executor = None
+        if self.processes != 1:
+            executor = ProcessPoolExecutor(
+                max_workers=self.processes, initializer=_setup_worker
+            )
+        try:
+            chunk = []
+            for number, row in enumerate(rows, start=1):
+                chunk.append((number, row))
+                if len(chunk) == self.chunk_size:
+                    self.import_chunk(chunk, executor)
+                    chunk = []
+            if chunk:
+                self.import_chunk(chunk, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.report()
+
+    def report(self):
+        return {"created": self.created, "errors": self.errors}
+
+    def validate(self, row):
+        if not isinstance(row, dict):
+            raise serializers.ValidationError({"row": "Expected an object."})
+        user_data, profile_data = split_row(row)
+        errors, user, profile = {}, None, None
+        try:
+            user = self.user_validator.run_validation(user_data)
+        except serializers.ValidationError as exc:
+            errors["user"] = exc.detail
+        try:
+            profile = self.profile_validator.run_validation(profile_data)
+        except serializers.ValidationError as exc:
+            errors.update(exc.detail)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return user, profile
+
+    def conflicts(self, rows, rejected=()):
+        """
+        {row number: errors} for rows whose email, phone or username is
+        taken, by an existing user, a row written earlier or an earlier row
+        of `rows`. Rows numbered in `rejected` are not written, so they take
+        no values.
+        """
+        taken = {
+            field: self.seen[field]
+            | set(
+                User.objects.filter(
+                    **{f"{field}__in": [user[field] for _, user, _ in rows]}
+                ).values_list(field, flat=True)
+            )
+            for field in UNIQUE_USER_FIELDS
+        }
+        conflicts = {}
+        for number, user, _ in rows:
+            errors = {
+                field: [f"A user with this {field} already exists."]
+                for field in UNIQUE_USER_FIELDS
+                if user[field] in taken[field]
+            }
+            if errors:
+                conflicts[number] = {"user": errors}
+            elif number not in rejected:
+                for field in UNIQUE_USER_FIELDS:
+                    taken[field].add(user[field])
+        return conflicts
+
+    def missing_references(self, rows):
+        missing = {}
+        for field, model in self.kind.references.items():
+            ids = {profile.get(field) for _, _, profile in rows} - {None}
+            existing = set(
+                model.objects.filter(id__in=ids).values_list("id", flat=True)
+            )
+            for number, _, profile in rows:
+                if profile.get(field) not in existing | {None}:
+                    name = field[: -len("_id")]
+                    missing.setdefault(number, {})[name] = [
+                        f"Invalid pk \"{profile[field]}\" - object does not exist."
+                    ]
+        return missing
+
+    def hash_passwords(self, passwords, executor):
+        if executor is None or len(passwords) == 1:
+            return [make_password(password) for password in passwords]
+        workers = self.processes or os.cpu_count() or 1
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+    def import_chunk(self, chunk, executor):
+        rows = []
+        for number, row in chunk:
+            try:
+                user, profile = self.validate(row)
+            except serializers.ValidationError as exc:
+                self.errors.append({"row": number, "errors": exc.detail})
+                continue
+            rows.append((number, user, profile))
+        if not rows:
+            return
+
+        rejected = self.missing_references(rows)
+        for number, errors in self.conflicts(rows, rejected).items():
+            rejected.setdefault(number, {}).update(errors)
+        for number in sorted(rejected):
+            self.errors.append({"row": number, "errors": rejected[number]})
+        rows = [row for row in rows if row[0] not in rejected]
+        if not rows:
+            return
+
+        hashes = self.hash_passwords([user["password"] for _, user, _ in rows], executor)
+        users, profiles = [], []
+        for (number, user_data, profile_data), password in zip(rows, hashes):
+            user_data = dict(user_data)
+            user_data.pop("password2")
+            user_data["password"] = password
+            user = User(**user_data)
+            users.append(user)
+            profiles.append(self.kind.model(user=user, **profile_data))
+        if self.kind.numbering:
+            field, numbering = self.kind.numbering
+            for profile, code in zip(
+                profiles, numbering.allocate_many(len(profiles))
+            ):
+                setattr(profile, field, numbering.format(code))
+
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                self.kind.model.objects.bulk_create(profiles)
+        except IntegrityError:
+            # a concurrent writer took one of the values, find the row(s)
+            self.write_one_by_one(rows, users, profiles)
+        else:
+            self.created += len(users)
+            for user in users:
+                self.remember(user)
+
+    def write_one_by_one(self, rows, users, profiles):
+        for (number, _, _), user, profile in zip(rows, users, profiles):
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                    profile.save(force_insert=True)
+            except IntegrityError as exc:
+                self.errors.append({"row": number, "errors": {"user": [str(exc)]}})
+            else:
+                self.created += 1
+                self.remember(user)
+
+    def remember(self, user):
+        for field in UNIQUE_USER_FIELDS:
+            self.seen[field].add(getattr(user, field))
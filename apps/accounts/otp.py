@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from apps.accounts.constant import OTP_EXPIRY_MINUTES, OTP_MAX_ATTEMPTS
+from apps.accounts.models import OTP
+from apps.accounts.utils import generate_otp
+
+
+def hash_code(code):
+    """
+    Keyed with SECRET_KEY, so a leaked table cannot be brute forced offline
+    over the million possible codes.
+    """
+    return salted_hmac("apps.accounts.otp", str(code), algorithm="sha256").hexdigest()
+
+
+def issue(user):
+    """
+    Replaces the user's code with a new one (in one upsert) and returns it.
+    Only its hash is stored.
+    """
+    code = generate_otp()
+    now = timezone.now()
+    OTP.objects.bulk_create(
+        [
+            OTP(
+                user=user,
+                code_hash=hash_code(code),
+                created_at=now,
+                expires_at=now + timedelta(minutes=OTP_EXPIRY_MINUTES),
+                attempts=0,
+            )
+        ],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["code_hash", "created_at", "expires_at", "attempts"],
+    )
+    return code
+
+
+def verify(email, code):
+    """
+    Consumes the code and returns its user when `code` is the live code of
+    `email`, otherwise counts a failed attempt and returns None. The check is
+    one lookup through the unique email and user indexes; expired codes and
+    codes with too many failures never match.
+
+    The matching row is locked until it is deleted, so concurrent requests
+    with the same code cannot both consume it: the others find it gone.
+    """
+    with transaction.atomic():
+        otp = (
+            OTP.objects.select_for_update(of=("self",))
+            .select_related("user")
+            .filter(
+                user__email=email,
+                code_hash=hash_code(code),
+                expires_at__gt=timezone.now(),
+                attempts__lt=OTP_MAX_ATTEMPTS,
+            )
+            .first()
+        )
+        if otp is None:
+            OTP.objects.filter(user__email=email).update(attempts=F("attempts") + 1)
+            return None
+        deleted, _ = OTP.objects.filter(pk=otp.pk).delete()
+    return otp.user if deleted else None
+
+
+def sweep_expired(batch_size=1000):
+    """
+    Deletes expired codes, `batch_size` rows per statement so the sweep
+    never holds long locks. Returns the number of rows deleted.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            OTP.objects.filter(expires_at__lte=timezone.now())
+            .order_by("expires_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += OTP.objects.filter(id__in=ids).delete()[0]
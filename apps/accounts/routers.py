@@ -6,6 +6,7 @@ from apps.accounts.views import (
     SupplierViewSet,
     BillerViewSet,
     WarehouseViewSet,
+    TokenViewSet,
 )
 
 router = DefaultRouter()
@@ -14,5 +15,6 @@ router.register("customers", CustomerViewSet, basename="customers")
 router.register("suppliers", SupplierViewSet, basename="suppliers")
 router.register("billers", BillerViewSet, basename="billers")
 router.register("warehouse", WarehouseViewSet, basename="warehouse")
+router.register("token", TokenViewSet, basename="token")
 
 
@@ -1,7 +1,5 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from decouple import config
-import pyotp
 
 from apps.accounts.models import (
     User,
@@ -12,6 +10,7 @@ from apps.accounts.models import (
 )
 
 from apps.store.models import Warehouse
+from utils.reference_cache import CachedRelatedField, CachedRelatedListSerializer
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True,
@@ -64,6 +63,8 @@ class SupplierSerializer(serializers.ModelSerializer):
             "supplier_code",
             "company",
         ]
+        # allocated by utils.numbering
+        read_only_fields = ["supplier_code"]
 
 
     
@@ -95,6 +96,8 @@ class BillerSerializer(serializers.ModelSerializer):
             "warehouse",
             "biller_code"
         ]
+        # allocated by utils.numbering
+        read_only_fields = ["biller_code"]
 
 
 class WarehouseSerializer(serializers.ModelSerializer):
@@ -119,10 +122,11 @@ class GetSupplierSerializer(serializers.ModelSerializer):
 
 class GetBillerSerializer(serializers.ModelSerializer):
     user = UserSerializer()
-    warehouse = WarehouseSerializer()
+    warehouse = CachedRelatedField(WarehouseSerializer)
 
     class Meta:
         model = Biller
+        list_serializer_class = CachedRelatedListSerializer
         fields = (
             "id",
             "biller_code",
@@ -167,7 +171,8 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
    
     def update(self, instance, validated_data):
         instance.set_password(validated_data.get("password"))
-        instance.save()
+        # a token user only has the token's fields loaded
+        instance.save(update_fields=["password"])
         return instance
 
 
@@ -179,13 +184,14 @@ class EmailSerializer(serializers.Serializer):
         fields = ['email']
     
 class ForgotPasswordSerializer(serializers.ModelSerializer):
+    email = serializers.EmailField()
     otp = serializers.CharField()
     password = serializers.CharField(write_only=True)
     password1 = serializers.CharField(write_only=True)
     
     class Meta:
         model = OTP
-        fields = ['otp', 'password', 'password1']
+        fields = ['email', 'otp', 'password', 'password1']
     
     
     def validate(self, data):
@@ -196,3 +202,12 @@ class ForgotPasswordSerializer(serializers.ModelSerializer):
     
 
     
+
+
+class LoginSerializer(serializers.Serializer):
+    email = serializers.EmailField()
+    password = serializers.CharField(write_only=True)
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
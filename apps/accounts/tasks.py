@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.mail import EmailMessage
+
+from apps.accounts import otp
+from apps.accounts.models import User
+from apps.tasks.mail import deliver
+from apps.tasks.queue import register
+from utils.emails import otp_message
+
+
+@register("otp.send", batch=True)
+def send_otp(payloads):
+    """
+    Issues the password reset codes queued by utils.emails.send_otp_email
+    and mails them over one SMTP connection. A retry issues a new code,
+    which replaces the undelivered one.
+    """
+    users = {
+        str(pk): user
+        for pk, user in User.objects.in_bulk(
+            [payload["user"] for payload in payloads]
+        ).items()
+    }
+    results = [None] * len(payloads)
+    messages, positions = [], []
+    for position, payload in enumerate(payloads):
+        user = users.get(payload["user"])
+        if user is None:
+            continue
+        subject, body = otp_message(otp.issue(user))
+        messages.append(
+            EmailMessage(subject, body, settings.EMAIL_HOST_USER, [user.email])
+        )
+        positions.append(position)
+    if messages:
+        for position, result in zip(positions, deliver(messages)):
+            results[position] = result
+    return results
@@ -1,3 +1,577 @@
-from django.test import TestCase
+import csv
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+
+from apps.accounts import tokens
+from apps.accounts.authentication import SignedTokenAuthentication
+from apps.accounts.constant import OTP_MAX_ATTEMPTS
+from apps.accounts.models import OTP, Biller, Customer, Supplier, User
+from apps.accounts.onboarding import Onboarder
+from apps.accounts.otp import hash_code, issue, sweep_expired, verify
+from apps.store.models import Warehouse
+from apps.tasks.models import Task
+from apps.tasks.queue import work
+from utils import phones
+from utils.numbering import Numbering
+from utils.permissions import SupplierPermission
+
+
+def create_user(index=0):
+    return User.objects.create_user(
+        email=f"user{index}@example.com",
+        password="secret-pass-123",
+        full_name=f"User {index}",
+        username=f"user{index}",
+        phone=f"+97798000000{index:02d}",
+    )
+
+
+class OTPTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def test_only_the_hash_of_the_latest_code_is_kept(self):
+        first = issue(self.user)
+        second = issue(self.user)
+        self.assertRegex(second, r"^\d{6}$")
+        otp = OTP.objects.get()
+        self.assertEqual(otp.code_hash, hash_code(second))
+        self.assertNotIn(second, otp.code_hash)
+        if first != second:
+            self.assertIsNone(verify(self.user.email, first))
+
+    def test_a_code_works_once(self):
+        code = issue(self.user)
+        self.assertEqual(verify(self.user.email, code), self.user)
+        self.assertIsNone(verify(self.user.email, code))
+        self.assertFalse(OTP.objects.exists())
+
+    def test_failed_attempts_lock_the_code(self):
+        code = issue(self.user)
+        wrong = "%06d" % ((int(code) + 1) % 10**6)
+        for _ in range(OTP_MAX_ATTEMPTS):
+            self.assertIsNone(verify(self.user.email, wrong))
+        self.assertEqual(OTP.objects.get().attempts, OTP_MAX_ATTEMPTS)
+        self.assertIsNone(verify(self.user.email, code))
+
+    def test_expired_codes_do_not_verify_and_are_swept(self):
+        code = issue(self.user)
+        OTP.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(verify(self.user.email, code))
+
+        for index in range(1, 6):
+            issue(create_user(index))
+        OTP.objects.filter(user__email="user1@example.com").update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(sweep_expired(batch_size=1), 2)
+        self.assertEqual(OTP.objects.count(), 4)
+
+        out = StringIO()
+        call_command("sweep_otps", stdout=out)
+        self.assertIn("Deleted 0 expired codes.", out.getvalue())
+
+    def test_verification_is_one_indexed_lookup(self):
+        code = issue(self.user)
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = (
+                OTP.objects.filter(
+                    user__email=self.user.email,
+                    code_hash=hash_code(code),
+                    expires_at__gt=timezone.now(),
+                )
+                .explain()
+            )
+        self.assertIn("accounts_otp_user_id_key", plan)
+        with CaptureQueriesContext(connection) as queries:
+            verify(self.user.email, code)
+        statements = [
+            query["sql"] for query in queries if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(len(statements), 2)
+        self.assertIn("FOR UPDATE", statements[0])
+        self.assertTrue(statements[1].startswith("DELETE"))
+
+    def test_password_reset_flow(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            "/api/user/forgot-password/", {"email": self.user.email}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("data", response.data)
+        work()
+        code = re.search(r"\d{6}", mail.outbox[0].body).group()
+        # only the user id was queued, the code is rendered at send time
+        self.assertNotIn(
+            code, str(list(Task.objects.values_list("payload", flat=True)))
+        )
+
+        payload = {
+            "email": self.user.email,
+            "otp": code,
+            "password": "new-secret-456",
+            "password1": "new-secret-456",
+        }
+        response = client.post("/api/user/change-password/", payload, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("new-secret-456"))
+
+        response = client.post("/api/user/change-password/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+def user_payload(index):
+    return {
+        "full_name": f"New {index}",
+        "phone": f"+97798100000{index:02d}",
+        "email": f"new{index}@example.com",
+        "username": f"new{index}",
+        "gender": "Male",
+        "password": "secret-pass-123",
+        "password2": "secret-pass-123",
+    }
+
+
+
+class ConcurrentOTPTestCase(TransactionTestCase):
+    def test_a_code_is_consumed_once_under_concurrency(self):
+        user = create_user()
+        barrier = threading.Barrier(8)
+
+        def consume(code):
+            try:
+                barrier.wait()
+                return verify(user.email, code)
+            finally:
+                connections.close_all()
+
+        for _ in range(10):
+            code = issue(user)
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                users = list(pool.map(consume, [code] * 8))
+            self.assertEqual(users.count(user), 1)
+            self.assertFalse(OTP.objects.exists())
+
+class NumberingTestCase(TestCase):
+    def test_supplier_codes_continue_after_existing_ones(self):
+        Supplier.objects.create(user=create_user(), supplier_code=41, company="Old")
+        client = APIClient()
+        codes = []
+        for index in range(2):
+            response = client.post(
+                "/api/suppliers/",
+                {"user": user_payload(index), "company": f"New {index}"},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+            codes.append(response.data["data"]["supplier_code"])
+        self.assertEqual(codes, [42, 43])
+
+    def test_biller_codes_are_formatted(self):
+        warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        response = APIClient().post(
+            "/api/billers/",
+            {"user": user_payload(0), "NID": "1", "warehouse": str(warehouse.pk)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Biller.objects.get().biller_code, "BC-00001")
+
+    def test_biller_codes_continue_after_the_highest_existing_one(self):
+        warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        # deleted billers leave gaps, counting rows would hand out BC-00004
+        for index, code in enumerate(["BC-00001", "BC-00005", "legacy-7"]):
+            Biller.objects.create(
+                user=create_user(index), NID=str(index), warehouse=warehouse, biller_code=code
+            )
+        response = APIClient().post(
+            "/api/billers/",
+            {"user": user_payload(0), "NID": "9", "warehouse": str(warehouse.pk)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            Biller.objects.get(user__email="new0@example.com").biller_code, "BC-00006"
+        )
+
+
+class ConcurrentNumberingTestCase(TransactionTestCase):
+    def test_concurrent_allocations_never_repeat(self):
+        numbering = Numbering("test_concurrent", template="T-{number}")
+
+        def allocate(_):
+            try:
+                return [numbering.next() for _ in range(25)]
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            numbers = [number for batch in pool.map(allocate, range(8)) for number in batch]
+        self.assertEqual(len(numbers), 200)
+        self.assertEqual(len(set(numbers)), 200)
+
+
+def onboarding_row(index, **profile):
+    return {
+        "user": {
+            "full_name": f"Member {index}",
+            "email": f"member{index}@example.com",
+            "phone": f"+977981{index:07d}",
+            "username": f"member{index}",
+            "gender": "Male",
+            "password": "secret-pass-123",
+            "password2": "secret-pass-123",
+        },
+        **profile,
+    }
+
+
+class OnboardingTestCase(TestCase):
+    def setUp(self):
+        self.admin = create_user()
+        self.admin.is_staff = True
+        self.admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_bad_rows_are_reported_and_the_rest_created(self):
+        mismatch = onboarding_row(4, company="D")
+        mismatch["user"]["password2"] = "something-else-1"
+        taken = onboarding_row(5, company="E")
+        taken["user"]["email"] = self.admin.email
+        rows = [
+            onboarding_row(1, company="A"),
+            onboarding_row(2, company="B"),
+            # same username as row 1
+            {**onboarding_row(3, company="C"), "user": {
+                **onboarding_row(3)["user"], "username": "member1"
+            }},
+            mismatch,
+            taken,
+            onboarding_row(6),
+        ]
+        response = self.client.post("/api/suppliers/import/", rows, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        errors = {error["row"]: error["errors"] for error in response.data["errors"]}
+        self.assertEqual(sorted(errors), [3, 4, 5, 6])
+        self.assertIn("username", errors[3]["user"])
+        self.assertIn("password", errors[4]["user"])
+        self.assertIn("email", errors[5]["user"])
+        self.assertIn("company", errors[6])
+
+        suppliers = Supplier.objects.select_related("user").order_by("supplier_code")
+        self.assertEqual([s.company for s in suppliers], ["A", "B"])
+        self.assertEqual(len({s.supplier_code for s in suppliers}), 2)
+        self.assertTrue(suppliers[0].user.check_password("secret-pass-123"))
+        self.assertEqual(suppliers[0].created_by, self.admin)
+
+    def test_rejected_rows_do_not_reserve_their_values(self):
+        taken_phone = onboarding_row(1, company="A")
+        taken_phone["user"]["phone"] = self.admin.phone
+        # row 1 is rejected for its phone, so its email is still free
+        retry = onboarding_row(2, company="B")
+        retry["user"]["email"] = taken_phone["user"]["email"]
+        report = Onboarder("supplier", processes=1).run([taken_phone, retry])
+        self.assertEqual(report["created"], 1)
+        self.assertEqual([error["row"] for error in report["errors"]], [1])
+        self.assertTrue(User.objects.filter(email="member1@example.com").exists())
+
+    def test_unknown_file_formats_are_rejected(self):
+        upload = SimpleUploadedFile("members.csv", b"email\r\n")
+        response = self.client.post(
+            "/api/suppliers/import/",
+            {"file": upload, "file_format": "xlsx"},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("file_format", response.data)
+
+    def test_only_admins_may_onboard(self):
+        self.client.force_authenticate(create_user(1))
+        response = self.client.post(
+            "/api/suppliers/import/", [onboarding_row(1, company="A")], format="json"
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_queries_do_not_grow_with_the_rows(self):
+        supplier = Supplier.objects.create(supplier_code=1, company="Acme")
+
+        def onboard(start, count):
+            rows = [
+                onboarding_row(index, supplier_name=str(supplier.pk), customer_group="General")
+                for index in range(start, start + count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                report = Onboarder("customer", processes=1).run(rows)
+            self.assertEqual(report, {"created": count, "errors": []})
+            return len(queries)
+
+        self.assertEqual(onboard(1, 3), onboard(100, 30))
+        self.assertEqual(Customer.objects.filter(supplier_name=supplier).count(), 33)
+
+    def test_missing_references_are_reported(self):
+        report = Onboarder("customer", processes=1).run(
+            [
+                onboarding_row(
+                    1,
+                    supplier_name="00000000-0000-0000-0000-000000000000",
+                    customer_group="General",
+                )
+            ]
+        )
+        self.assertEqual(report["created"], 0)
+        self.assertIn("supplier_name", report["errors"][0]["errors"])
+        self.assertFalse(User.objects.filter(email="member1@example.com").exists())
+
+    def test_command_reads_flat_csv_rows_with_a_process_pool(self):
+        warehouse = Warehouse.objects.create(
+            name="Main", email="main@example.com", phone="+9779800000099"
+        )
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, "w", newline="") as fileobj:
+            fields = list(onboarding_row(0)["user"]) + ["NID", "warehouse"]
+            writer = csv.DictWriter(fileobj, fieldnames=fields)
+            writer.writeheader()
+            for index in range(1, 6):
+                writer.writerow(
+                    {**onboarding_row(index)["user"], "NID": f"NID{index}",
+                     "warehouse": warehouse.pk}
+                )
+            # no warehouse
+            writer.writerow({**onboarding_row(6)["user"], "NID": "NID6"})
+
+        out = StringIO()
+        call_command(
+            "onboard", "biller", path, "--processes", "2", "--chunk-size", "4",
+            stdout=out, stderr=StringIO(),
+        )
+        self.assertIn("Onboarded 6 billers, 0 rows failed.", out.getvalue())
+        billers = Biller.objects.select_related("user").order_by("biller_code")
+        self.assertEqual(len({biller.biller_code for biller in billers}), 6)
+        self.assertEqual(
+            sum(biller.warehouse_id == warehouse.pk for biller in billers), 5
+        )
+        for biller in billers:
+            self.assertTrue(biller.user.check_password("secret-pass-123"))
+
+
+class TokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.user.role = "Supplier"
+        self.user.save()
+        self.supplier = Supplier.objects.create(
+            user=self.user, supplier_code=1, company="Acme"
+        )
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post(
+            "/api/token/",
+            {"email": self.user.email, "password": "secret-pass-123"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def test_login_checks_the_password(self):
+        response = self.client.post(
+            "/api/token/",
+            {"email": self.user.email, "password": "wrong-password"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(self.login()), {"access", "refresh"})
+
+    def test_requests_read_no_session_or_user(self):
+        access = self.login()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/warehouse/")
+        self.assertEqual(response.status_code, 200)
+        for query in queries:
+            self.assertNotIn("django_session", query["sql"])
+            self.assertNotIn('"accounts_user"', query["sql"])
+
+    def test_supplier_permission_is_answered_from_the_claims(self):
+        access = self.login()["access"]
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        "warm" in tokens.revocations
+        with self.assertNumQueries(0):
+            user, claims = SignedTokenAuthentication().authenticate(request)
+            request.user = user
+            permission = SupplierPermission()
+            self.assertTrue(permission.has_permission(request, None))
+            purchase = SimpleNamespace(supplier_id=self.supplier.pk)
+            self.assertTrue(permission.has_object_permission(request, None, purchase))
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.full_name, self.user.full_name)
+
+    def test_refresh_tokens_work_once(self):
+        pair = self.login()
+        response = self.client.post(
+            "/api/token/refresh/", {"refresh": pair["refresh"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.data["refresh"], pair["refresh"])
+        response = self.client.post(
+            "/api/token/refresh/", {"refresh": pair["refresh"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_logout_revokes_both_tokens(self):
+        pair = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {pair['access']}")
+        response = self.client.post(
+            "/api/token/logout/", {"refresh": pair["refresh"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get("/api/warehouse/").status_code, 401)
+        self.client.credentials()
+        response = self.client.post(
+            "/api/token/refresh/", {"refresh": pair["refresh"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_expired_and_refresh_tokens_are_rejected(self):
+        pair = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {pair['refresh']}")
+        self.assertEqual(self.client.get("/api/warehouse/").status_code, 401)
+
+        self.client.credentials()
+        with override_settings(AUTH_TOKENS={"ACCESS_LIFETIME": -1}):
+            access = self.login()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = self.client.get("/api/warehouse/")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["WWW-Authenticate"], 'Bearer realm="api"')
+
+
+class PhoneNumberTestCase(TestCase):
+    def test_numbers_are_stored_and_looked_up_in_e164_form(self):
+        user = User.objects.create_user(
+            email="phone@example.com",
+            password="secret-pass-123",
+            full_name="Phone",
+            username="phone",
+            phone="+977 980-0000050",
+        )
+        self.assertEqual(user.phone, "+9779800000050")
+        self.assertEqual(
+            User.objects.values_list("phone", flat=True).get(pk=user.pk),
+            "+9779800000050",
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(User.objects.get(phone="+977-9800000050"), user)
+        self.assertIn("+9779800000050", queries[0]["sql"])
+
+        response = APIClient().get("/api/user/", {"phone": "+977 98000 00050"})
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]], [str(user.pk)]
+        )
+
+    def test_stored_spellings_are_normalized_unless_they_collide(self):
+        users = [
+            User.objects.create_user(
+                email=f"phone{index}@example.com",
+                password="secret-pass-123",
+                full_name="Phone",
+                username=f"phone{index}",
+                phone=f"+977980000000{index}",
+            )
+            for index in range(4)
+        ]
+        # rows written before the field normalized anything
+        raw = [
+            "+977 980-0000000",
+            "+977-9800000001",
+            "+9779800000002",
+            "+977 98000 00002",
+        ]
+        with connection.cursor() as cursor:
+            for user, phone in zip(users, raw):
+                cursor.execute(
+                    f"UPDATE {User._meta.db_table} SET phone = %s WHERE id = %s",
+                    [phone, user.pk],
+                )
+
+        with self.assertRaisesMessage(RuntimeError, str(users[3].pk)):
+            phones.normalize_stored(User)
+
+        def stored():
+            return list(
+                User.objects.filter(pk__in=[user.pk for user in users])
+                .order_by("username")
+                .values_list("phone", flat=True)
+            )
+
+        self.assertEqual(stored(), raw)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {User._meta.db_table} SET phone = %s WHERE id = %s",
+                ["+977 980-0000003", users[3].pk],
+            )
+        phones.normalize_stored(User)
+        self.assertEqual(stored(), [f"+977980000000{index}" for index in range(4)])
+
+    def test_invalid_numbers_are_rejected(self):
+        self.assertEqual(phones.normalize("+9779800000050"), "+9779800000050")
+        for value, message in (
+            ("9800000050", "country code"),
+            ("+97712", "valid phone"),
+        ):
+            with self.assertRaisesMessage(ValidationError, message):
+                phones.normalize(value)
+
+    def test_parsing_is_memoized(self):
+        with mock.patch.object(phones, "_parse", wraps=phones._parse) as parse:
+            for _ in range(3):
+                phones.normalize("+9779800000077")
+                with self.assertRaises(ValidationError):
+                    phones.normalize("+97700")
+        self.assertEqual(parse.call_count, 2)
+
+    def test_phonenumbers_is_imported_on_first_use(self):
+        code = (
+            "import sys, django; django.setup(); "
+            "import apps.accounts.models, apps.accounts.onboarding; "
+            "print('phonenumbers' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.split()[-1], "False")
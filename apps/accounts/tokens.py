@@ -0,0 +1,200 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+
+from apps.accounts.models import RevokedToken, Supplier, User
+
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+DEFAULTS = {
+    # seconds an access token is accepted, revocation of these is eventual
+    "ACCESS_LIFETIME": 300,
+    "REFRESH_LIFETIME": 7 * 24 * 3600,
+    # seconds between two syncs of a process's revocation list
+    "REVOCATION_SYNC": 30,
+}
+
+# User fields carried by access tokens, claim name -> field
+USER_CLAIMS = {
+    "sub": "id",
+    "role": "role",
+    "su": "is_superuser",
+    "staff": "is_staff",
+}
+
+
+def token_setting(name):
+    return getattr(settings, "AUTH_TOKENS", {}).get(name, DEFAULTS[name])
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def encode(claims, kind):
+    # a salt per kind, so a refresh token is never accepted as access token
+    return signing.dumps(claims, salt=f"apps.accounts.tokens.{kind}")
+
+
+def decode(token, kind):
+    """
+    The claims of a valid, unexpired `kind` token. Revocation is checked by
+    the callers.
+    """
+    try:
+        claims = signing.loads(token, salt=f"apps.accounts.tokens.{kind}")
+    except signing.BadSignature:
+        raise InvalidToken("Token is invalid.")
+    if claims.get("exp", 0) <= time.time():
+        raise InvalidToken("Token has expired.")
+    return claims
+
+
+def make_claims(kind, user, lifetime):
+    claims = {
+        "jti": uuid.uuid4().hex,
+        "exp": int(time.time() + lifetime),
+        "sub": str(user.pk),
+    }
+    if kind == ACCESS:
+        claims.update(
+            role=user.role,
+            su=user.is_superuser,
+            staff=user.is_staff,
+            # answers utils.permissions.SupplierPermission object checks
+            sup=Supplier.objects.filter(user=user).values_list("id", flat=True).first(),
+        )
+        if claims["sup"] is not None:
+            claims["sup"] = str(claims["sup"])
+    return claims
+
+
+def issue_tokens(user):
+    return {
+        ACCESS: encode(
+            make_claims(ACCESS, user, token_setting("ACCESS_LIFETIME")), ACCESS
+        ),
+        REFRESH: encode(
+            make_claims(REFRESH, user, token_setting("REFRESH_LIFETIME")), REFRESH
+        ),
+    }
+
+
+def token_user(claims):
+    """
+    A User built from the access token claims without a query. The fields
+    the token does not carry are deferred, reading one loads it.
+    """
+    values = {"is_active": True}
+    for claim, field in USER_CLAIMS.items():
+        values[field] = claims[claim]
+    values["id"] = User._meta.pk.to_python(values["id"])
+    fields = [
+        field.attname
+        for field in User._meta.concrete_fields
+        if field.attname in values
+    ]
+    user = User.from_db(
+        router.db_for_read(User), fields, [values[name] for name in fields]
+    )
+    user.supplier_id = claims.get("sup") and uuid.UUID(claims["sup"])
+    return user
+
+
+class RevocationList:
+    """
+    This process's copy of the revoked, unexpired token ids. It is synced
+    with RevokedToken at most every REVOCATION_SYNC seconds, so checking an
+    access token normally costs no query.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.revoked = {}
+        self.synced_at = None
+        self.checked_at = None
+
+    def add(self, jti, exp):
+        with self.lock:
+            self.revoked[jti] = exp
+
+    def sync(self):
+        now = time.monotonic()
+        if self.checked_at is not None and (
+            now - self.checked_at < token_setting("REVOCATION_SYNC")
+        ):
+            return
+        with self.lock:
+            if self.checked_at is not None and (
+                now - self.checked_at < token_setting("REVOCATION_SYNC")
+            ):
+                return
+            started = timezone.now()
+            rows = RevokedToken.objects.filter(expires_at__gt=started)
+            if self.synced_at is not None:
+                # overlap, a revocation may commit after a later one
+                rows = rows.filter(
+                    revoked_at__gte=self.synced_at - timedelta(seconds=60)
+                )
+            for jti, expires_at in rows.values_list("jti", "expires_at"):
+                self.revoked[jti] = expires_at.timestamp()
+            cutoff = time.time()
+            self.revoked = {
+                jti: exp for jti, exp in self.revoked.items() if exp > cutoff
+            }
+            self.synced_at = started
+            self.checked_at = now
+
+    def __contains__(self, jti):
+        self.sync()
+        return jti in self.revoked
+
+
+revocations = RevocationList()
+
+
+def revoke(claims):
+    """
+    Revokes the token of `claims`, returns False if it already was.
+    """
+    expires_at = datetime.fromtimestamp(claims["exp"], tz=dt_timezone.utc)
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=claims["jti"], expires_at=expires_at)
+    except IntegrityError:
+        return False
+    revocations.add(claims["jti"], claims["exp"])
+    RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+    return True
+
+
+def authenticate(token):
+    """
+    (user, claims) of a valid access token, without a query.
+    """
+    claims = decode(token, ACCESS)
+    if claims["jti"] in revocations:
+        raise InvalidToken("Token has been revoked.")
+    return token_user(claims), claims
+
+
+def refresh(token):
+    """
+    A new token pair for a refresh token, which is used up by it. The user
+    is read again, so role changes and deactivation apply from here on.
+    """
+    claims = decode(token, REFRESH)
+    if not revoke(claims):
+        raise InvalidToken("Token has been revoked.")
+    user = User.objects.filter(pk=claims["sub"], is_active=True).first()
+    if user is None:
+        raise InvalidToken("User not found.")
+    return issue_tokens(user)
@@ -1,5 +1,8 @@
-import random
+import secrets
+
+from apps.accounts.constant import OTP_LENGTH
+
 
 def generate_otp():
-    otp = random.randint(000000, 999999)
-    return otp
\ No newline at end of file
+    otp = secrets.randbelow(10**OTP_LENGTH)
+    return f"{otp:0{OTP_LENGTH}d}"
@@ -1,4 +1,4 @@
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ViewSet
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -6,6 +6,7 @@ from rest_framework import status
 from rest_framework import filters
 from rest_framework.exceptions import ValidationError
 from utils.emails import send_otp_email
+from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
 from apps.accounts.models import (
     User,
@@ -13,7 +14,6 @@ from apps.accounts.models import (
     Supplier,
     Biller,
     Warehouse,
-    OTP,
 )
 from apps.accounts.serializers import (
     UserSerializer,
@@ -27,22 +27,64 @@ from apps.accounts.serializers import (
     ChangePasswordSerializer,
     ForgotPasswordSerializer,
     EmailSerializer,
+    LoginSerializer,
+    RefreshTokenSerializer,
 )
-from apps.accounts.utils import generate_otp
+from apps.accounts import otp, tokens
+from apps.accounts.onboarding import Onboarder
 
-from utils.paginations import MyPagination
+from utils.paginations import KeysetPagination, UserKeysetPagination
+from utils.async_views import AsyncReadMixin
+from utils.conditional import ConditionalGetMixin
 from utils.permissions import SupplierPermission
+from utils.numbering import BILLER_CODE, SUPPLIER_CODE
+from utils.query_plans import QueryPlanMixin
+from utils.imports import ImportFileSerializer
 
 
-class CommonModelViewset(ModelViewSet):
-    pagination_class = MyPagination
+class CommonModelViewset(QueryPlanMixin, ModelViewSet):
+    pagination_class = KeysetPagination
+
+
+class OnboardingMixin:
+    # key of apps.accounts.onboarding.ONBOARDING_KINDS
+    onboarding_kind = None
+
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="import",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk_import(self, request):
+        '''
+            for onboarding many users with their profile at once, from a json
+            array of create payloads or a csv or jsonl file, returns the
+            number of created rows and the errors of every bad row
+        '''
+        if "file" in request.FILES:
+            upload = ImportFileSerializer(data=request.data)
+            upload.is_valid(raise_exception=True)
+            rows = upload.rows()
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            return Response(
+                {"file": "A json array, csv or jsonl file is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        report = Onboarder(self.onboarding_kind).run(rows)
+        return Response(report, status=status.HTTP_201_CREATED)
 
 
 class UserViewSet(CommonModelViewset):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserKeysetPagination
+    # ?phone= in any spelling is one probe of the unique E.164 index
+    filterset_fields = ["phone"]
     search_fields = ["full_name", "phone"]
-    ordering_fields = ["full_name"]
     permission_classes_by_action = {
         "list": [AllowAny],
         "retrieve": [IsAuthenticated],
@@ -101,22 +143,12 @@ class UserViewSet(CommonModelViewset):
 
         # getting the user after validating email
         user = get_object_or_404(User, email=email)
-        otp_for_user = generate_otp()
 
-        # create user and add otp for the user else update the otp for user
-        try:
-            user_otp = OTP.objects.get(user=user)
-            user_otp.otp = otp_for_user
-            user_otp.save()
-        except OTP.DoesNotExist:
-            user_otp = OTP.objects.create(user=user, otp=otp_for_user)
-        send_otp_email(user.email, otp_for_user)
+        # the worker replaces any earlier code, only its hash is stored
+        send_otp_email(user)
 
         return Response(
-            {
-                "success": "Email has been sent successfully",
-                "data": {"otp": otp_for_user},
-            },
+            {"success": "Email has been sent successfully"},
             status=status.HTTP_201_CREATED,
         )
 
@@ -131,21 +163,18 @@ class UserViewSet(CommonModelViewset):
             for changing the user password after getting the otp
         '''
         
-        # getting the otp and its user
-        pk = request.data.get("otp")
-        user_otp = OTP.objects.filter(otp=pk).first()
-        if user_otp is None:
+        # validating email, otp, password and getting the new password
+        forgot_password_serializer = ForgotPasswordSerializer(data=request.data)
+        forgot_password_serializer.is_valid(raise_exception=True)
+        data = forgot_password_serializer.validated_data
+        password = data["password"]
+
+        # the code is used up on success, failures count against it
+        user = otp.verify(data["email"], data["otp"])
+        if user is None:
             raise ValidationError(
                 {"otp": "Sorry, the OTP you have entered is incorrect"}
             )
-        user = user_otp.user
-
-        # validating otp, password and getting the new password from the user
-        forgot_password_serializer = ForgotPasswordSerializer(
-            data=request.data, context={"OTP": user_otp}
-        )
-        forgot_password_serializer.is_valid(raise_exception=True)
-        password = forgot_password_serializer.validated_data["password"]
 
         # updating the user password
         user.set_password(password)
@@ -157,9 +186,76 @@ class UserViewSet(CommonModelViewset):
         )
 
 
-class CustomerViewSet(CommonModelViewset):
+class TokenViewSet(ViewSet):
+    permission_classes_by_action = {
+        "create": [AllowAny],
+        "refresh": [AllowAny],
+        "logout": [IsAuthenticated],
+    }
+
+    def get_permissions(self):
+        try:
+            return [
+                permission()
+                for permission in self.permission_classes_by_action[self.action]
+            ]
+        except:
+            return [permission() for permission in self.permission_classes]
+
+    def create(self, request):
+        '''
+            for logging in with email and password, returns a short lived
+            access token and a refresh token
+        '''
+        serializer = LoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = authenticate(
+            request,
+            email=serializer.validated_data["email"],
+            password=serializer.validated_data["password"],
+        )
+        if user is None:
+            raise ValidationError({"error": "Invalid email or password"})
+        return Response(tokens.issue_tokens(user), status=status.HTTP_201_CREATED)
+
+    @action(methods=["POST"], detail=False, url_path="refresh")
+    def refresh(self, request):
+        '''
+            for exchanging a refresh token for a new token pair, the refresh
+            token can only be used once
+        '''
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            pair = tokens.refresh(serializer.validated_data["refresh"])
+        except tokens.InvalidToken as exc:
+            raise ValidationError({"refresh": str(exc)})
+        return Response(pair, status=status.HTTP_201_CREATED)
+
+    @action(methods=["POST"], detail=False, url_path="logout")
+    def logout(self, request):
+        '''
+            for revoking the access token of the request and, when given, the
+            refresh token
+        '''
+        if isinstance(request.auth, dict):
+            tokens.revoke(request.auth)
+        refresh = request.data.get("refresh")
+        if refresh:
+            try:
+                tokens.revoke(tokens.decode(refresh, tokens.REFRESH))
+            except tokens.InvalidToken:
+                pass
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CustomerViewSet(AsyncReadMixin, OnboardingMixin, CommonModelViewset):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    # the user is joined in
+    query_budget_by_action = {"list": 1, "retrieve": 1}
+    onboarding_kind = "customer"
+    filterset_fields = ["user__phone"]
     permission_classes_by_action = {
         "list": [AllowAny],
         "retrieve": [IsAuthenticated],
@@ -196,9 +292,11 @@ class CustomerViewSet(CommonModelViewset):
             return [permission() for permission in self.permission_classes]
 
 
-class SupplierViewSet(CommonModelViewset):
+class SupplierViewSet(OnboardingMixin, CommonModelViewset):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
+    query_budget_by_action = {"list": 1, "retrieve": 1}
+    onboarding_kind = "supplier"
 
     permission_classes_by_action = {
         "list": [AllowAny],
@@ -221,9 +319,7 @@ class SupplierViewSet(CommonModelViewset):
         # validate supplier data and then only save the user and the supplier
         supplier_serializer.is_valid(raise_exception=True)
         user = user_serializer.save()
-        supplier_serializer.save(
-            user=user, supplier_code=f"SC-{Supplier.objects.count()}"
-        )
+        supplier_serializer.save(user=user, supplier_code=SUPPLIER_CODE.next())
         return Response(
             {"data": supplier_serializer.data}, status=status.HTTP_201_CREATED
         )
@@ -238,9 +334,11 @@ class SupplierViewSet(CommonModelViewset):
             return [permission() for permission in self.permission_classes]
 
 
-class BillerViewSet(CommonModelViewset):
+class BillerViewSet(OnboardingMixin, CommonModelViewset):
     queryset = Biller.objects.all()
     serializer_class = BillerSerializer
+    query_budget_by_action = {"list": 1, "retrieve": 1}
+    onboarding_kind = "biller"
 
     permission_classes_by_action = {
         "list": [AllowAny],
@@ -263,7 +361,7 @@ class BillerViewSet(CommonModelViewset):
         # validate supplier data and then only save the user and the supplier
         biller_serializer.is_valid(raise_exception=True)
         user = user_serializer.save()
-        biller_serializer.save(user=user, supplier_code=f"SC-{Biller.objects.count()}")
+        biller_serializer.save(user=user, biller_code=BILLER_CODE.next())
         return Response(
             {"data": biller_serializer.data}, status=status.HTTP_201_CREATED
         )
@@ -278,10 +376,12 @@ class BillerViewSet(CommonModelViewset):
             return [permission() for permission in self.permission_classes]
 
 
-class WarehouseViewSet(CommonModelViewset):
+class WarehouseViewSet(ConditionalGetMixin, AsyncReadMixin, CommonModelViewset):
     queryset = Warehouse.objects.all()
     serializer_class = WarehouseSerializer
+    # the validators, then the page or the row
+    query_budget_by_action = {"list": 2, "retrieve": 2}
 
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # no OrderingFilter, the keyset pagination fixes the order
+    filter_backends = [filters.SearchFilter]
     search_fields = ["name"]
-    ordering_fields = ["name", "email"]
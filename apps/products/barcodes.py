@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.products.models import Barcode
+from apps.tasks.queue import enqueue
+from utils.lazy import lazy_import
+
+
+# python-barcode's image writer pulls in Pillow, only barcode requests need it
+barcode = lazy_import("barcode")
+barcode_writer = lazy_import("barcode.writer")
+
+
+BARCODE_DIRECTORY = "barcode-image/"
+BARCODE_SYMBOLOGY = "code128"
+
+# batch requests up to this many products render inside the request, larger
+# ones are queued for the worker in chunks of BATCH_CHUNK_SIZE
+BATCH_INLINE_LIMIT = 100
+BATCH_CHUNK_SIZE = 500
+
+# label height follows the paper the barcode is printed on
+PAPER_SIZE_WRITER_OPTIONS = {
+    "50": {"module_height": 15.0, "font_size": 10},
+    "40": {"module_height": 12.0, "font_size": 8},
+    "30": {"module_height": 9.0, "font_size": 6},
+}
+
+
+def writer_options(papersize):
+    return PAPER_SIZE_WRITER_OPTIONS.get(str(papersize), {})
+
+
+def barcode_cache_key(code, papersize, symbology=BARCODE_SYMBOLOGY, options=None):
+    if options is None:
+        options = writer_options(papersize)
+    payload = json.dumps(
+        [str(code), symbology, str(papersize), options], sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def barcode_path(key):
+    return os.path.join(BARCODE_DIRECTORY, f"{key}.png")
+
+
+def _render(job):
+    code, papersize, symbology, options = job
+    path = barcode_path(barcode_cache_key(code, papersize, symbology, options))
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(BARCODE_DIRECTORY, exist_ok=True)
+    barcode_class = barcode.get_barcode_class(symbology)
+    # render next to the target and rename, so concurrent renders of the
+    # same key never expose a half written file
+    fd, temp_path = tempfile.mkstemp(dir=BARCODE_DIRECTORY, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            writer = barcode_writer.ImageWriter()
+            barcode_class(str(code), writer=writer).write(fp, options)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return path
+
+
+def render_barcode(code, papersize, symbology=BARCODE_SYMBOLOGY):
+    """
+    Returns the path of the rendered barcode, rendering it only if the same
+    code, symbology, paper size and writer options were never rendered before.
+    """
+    return _render((str(code), str(papersize), symbology, writer_options(papersize)))
+
+
+def render_barcodes(codes, papersize, symbology=BARCODE_SYMBOLOGY, processes=None):
+    """
+    Renders many barcodes in a process pool and returns {code: path}. Codes
+    that are already cached are resolved without starting a worker.
+    """
+    options = writer_options(papersize)
+    paths, missing = {}, []
+    for code in {str(code) for code in codes}:
+        path = barcode_path(barcode_cache_key(code, papersize, symbology, options))
+        if os.path.exists(path):
+            paths[code] = path
+        else:
+            missing.append(code)
+
+    if missing:
+        jobs = [(code, str(papersize), symbology, options) for code in missing]
+        if processes == 1 or len(jobs) == 1:
+            rendered = map(_render, jobs)
+        else:
+            executor = ProcessPoolExecutor(max_workers=processes)
+            chunksize = max(1, len(jobs) // ((processes or os.cpu_count() or 1) * 4))
+            with executor:
+                rendered = list(executor.map(_render, jobs, chunksize=chunksize))
+        paths.update(zip(missing, rendered))
+    return paths
+
+
+def generate_barcodes(products, papersize, processes=None):
+    """
+    Renders and stores the barcode of every product, creating or updating
+    their `Barcode` rows in bulk. Returns the saved `Barcode` objects.
+    """
+    products = list(products)
+    paths = render_barcodes(
+        [product.product_code for product in products], papersize, processes=processes
+    )
+    existing = {
+        row.information_id: row
+        for row in Barcode.objects.filter(information__in=products)
+    }
+
+    now = timezone.now()
+    to_create, to_update = [], []
+    for product in products:
+        row = existing.get(product.pk)
+        if row is None:
+            row = Barcode(information=product)
+            to_create.append(row)
+        else:
+            row.modified_on = now
+            to_update.append(row)
+        row.papersize = str(papersize)
+        row.barcode_image = paths[str(product.product_code)]
+
+    Barcode.objects.bulk_create(to_create, batch_size=1000)
+    Barcode.objects.bulk_update(
+        to_update, ["papersize", "barcode_image", "modified_on"], batch_size=1000
+    )
+    return to_create + to_update
+
+
+def queue_barcodes(product_ids, papersize):
+    """
+    Queues `barcodes.generate` tasks labelling `product_ids` in chunks, see
+    apps.products.tasks. Returns the queued tasks.
+    """
+    product_ids = [str(product_id) for product_id in product_ids]
+    with transaction.atomic():
+        return [
+            enqueue(
+                "barcodes.generate",
+                {
+                    "products": product_ids[start : start + BATCH_CHUNK_SIZE],
+                    "papersize": str(papersize),
+                },
+            )
+            for start in range(0, len(product_ids), BATCH_CHUNK_SIZE)
+        ]
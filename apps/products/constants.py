@@ -42,4 +42,22 @@ ORDER_TAX = [
 TYPE = [
     ('Addition', 'Addition'),
     ('Subtraction', 'Subtraction')
-]
\ No newline at end of file
+]
+
+VALUATION_METHOD = [
+    ('FIFO', 'FIFO'),
+    ('Average', 'Weighted average'),
+]
+
+ROLLUP_DIMENSION = [
+    ('warehouse', 'Warehouse'),
+    ('brand', 'Brand'),
+    ('category', 'Category'),
+    ('biller', 'Biller'),
+    ('customer_group', 'Customer group'),
+]
+
+REPORT_INTERVAL = [
+    ('day', 'Day'),
+    ('month', 'Month'),
+]
@@ -0,0 +1,188 @@
+from django.db import transaction
+from rest_framework import serializers
+
+from apps.products.constants import PRODUCT_TYPE_CHOICES, PRODUCT_TAX, TAX_METHOD
+from apps.products.low_stock import stock_links
+from apps.products.models import Brand, Category, Product, Unit
+from apps.products.search import update_search_vectors
+from apps.store.models import Warehouse
+from utils.numbering import PRODUCT_CODE
+
+
+WAREHOUSE_SEPARATOR = "|"
+
+
+class ProductImportSerializer(serializers.Serializer):
+    """
+    Validates one import row. Brand, category, unit and warehouses come in by
+    name and are resolved against the lookup maps passed in the context.
+    """
+
+    product_name = serializers.CharField(max_length=100)
+    product_type = serializers.ChoiceField(choices=PRODUCT_TYPE_CHOICES)
+    category = serializers.CharField()
+    product_code = serializers.IntegerField(required=False)
+    brand = serializers.CharField()
+    barcode = serializers.CharField(max_length=16)
+    product_unit = serializers.CharField()
+    product_price = serializers.FloatField()
+    expense = serializers.FloatField()
+    unit_price = serializers.FloatField()
+    product_tax = serializers.ChoiceField(choices=PRODUCT_TAX)
+    tax_method = serializers.ChoiceField(choices=TAX_METHOD)
+    discount = serializers.FloatField(default=0)
+    stock_alert = serializers.IntegerField()
+    featured = serializers.BooleanField(default=False)
+    price_difference_in_warehouse = serializers.BooleanField(default=True)
+    has_expiry_date = serializers.BooleanField(default=True)
+    add_promotional_sale = serializers.BooleanField(default=True)
+    has_multi_variant = serializers.BooleanField(default=True)
+    has_imie_code = serializers.BooleanField(default=True)
+    warehouse = serializers.JSONField(required=False)
+
+    def to_internal_value(self, data):
+        # an empty csv cell means the column was left out: optional columns
+        # take their default and a blank product_code is allocated
+        data = {key: value for key, value in data.items() if value != ""}
+        return super().to_internal_value(data)
+
+    def resolve(self, lookup, value, field):
+        try:
+            return self.context[lookup][str(value).strip().lower()]
+        except KeyError:
+            raise serializers.ValidationError({field: f"Unknown {field} {value!r}"})
+
+    def validate(self, data):
+        data["category_id"] = self.resolve("categories", data.pop("category"), "category")
+        data["brand_id"] = self.resolve("brands", data.pop("brand"), "brand")
+        data["product_unit_id"] = self.resolve(
+            "units", data.pop("product_unit"), "product_unit"
+        )
+
+        warehouses = data.pop("warehouse", None) or []
+        if isinstance(warehouses, str):
+            warehouses = warehouses.split(WAREHOUSE_SEPARATOR)
+        data["warehouse_ids"] = [
+            self.resolve("warehouses", name, "warehouse")
+            for name in warehouses
+            if str(name).strip()
+        ]
+        return data
+
+
+def lookup_maps():
+    """
+    Name -> id maps for every reference table, loaded once per import.
+    Categories are matched on their main category, units on either name.
+    """
+    units = {}
+    for pk, unit_name, short_name in Unit.objects.values_list(
+        "id", "unit_name", "short_name"
+    ):
+        units[short_name.lower()] = pk
+        units[unit_name.lower()] = pk
+    return {
+        "brands": {
+            name.lower(): pk for pk, name in Brand.objects.values_list("id", "brand_name")
+        },
+        "categories": {
+            name.lower(): pk
+            for pk, name in Category.objects.values_list("id", "main_category")
+        },
+        "units": units,
+        "warehouses": {
+            name.lower(): pk for pk, name in Warehouse.objects.values_list("id", "name")
+        },
+    }
+
+
+class ProductImporter:
+    """
+    Streams rows into `Product` in chunks: every chunk is validated, then
+    written with one bulk_create for the products and one for their warehouse
+    links, inside one transaction. Invalid rows are reported, not written.
+    """
+
+    def __init__(self, user=None, chunk_size=1000):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.validator = ProductImportSerializer(context=lookup_maps())
+        self.created = 0
+        self.errors = []
+
+    def run(self, rows):
+        chunk = []
+        for number, row in enumerate(rows, start=1):
+            chunk.append((number, row))
+            if len(chunk) == self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {"created": self.created, "errors": self.errors}
+
+    def import_chunk(self, chunk):
+        rows, errors = [], []
+        for number, row in chunk:
+            try:
+                rows.append((number, self.validator.run_validation(row)))
+            except serializers.ValidationError as exc:
+                errors.append({"row": number, "errors": exc.detail})
+
+        # codes given by hand must be free, in the table and in the file
+        codes = [data["product_code"] for _, data in rows if "product_code" in data]
+        taken = set(
+            Product.objects.filter(product_code__in=codes).values_list(
+                "product_code", flat=True
+            )
+            if codes
+            else ()
+        )
+        products, links = [], []
+        for number, data in rows:
+            code = data.get("product_code")
+            if code is not None:
+                if code in taken:
+                    errors.append(
+                        {
+                            "row": number,
+                            "errors": {"product_code": [f"Code {code} is already taken."]},
+                        }
+                    )
+                    continue
+                taken.add(code)
+            warehouse_ids = data.pop("warehouse_ids")
+            product = Product(
+                user=self.user, created_by=self.user, modified_by=self.user, **data
+            )
+            products.append(product)
+            links.extend((product, warehouse_id) for warehouse_id in warehouse_ids)
+        self.errors.extend(sorted(errors, key=lambda error: error["row"]))
+
+        if not products:
+            return
+        given = [p.product_code for p in products if p.product_code is not None]
+        if given:
+            PRODUCT_CODE.advance(max(given))
+        # one round trip for every row without a code
+        missing = [product for product in products if product.product_code is None]
+        if missing:
+            codes = PRODUCT_CODE.allocate_many(len(missing))
+            for product, code in zip(missing, codes):
+                product.product_code = code
+        through = Product.warehouse.through
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            through.objects.bulk_create(
+                [
+                    through(product_id=product.pk, warehouse_id=warehouse_id)
+                    for product, warehouse_id in links
+                ]
+            )
+            # bulk_create sends no m2m_changed
+            stock_links(links)
+            update_search_vectors(product_ids=[product.pk for product in products])
+        self.created += len(products)
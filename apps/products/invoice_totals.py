@@ -0,0 +1,224 @@
+from django.db import connection
+from django.db.models import BigIntegerField, DecimalField, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+from apps.products.models import (
+    PurchaseInvoice,
+    PurchaseItem,
+    SalesInvoice,
+    SalesItem,
+)
+from utils.lazy import lazy_import
+from utils.transactions import queue_on_commit
+
+
+# imported by the signal handlers at boot, numpy only once totals are computed
+np = lazy_import("numpy")
+
+
+TOTAL_FIELDS = (
+    "subtotal",
+    "discount_total",
+    "tax_total",
+    "shipping_total",
+    "grand_total",
+)
+
+
+class InvoiceKind:
+    """
+    Where an invoice type finds its order, the order's discount / tax /
+    shipping columns and its line items.
+    """
+
+    def __init__(
+        self, invoice_model, order_field, discount_field, tax_field, item_model, item_field
+    ):
+        self.invoice_model = invoice_model
+        self.order_field = order_field
+        self.discount_field = discount_field
+        self.tax_field = tax_field
+        self.item_model = item_model
+        self.item_field = item_field
+
+    def refresh(self, order_ids):
+        return refresh_orders(self, order_ids)
+
+
+PURCHASE = InvoiceKind(
+    PurchaseInvoice, "purchases", "order_discount", "order_tax", PurchaseItem, "purchase"
+)
+SALES = InvoiceKind(SalesInvoice, "sales", "discount", "sales_tax", SalesItem, "sales")
+KINDS = {"purchase": PURCHASE, "sales": SALES}
+
+
+# tax is computed in millionths, cents x hundredths of a percent, this
+# many to a cent
+TAX_UNIT = 10**4
+
+
+def as_hundredths(field):
+    """
+    `field` as a whole number of hundredths, cents of money or hundredths
+    of a percent of a tax rate, so totals add up exactly. NULL is 0.
+    """
+    hundredths = Round(Cast(field, DecimalField(max_digits=24, decimal_places=6)) * 100)
+    return Coalesce(Cast(hundredths, BigIntegerField()), Value(0))
+
+
+def sum_by(line_invoice, values, count):
+    totals = np.zeros(count, dtype=np.int64)
+    np.add.at(totals, line_invoice, values)
+    return totals
+
+
+def compute_totals(
+    line_invoice,
+    quantity,
+    unit_price,
+    line_discount,
+    line_tax_rate,
+    order_discount,
+    order_tax_rate,
+    shipping,
+):
+    """
+    Totals in cents for many invoices at once, from int64 arrays of cents,
+    hundredths of a percent for the rates. Line arrays are parallel, with
+    `line_invoice` giving each line's invoice position; order arrays hold
+    one value per invoice. Line tax is charged on each line after its own
+    discount, order tax on the subtotal after every discount, and only
+    the tax is rounded, half up to the cent, as Decimal would.
+    """
+    count = len(order_discount)
+    gross = quantity * unit_price
+    net = gross - line_discount
+
+    subtotal = sum_by(line_invoice, gross, count)
+    discount = sum_by(line_invoice, line_discount, count) + order_discount
+    taxable = np.maximum(subtotal - discount, 0)
+    tax = sum_by(line_invoice, net * line_tax_rate, count) + taxable * order_tax_rate
+    # exact, so half up is adding half a cent and flooring
+    tax = np.sign(tax) * ((np.abs(tax) + TAX_UNIT // 2) // TAX_UNIT)
+    return {
+        "subtotal": subtotal,
+        "discount_total": discount,
+        "tax_total": tax,
+        "shipping_total": shipping,
+        "grand_total": taxable + tax + shipping,
+    }
+
+
+def _load_chunk(kind, invoices):
+    """
+    Reads a chunk of invoices and all their lines with two queries and
+    returns the invoice ids and the arrays compute_totals() expects.
+    """
+    order = kind.order_field
+    rows = list(
+        invoices.values_list(
+            "id",
+            f"{order}_id",
+            as_hundredths(f"{order}__{kind.discount_field}"),
+            as_hundredths(f"{order}__{kind.tax_field}"),
+            as_hundredths(f"{order}__shipping"),
+        )
+    )
+    if not rows:
+        return [], None
+
+    position = {order_id: index for index, (_, order_id, *_) in enumerate(rows) if order_id}
+    lines = list(
+        kind.item_model.objects.filter(**{f"{kind.item_field}_id__in": list(position)})
+        .values_list(
+            f"{kind.item_field}_id",
+            "quantity",
+            as_hundredths("unit_price"),
+            as_hundredths("discount"),
+            as_hundredths("tax_rate"),
+        )
+        .order_by()
+    )
+
+    orders = np.array([row[2:] for row in rows], dtype=np.int64).reshape(-1, 3)
+    values = np.array([line[1:] for line in lines], dtype=np.int64).reshape(-1, 4)
+    line_invoice = np.fromiter(
+        (position[line[0]] for line in lines), dtype=np.intp, count=len(lines)
+    )
+    arrays = (
+        line_invoice,
+        values[:, 0],
+        values[:, 1],
+        values[:, 2],
+        values[:, 3],
+        orders[:, 0],
+        orders[:, 1],
+        orders[:, 2],
+    )
+    return [row[0] for row in rows], arrays
+
+
+def _write_chunk(kind, invoice_ids, totals):
+    """
+    Stores a chunk of totals in cents with a single UPDATE ... FROM
+    unnest(...).
+    """
+    table = connection.ops.quote_name(kind.invoice_model._meta.db_table)
+    assignments = ", ".join(
+        f"{field} = totals.{field} / 100.0" for field in TOTAL_FIELDS
+    )
+    columns = ", ".join(["%s::uuid[]"] + ["%s::bigint[]"] * len(TOTAL_FIELDS))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS invoice
+            SET {assignments}, totals_stale = false
+            FROM unnest({columns}) AS totals(id, {", ".join(TOTAL_FIELDS)})
+            WHERE invoice.id = totals.id
+            """,
+            [[str(pk) for pk in invoice_ids]]
+            + [totals[field].tolist() for field in TOTAL_FIELDS],
+        )
+
+
+def recompute_totals(kind, invoices=None, chunk_size=10000):
+    """
+    Recomputes and stores the totals of `invoices` (default: every invoice
+    of that kind) chunk by chunk, in invoice id order. Returns the number of
+    invoices written.
+    """
+    if invoices is None:
+        invoices = kind.invoice_model.objects.all()
+    invoices = invoices.order_by("id")
+
+    written, last = 0, None
+    while True:
+        chunk = invoices if last is None else invoices.filter(id__gt=last)
+        invoice_ids, arrays = _load_chunk(kind, chunk[:chunk_size])
+        if not invoice_ids:
+            return written
+        _write_chunk(kind, invoice_ids, compute_totals(*arrays))
+        written += len(invoice_ids)
+        last = invoice_ids[-1]
+
+
+def refresh_orders(kind, order_ids):
+    return recompute_totals(
+        kind,
+        kind.invoice_model.objects.filter(**{f"{kind.order_field}__in": order_ids}),
+    )
+
+
+def invalidate(kind, order_ids):
+    """
+    Marks the invoices of `order_ids` stale now and recomputes them once,
+    when the current transaction commits, however many lines changed.
+    """
+    if not connection.in_atomic_block:
+        kind.refresh(order_ids)
+        return
+    new = queue_on_commit(kind.refresh, order_ids)
+    if new:
+        kind.invoice_model.objects.filter(
+            **{f"{kind.order_field}__in": new}
+        ).update(totals_stale=True)
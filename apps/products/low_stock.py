@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from apps.accounts.models import Supplier
+from apps.products.models import PurchaseItem, Stock
+
+
+def sync_alert_quantity(product):
+    """
+    Copies a changed product.stock_alert onto its stock rows.
+    """
+    Stock.objects.filter(product=product).exclude(
+        alert_quantity=product.stock_alert
+    ).update(alert_quantity=product.stock_alert, modified_on=timezone.now())
+
+
+def stock_links(links):
+    """
+    Creates an empty stock row for every (product, warehouse id) link that
+    has none. A product linked to a warehouse it was never received in is
+    then reported by low_stock() as the out of stock case it is.
+    """
+    Stock.objects.bulk_create(
+        [
+            Stock(
+                product_id=product.pk,
+                warehouse_id=warehouse_id,
+                quantity=0,
+                alert_quantity=product.stock_alert,
+            )
+            for product, warehouse_id in links
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def low_stock(warehouse=None):
+    """
+    Stock rows at or below their alert quantity. The condition matches
+    stock_low_idx, so only the low rows are ever read. Every warehouse a
+    product is linked to has a row, see stock_links().
+    """
+    stocks = Stock.objects.filter(quantity__lte=F("alert_quantity"))
+    if warehouse is not None:
+        stocks = stocks.filter(warehouse=warehouse)
+    return stocks
+
+
+def purchase_history(product_ids, since):
+    """
+    (product id, warehouse id) -> number of lines, quantity purchased and the
+    supplier of the latest purchase since `since`, in one grouped query.
+    """
+    rows = (
+        PurchaseItem.objects.filter(
+            product_id__in=product_ids, purchase__created_on__gte=since
+        )
+        .values("product_id", "purchase__warehouse_id", "purchase__supplier_id")
+        .annotate(
+            lines=Count("id"),
+            purchased=Sum("quantity"),
+            latest=Max("purchase__created_on"),
+        )
+        .order_by()
+    )
+    history = {}
+    for row in rows:
+        key = (row["product_id"], row["purchase__warehouse_id"])
+        entry = history.setdefault(
+            key, {"lines": 0, "purchased": 0, "supplier_id": None, "latest": None}
+        )
+        entry["lines"] += row["lines"]
+        entry["purchased"] += row["purchased"]
+        if entry["latest"] is None or row["latest"] > entry["latest"]:
+            entry["latest"] = row["latest"]
+            entry["supplier_id"] = row["purchase__supplier_id"]
+    return history
+
+
+def reorder_suggestions(warehouse=None, days=90):
+    """
+    Low-stock rows grouped by the supplier that last delivered them to that
+    warehouse within `days` (None when nobody did). Each suggestion refills
+    the row to its alert quantity plus one typical order, the average line
+    quantity of those purchases, or the alert quantity without history.
+    """
+    stocks = list(
+        low_stock(warehouse)
+        .select_related("product", "warehouse")
+        .only(
+            "product_id",
+            "warehouse_id",
+            "quantity",
+            "alert_quantity",
+            "product__product_name",
+            "warehouse__name",
+        )
+        .order_by("warehouse_id", "product_id")
+    )
+    history = purchase_history(
+        {stock.product_id for stock in stocks}, timezone.now() - timedelta(days=days)
+    )
+
+    suggestions = {}
+    for stock in stocks:
+        entry = history.get((stock.product_id, stock.warehouse_id))
+        if entry:
+            typical_order = round(entry["purchased"] / entry["lines"])
+        else:
+            typical_order = stock.alert_quantity
+        suggestions.setdefault(entry and entry["supplier_id"], []).append(
+            {
+                "product": stock.product_id,
+                "product_name": stock.product.product_name,
+                "warehouse": stock.warehouse_id,
+                "warehouse_name": stock.warehouse.name,
+                "quantity": stock.quantity,
+                "alert_quantity": stock.alert_quantity,
+                "suggested_quantity": max(
+                    stock.alert_quantity - stock.quantity + typical_order, 1
+                ),
+            }
+        )
+    return suggestions
+
+
+def supplier_names(supplier_ids):
+    return dict(
+        Supplier.objects.filter(id__in=supplier_ids).values_list("id", "company")
+    )
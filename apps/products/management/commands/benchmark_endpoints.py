@@ -0,0 +1,544 @@
+import itertools
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from rest_framework.test import APIClient
+
+from apps.accounts import otp, tokens
+from apps.accounts.models import Biller, Customer, Supplier, User
+from apps.products import barcodes
+from apps.products.models import (
+    Adjustment,
+    Brand,
+    Category,
+    Product,
+    Purchase,
+    PurchaseItem,
+    Stock,
+    Unit,
+)
+from apps.products.search import update_search_vectors
+from apps.store.models import Warehouse
+from config.urls import router
+from utils.benchmarks import compare, measure, router_endpoints
+from utils.numbering import PRODUCT_CODE
+from utils.reference_cache import ReferenceCache
+
+
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+PASSWORD = "benchmark-pass-123"
+# password hashing is slow by design and its cost is a setting, not code:
+# the suite pins a fast hasher so every endpoint that hashes measures the
+# same on every checkout
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+# the revocation list is synced once per size, before the timing, instead
+# of every few seconds by whichever request is running then
+AUTH_TOKENS = {**getattr(settings, "AUTH_TOKENS", {}), "REVOCATION_SYNC": 10**9}
+# rows in each import file or array
+IMPORT_ROWS = 10
+
+# unique emails, phones and names for rows created by the benchmark
+_serial = itertools.count(1)
+
+
+def seed(size):
+    """
+    `size` suppliers, customers, billers and products plus the reference
+    rows they point to, written with bulk_create. Returns the admin user the
+    requests are made as and the seeded rows detail routes use.
+    """
+    admin = User.objects.create_superuser(
+        email="admin@example.com",
+        password=PASSWORD,
+        full_name="Admin",
+        username="admin",
+        phone="+9779800000000",
+    )
+    password = make_password(PASSWORD)
+    warehouses = Warehouse.objects.bulk_create(
+        Warehouse(
+            name=f"Warehouse {index}",
+            email=f"warehouse{index}@example.com",
+            phone=f"+977984{index:07d}",
+        )
+        for index in range(3)
+    )
+    brands = Brand.objects.bulk_create(
+        Brand(brand_name=f"Brand {index}") for index in range(5)
+    )
+    categories = Category.objects.bulk_create(
+        Category(main_category=f"Main {index}", sub_category=f"Sub {index}")
+        for index in range(5)
+    )
+    units = Unit.objects.bulk_create(
+        Unit(unit_name=f"Unit {index}", short_name=f"u{index}") for index in range(5)
+    )
+    users = User.objects.bulk_create(
+        User(
+            full_name=f"Member {index}",
+            email=f"member{index}@example.com",
+            phone=f"+977981{index:07d}",
+            username=f"member{index}",
+            gender="Male",
+            role=("Supplier", "Customer", "Biller")[index // size],
+            password=password,
+        )
+        for index in range(3 * size)
+    )
+    suppliers = Supplier.objects.bulk_create(
+        Supplier(user=user, supplier_code=index + 1, company=f"Company {index}")
+        for index, user in enumerate(users[:size])
+    )
+    customers = Customer.objects.bulk_create(
+        Customer(
+            user=user,
+            supplier_name=suppliers[index % len(suppliers)],
+            customer_group="General",
+        )
+        for index, user in enumerate(users[size : 2 * size])
+    )
+    billers = Biller.objects.bulk_create(
+        Biller(
+            user=user,
+            NID=f"NID{index}",
+            warehouse=warehouses[index % len(warehouses)],
+            biller_code=f"BC-{index + 1:05d}",
+        )
+        for index, user in enumerate(users[2 * size :])
+    )
+    products = Product.objects.bulk_create(
+        Product(
+            product_name=f"Product {index}",
+            product_type="Food",
+            category=categories[index % len(categories)],
+            product_code=code,
+            brand=brands[index % len(brands)],
+            barcode=str(code),
+            product_unit=units[index % len(units)],
+            product_price=10,
+            expense=1,
+            unit_price=12,
+            product_tax="13",
+            tax_method="Exclusive",
+            discount=0,
+            stock_alert=5,
+            user=admin,
+        )
+        for index, code in enumerate(PRODUCT_CODE.allocate_many(size))
+    )
+    Product.warehouse.through.objects.bulk_create(
+        Product.warehouse.through(product=product, warehouse=warehouse)
+        for product in products
+        for warehouse in warehouses
+    )
+    update_search_vectors([product.pk for product in products])
+    purchases = Purchase.objects.bulk_create(
+        Purchase(
+            warehouse=warehouses[0],
+            supplier=suppliers[index % len(suppliers)],
+            order_tax="13",
+            order_discount=0,
+            shipping=0,
+            sales_status="Complete",
+            purchase_note="",
+        )
+        for index in range(max(1, size // 10))
+    )
+    PurchaseItem.objects.bulk_create(
+        PurchaseItem(purchase=purchase, product=product, unit_price=10)
+        for index, purchase in enumerate(purchases)
+        for product in products[index * 3 : index * 3 + 3]
+    )
+    # enough stock in the first warehouse for every benchmarked sale
+    Stock.objects.bulk_create(
+        Stock(product=product, warehouse=warehouses[0], quantity=10**6)
+        for product in products
+    )
+    adjustment = Adjustment.objects.create(warehouse=warehouses[0])
+    rows = {
+        "users": admin,
+        "customers": customers[0],
+        "suppliers": suppliers[0],
+        "billers": billers[0],
+        "warehouse": warehouses[0],
+        "product": products[0],
+        "brand": brands[0],
+        "category": categories[0],
+        "unit": units[0],
+        "purchase": purchases[0],
+        "adjustment": adjustment,
+    }
+    return admin, rows
+
+
+def new_user():
+    serial = next(_serial)
+    return {
+        "full_name": f"New {serial}",
+        "email": f"new{serial}@example.com",
+        "phone": f"+977982{serial:07d}",
+        "username": f"new{serial}",
+        "gender": "Male",
+        "password": PASSWORD,
+        "password2": PASSWORD,
+    }
+
+
+def bearer(user):
+    """
+    Authorization header of a fresh access token of `user`.
+    """
+    return {"HTTP_AUTHORIZATION": f"Bearer {tokens.issue_tokens(user)[tokens.ACCESS]}"}
+
+
+def payloads(admin, rows):
+    """
+    Request bodies of the writes the suite runs, by "basename:action".
+    """
+
+    def warehouse(index):
+        serial = next(_serial)
+        return {
+            "name": f"New warehouse {serial}",
+            "email": f"new-warehouse{serial}@example.com",
+            "phone": f"+977985{serial:07d}",
+        }
+
+    def lines():
+        products = Product.objects.order_by("product_code")[:3]
+        return [{"product": str(product.pk), "quantity": 1} for product in products]
+
+    def purchase(index):
+        return {
+            "warehouse": str(rows["warehouse"].pk),
+            "supplier": str(rows["suppliers"].pk),
+            "order_tax": "13",
+            "order_discount": 0,
+            "shipping": 0,
+            "sales_status": "Complete",
+            "purchase_note": "Benchmark",
+            "items": lines(),
+        }
+
+    def sale(index):
+        return {
+            "customer": str(rows["customers"].pk),
+            "warehouse": str(rows["warehouse"].pk),
+            "biller": str(rows["billers"].pk),
+            "sales_tax": "13",
+            "discount": 0,
+            "shipping": 0,
+            "sales_status": "Complete",
+            "payment_status": "Complete",
+            "sales_note": "Benchmark",
+            "staff_remark": "Benchmark",
+            "items": lines(),
+        }
+
+    def adjustment(index):
+        # one adjustment per warehouse
+        return {"warehouse": str(Warehouse.objects.create(**warehouse(index)).pk)}
+
+    def product_file(index):
+        # the seeded category, brand, unit and warehouse, by name
+        lines = [
+            "product_name,product_type,category,product_code,brand,barcode,"
+            "product_unit,product_price,expense,unit_price,product_tax,"
+            "tax_method,stock_alert,warehouse"
+        ]
+        for serial in (next(_serial) for _ in range(IMPORT_ROWS)):
+            lines.append(
+                f"Imported {serial},Food,Main 0,{10**6 + serial},Brand 0,"
+                f"imported-{serial},u0,10,1,12,13,Exclusive,5,Warehouse 0"
+            )
+        content = "\n".join(lines).encode()
+        return {"file": SimpleUploadedFile("products.csv", content)}
+
+    def barcode_batch(index):
+        products = Product.objects.order_by("pk").values_list("pk", flat=True)[:5]
+        return {"products": [str(pk) for pk in products], "papersize": "50"}
+
+    def onboard(create):
+        return lambda index: [create(index) for _ in range(IMPORT_ROWS)]
+
+    def customer(index):
+        return {
+            "user": new_user(),
+            "supplier_name": str(rows["suppliers"].pk),
+            "customer_group": "General",
+        }
+
+    def supplier(index):
+        return {"user": new_user(), "company": f"New company {next(_serial)}"}
+
+    def biller(index):
+        return {
+            "user": new_user(),
+            "NID": f"NID-{next(_serial)}",
+            "warehouse": str(rows["warehouse"].pk),
+        }
+
+    def product(index):
+        serial = next(_serial)
+        return {
+            "product_name": f"New product {serial}",
+            "product_type": "Food",
+            "category": str(rows["category"].pk),
+            "brand": str(rows["brand"].pk),
+            "barcode": f"new-{serial}",
+            "product_unit": str(rows["unit"].pk),
+            "product_price": 10,
+            "expense": 1,
+            "unit_price": 12,
+            "product_tax": "13",
+            "tax_method": "Exclusive",
+            "discount": 0,
+            "warehouse": [str(rows["warehouse"].pk)],
+            "stock_alert": 5,
+        }
+
+    def change_password(index):
+        return {
+            "email": admin.email,
+            "otp": otp.issue(admin),
+            "password": PASSWORD,
+            "password1": PASSWORD,
+        }
+
+    return {
+        # query strings of reads that require one
+        "stockvaluation:cogs": lambda index: {
+            "start": "2000-01-01T00:00:00Z",
+            "end": "2100-01-01T00:00:00Z",
+        },
+        "sales-report:list": lambda index: {
+            "dimension": "warehouse",
+            "start": "2000-01-01",
+            "end": "2100-01-01",
+        },
+        "users:create": lambda index: new_user(),
+        "users:forgot-password": lambda index: {"email": admin.email},
+        "users:reset-password": lambda index: {
+            "old_password": PASSWORD,
+            "password": PASSWORD,
+            "password1": PASSWORD,
+        },
+        "users:change-password": change_password,
+        "customers:create": customer,
+        "customers:import": onboard(customer),
+        "suppliers:create": supplier,
+        "suppliers:import": onboard(supplier),
+        "billers:create": biller,
+        "billers:import": onboard(biller),
+        "warehouse:create": warehouse,
+        "token:create": lambda index: {"email": admin.email, "password": PASSWORD},
+        "token:refresh": lambda index: {
+            "refresh": tokens.issue_tokens(admin)[tokens.REFRESH]
+        },
+        "token:logout": lambda index: {},
+        "brand:create": lambda index: {"brand_name": f"New brand {next(_serial)}"},
+        "category:create": lambda index: {
+            "main_category": f"New main {next(_serial)}",
+            "sub_category": f"New sub {next(_serial)}",
+        },
+        "unit:create": lambda index: {
+            "unit_name": f"New unit {next(_serial)}",
+            "short_name": f"n{next(_serial)}",
+        },
+        "product:create": product,
+        "product:import": product_file,
+        "barcode:batch": barcode_batch,
+        "purchase:create": purchase,
+        "sales:create": sale,
+        "adjustment:create": adjustment,
+        "adjustmentitems:create": lambda index: {
+            "adjustment": str(rows["adjustment"].pk),
+            "product": str(rows["product"].pk),
+            "quantity": 1,
+            "type": "Addition",
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every router endpoint in-process against freshly seeded data "
+        "of each --sizes, on a throwaway test database. Reports p50/p95/p99 "
+        "latency, queries per request and memory allocated per request, and "
+        "fails when a result regresses against the --baseline file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100])
+        parser.add_argument(
+            "--requests", type=int, default=20, help="Timed requests per endpoint."
+        )
+        parser.add_argument(
+            "--only", nargs="+", help="Only endpoints whose name contains one of these."
+        )
+        parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Write the results to --baseline instead of comparing.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.5,
+            help="Allowed p50 latency and memory increase, as a fraction.",
+        )
+        parser.add_argument(
+            "--slack",
+            type=float,
+            default=10,
+            help="Allowed p50 latency increase in ms, on top of --tolerance.",
+        )
+        parser.add_argument(
+            "--query-tolerance",
+            type=int,
+            default=0,
+            help="Allowed extra queries per request.",
+        )
+        parser.add_argument("--output", help="Also write the results to this file.")
+        parser.add_argument(
+            "--keepdb", action="store_true", help="Reuse the test database."
+        )
+
+    def handle(self, *args, **options):
+        # allows the test client's host and keeps forgot-password from mailing
+        setup_test_environment()
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=options["keepdb"]
+        )
+        # labels rendered by barcode:batch go to a scratch directory
+        labels = tempfile.TemporaryDirectory()
+        barcode_directory = barcodes.BARCODE_DIRECTORY
+        barcodes.BARCODE_DIRECTORY = labels.name
+        try:
+            results = {}
+            with override_settings(
+                PASSWORD_HASHERS=PASSWORD_HASHERS, AUTH_TOKENS=AUTH_TOKENS
+            ):
+                for size in options["sizes"]:
+                    results.update(
+                        self.run_size(size, options["requests"], options["only"])
+                    )
+        finally:
+            barcodes.BARCODE_DIRECTORY = barcode_directory
+            labels.cleanup()
+            teardown_databases(old_config, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        if options["output"]:
+            self.write(options["output"], results)
+        path = os.path.join(settings.BASE_DIR, options["baseline"])
+        if options["update_baseline"]:
+            self.write(path, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {path}."))
+            return
+        if not os.path.exists(path):
+            self.stdout.write(f"No baseline at {path}, nothing to compare.")
+            return
+        with open(path) as fileobj:
+            baseline = json.load(fileobj)
+        # only what this run was asked to measure
+        baseline = {
+            key: value
+            for key, value in baseline.items()
+            if self.selected(key, options["sizes"], options["only"])
+        }
+        regressions = compare(
+            results,
+            baseline,
+            options["tolerance"],
+            options["query_tolerance"],
+            options["slack"],
+        )
+        if regressions:
+            raise CommandError(
+                "Regressions against the baseline:\n" + "\n".join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def selected(self, key, sizes, only):
+        name, _, size = key.rpartition("@")
+        if int(size) not in sizes:
+            return False
+        return not only or any(part in name for part in only)
+
+    def write(self, path, results):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as fileobj:
+            json.dump(results, fileobj, indent=2, sort_keys=True)
+            fileobj.write("\n")
+
+    def run_size(self, size, requests, only=None):
+        """
+        {"<endpoint>@<size>": measurement} for every endpoint, on a database
+        holding nothing but the seed of `size`.
+        """
+        call_command("flush", interactive=False, verbosity=0)
+        for cache in caches.all():
+            cache.clear()
+        ReferenceCache.local_cache().clear()
+        admin, rows = seed(size)
+        tokens.revocations.checked_at = None
+        tokens.revocations.sync()
+
+        client = APIClient()
+        # endpoints only the owner of the row may call, the rest run as admin
+        owners = {"purchase:retrieve": rows["purchase"].supplier.user}
+        # logout revokes the token it is called with, each request needs its own
+        headers = {"token:logout": lambda index: bearer(admin)}
+        pks = {basename: row.pk for basename, row in rows.items()}
+        endpoints, skipped = router_endpoints(
+            router.registry, payloads(admin, rows), pks, headers=headers
+        )
+        if only:
+            endpoints = [
+                endpoint
+                for endpoint in endpoints
+                if any(part in endpoint.name for part in only)
+            ]
+
+        self.stdout.write(
+            f"size {size}, {requests} requests per endpoint, "
+            f"skipped (no payload or row): {', '.join(skipped) or '-'}"
+        )
+        self.stdout.write(
+            f"{'endpoint':<34}{'status':>7}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'p99 ms':>9}{'queries':>9}{'KiB':>9}"
+        )
+        results = {}
+        for endpoint in endpoints:
+            # requests authenticate like clients do, with a bearer access
+            # token fresh enough to outlive the endpoint's run
+            if endpoint.headers:
+                client.credentials()
+            else:
+                client.credentials(**bearer(owners.get(endpoint.name, admin)))
+            result = measure(client, endpoint, requests)
+            results[f"{endpoint.name}@{size}"] = result
+            self.stdout.write(
+                f"{endpoint.name:<34}{result['status']:>7}{result['p50']:>9.1f}"
+                f"{result['p95']:>9.1f}{result['p99']:>9.1f}"
+                f"{result['queries']:>9}{result['memory_kib']:>9.0f}"
+            )
+        return results
@@ -0,0 +1,135 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory
+
+
+DEFAULT_PATHS = ["/api/products/", "/api/warehouse/", "/api/customers/"]
+HOST = "localhost"
+
+
+def summary(latencies, elapsed, statuses):
+    latencies = sorted(latencies)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": sum(1 for code in statuses if code >= 400),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare one WSGI worker (a thread pool) with one ASGI worker (an event "
+        "loop) serving the same GET endpoints concurrently. Both handlers are "
+        "driven in-process, so the numbers measure the application and the "
+        "database, not an HTTP server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", default=DEFAULT_PATHS)
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--concurrency", type=int, default=20, help="Requests in flight at once."
+        )
+        parser.add_argument(
+            "--threads", type=int, default=1, help="Threads of the WSGI worker."
+        )
+        parser.add_argument("--user", help="Email of the user to send requests as.")
+
+    def handle(self, *args, **options):
+        headers = {"HTTP_HOST": HOST}
+        if options["user"]:
+            user = get_user_model().objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}.")
+            client = Client()
+            client.force_login(user)
+            headers["HTTP_COOKIE"] = client.cookies.output(header="", sep=";")
+
+        self.stdout.write(
+            f"{options['requests']} requests per path, {options['concurrency']} "
+            f"in flight, WSGI worker with {options['threads']} thread(s)"
+        )
+        self.stdout.write(
+            f"{'path':<24}{'server':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}"
+        )
+        for path in options["paths"]:
+            for server, run in (("wsgi", self.run_wsgi), ("asgi", self.run_asgi)):
+                result = run(path, headers, options)
+                self.stdout.write(
+                    f"{path:<24}{server:<8}{result['rps']:>9.1f}"
+                    f"{result['p50']:>9.1f}{result['p95']:>9.1f}{result['errors']:>8}"
+                )
+
+    def run_wsgi(self, path, headers, options):
+        handler = WSGIHandler()
+        factory = RequestFactory()
+
+        def call(_):
+            statuses = []
+            environ = factory.get(path, **headers).environ
+            started = time.perf_counter()
+            body = handler(environ, lambda status, _: statuses.append(status))
+            b"".join(body)
+            body.close()
+            return time.perf_counter() - started, int(statuses[0].split()[0])
+
+        # the pool's queue stands in for requests waiting on a busy worker
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            results = list(pool.map(call, range(options["requests"])))
+        elapsed = time.perf_counter() - started
+        return summary([r[0] for r in results], elapsed, [r[1] for r in results])
+
+    def run_asgi(self, path, headers, options):
+        handler = ASGIHandler()
+        scope_headers = [(b"host", HOST.encode())]
+        if "HTTP_COOKIE" in headers:
+            scope_headers.append((b"cookie", headers["HTTP_COOKIE"].encode()))
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "headers": scope_headers,
+            "server": (HOST, 80),
+            "client": ("127.0.0.1", 0),
+        }
+
+        async def call(slots):
+            statuses = []
+
+            async def receive():
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    statuses.append(message["status"])
+
+            async with slots:
+                started = time.perf_counter()
+                await handler(dict(scope), receive, send)
+                return time.perf_counter() - started, statuses[0]
+
+        async def run():
+            slots = asyncio.Semaphore(options["concurrency"])
+            return await asyncio.gather(
+                *[call(slots) for _ in range(options["requests"])]
+            )
+
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        return summary([r[0] for r in results], elapsed, [r[1] for r in results])
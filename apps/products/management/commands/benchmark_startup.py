@@ -0,0 +1,137 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.management.commands.benchmark_reads import HOST
+
+
+# dependencies a worker should only load once an endpoint needs them
+HEAVY_MODULES = ("barcode", "PIL", "phonenumbers", "pyotp", "numpy")
+
+# modules of an app that are not imported by django.setup()
+APP_MODULES = ("serializers", "views", "routers")
+
+# run in a fresh interpreter, the last line of output is the result
+IMPORT_PROBE = """
+import json, sys, time
+from importlib import import_module, util
+
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - started
+
+app, modules, heavy = json.loads(sys.argv[1])
+started = time.perf_counter()
+for name in modules:
+    if util.find_spec(f"{app}.{name}") is not None:
+        import_module(f"{app}.{name}")
+imported = time.perf_counter() - started
+print(json.dumps({
+    "setup": setup,
+    "import": imported,
+    "loaded": [name for name in heavy if name in sys.modules],
+}))
+"""
+
+REQUEST_PROBE = """
+import json, sys, time
+
+started = time.perf_counter()
+from config.wsgi import application
+boot = time.perf_counter() - started
+
+from django.test import RequestFactory
+
+paths, host = json.loads(sys.argv[1])
+factory = RequestFactory()
+
+def call(path):
+    statuses = []
+    started = time.perf_counter()
+    body = application(
+        factory.get(path, HTTP_HOST=host).environ,
+        lambda status, _: statuses.append(status),
+    )
+    b"".join(body)
+    body.close()
+    return time.perf_counter() - started, int(statuses[0].split()[0])
+
+first, status = call(paths[0])
+results = {"boot": boot, "first": first, "status": status}
+results["second"] = call(paths[0])[0]
+print(json.dumps(results))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what a freshly booted worker pays: django.setup() and the cold "
+        "import of each app's serializers, views and routers, then the time to "
+        "boot the WSGI application and serve its first request. Every "
+        "measurement runs in a new interpreter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="/api/products/")
+        parser.add_argument(
+            "--apps",
+            nargs="+",
+            help="App modules to import, defaults to the project's apps.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=3, help="Runs per measurement, medians."
+        )
+        parser.add_argument(
+            "--imports-only", action="store_true", help="Skip the request probe."
+        )
+
+    def probe(self, script, argument):
+        result = subprocess.run(
+            [sys.executable, "-c", script, json.dumps(argument)],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def median(self, runs, key):
+        return statistics.median(run[key] for run in runs) * 1000
+
+    def handle(self, *args, **options):
+        names = options["apps"] or [
+            config.name for config in apps.get_app_configs()
+            if config.name.startswith("apps.")
+        ]
+
+        self.stdout.write(f"{'app':<18}{'setup ms':>10}{'import ms':>11}  loaded")
+        for name in names:
+            runs = [
+                self.probe(IMPORT_PROBE, [name, APP_MODULES, HEAVY_MODULES])
+                for _ in range(options["repeat"])
+            ]
+            loaded = ", ".join(runs[0]["loaded"]) or "-"
+            self.stdout.write(
+                f"{name:<18}{self.median(runs, 'setup'):>10.1f}"
+                f"{self.median(runs, 'import'):>11.1f}  {loaded}"
+            )
+
+        if options["imports_only"]:
+            return
+        runs = [
+            self.probe(REQUEST_PROBE, [[options["path"]], HOST])
+            for _ in range(options["repeat"])
+        ]
+        self.stdout.write(
+            f"GET {options['path']} (HTTP {runs[0]['status']}): boot "
+            f"{self.median(runs, 'boot'):.1f} ms, first request "
+            f"{self.median(runs, 'first'):.1f} ms, second request "
+            f"{self.median(runs, 'second'):.1f} ms"
+        )
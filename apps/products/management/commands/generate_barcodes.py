@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.barcodes import generate_barcodes
+from apps.products.constants import BARCODE_PAPER_SIZE
+from apps.products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Render and store barcodes for many products using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--papersize",
+            required=True,
+            choices=[choice for choice, _ in BARCODE_PAPER_SIZE],
+        )
+        parser.add_argument("--warehouse", help="Only label this warehouse's products.")
+        parser.add_argument("--product", action="append", dest="products", default=[])
+        parser.add_argument("--all", action="store_true", help="Label every product.")
+        parser.add_argument("--processes", type=int, default=None)
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        products = Product.objects.only("id", "product_code").order_by("id")
+        if options["products"]:
+            products = products.filter(id__in=options["products"])
+        if options["warehouse"]:
+            products = products.filter(warehouse=options["warehouse"])
+        if not (options["products"] or options["warehouse"] or options["all"]):
+            raise CommandError("Pass --product, --warehouse or --all.")
+
+        total = 0
+        chunk = []
+        for product in products.iterator(chunk_size=options["chunk_size"]):
+            chunk.append(product)
+            if len(chunk) == options["chunk_size"]:
+                total += len(self.label(chunk, options))
+                chunk = []
+        if chunk:
+            total += len(self.label(chunk, options))
+
+        self.stdout.write(self.style.SUCCESS(f"Generated {total} barcodes."))
+
+    def label(self, products, options):
+        return generate_barcodes(
+            products, options["papersize"], processes=options["processes"]
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.models import User
+from apps.products.imports import ProductImporter
+from utils.imports import IMPORT_FORMATS, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Stream products from a CSV or JSONL file into the catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, dest="file_format")
+        parser.add_argument("--user", help="Email of the user the rows are attributed to.")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(email=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"No user with email {options['user']}")
+
+        file_format = options["file_format"] or guess_format(options["path"])
+        importer = ProductImporter(user=user, chunk_size=options["chunk_size"])
+        with open(options["path"], encoding="utf-8-sig", newline="") as fileobj:
+            report = importer.run(read_rows(fileobj, file_format))
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report['created']} products, {len(report['errors'])} rows failed."
+            )
+        )
@@ -0,0 +1,19 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from apps.products.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or repair from a date on) the daily sales rollups from raw sales."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since", type=date.fromisoformat, help="Only rebuild days from YYYY-MM-DD on."
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rolled_up = rebuild_rollups(options["since"], chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {rolled_up} sales."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.valuation import rebuild_valuation, valuation_drift
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild cost layers and inventory valuation from completed purchases "
+        "and sales and from adjustments. With --check, only report the pairs "
+        "whose valued quantity disagrees with the stock on hand."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Fail when valuation and stock disagree instead of rebuilding.",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drift = valuation_drift()
+            for product_id, warehouse_id, on_hand, valued in drift:
+                self.stdout.write(
+                    f"product {product_id} in warehouse {warehouse_id}: "
+                    f"{on_hand} in stock, {valued} valued"
+                )
+            if drift:
+                raise CommandError(f"{len(drift)} pairs disagree with the stock.")
+            self.stdout.write(self.style.SUCCESS("Valuation matches the stock."))
+            return
+
+        replayed = rebuild_valuation()
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} movements."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.invoice_totals import KINDS, recompute_totals
+
+
+class Command(BaseCommand):
+    help = "Recompute the cached totals of purchase and sales invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=list(KINDS), action="append", dest="kinds")
+        parser.add_argument(
+            "--stale", action="store_true", help="Only invoices marked stale."
+        )
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        for name in options["kinds"] or list(KINDS):
+            kind = KINDS[name]
+            invoices = kind.invoice_model.objects.all()
+            if options["stale"]:
+                invoices = invoices.filter(totals_stale=True)
+            written = recompute_totals(kind, invoices, chunk_size=options["chunk_size"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Recomputed {written} {name} invoices.")
+            )
@@ -0,0 +1,48 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.base import BaseCommand
+
+from apps.products.low_stock import reorder_suggestions, supplier_names
+
+
+class Command(BaseCommand):
+    help = "List reorder suggestions for low-stock products, grouped by supplier."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--warehouse", help="Only this warehouse's stock.")
+        parser.add_argument(
+            "--days", type=int, default=90, help="Purchase history window in days."
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON.")
+
+    def handle(self, *args, **options):
+        suggestions = reorder_suggestions(options["warehouse"], days=options["days"])
+        names = supplier_names([pk for pk in suggestions if pk])
+
+        if options["json"]:
+            self.stdout.write(
+                json.dumps(
+                    [
+                        {
+                            "supplier": supplier,
+                            "supplier_name": names.get(supplier),
+                            "items": items,
+                        }
+                        for supplier, items in suggestions.items()
+                    ],
+                    cls=DjangoJSONEncoder,
+                )
+            )
+            return
+
+        for supplier, items in suggestions.items():
+            self.stdout.write(names.get(supplier, "No recent supplier"))
+            for item in items:
+                self.stdout.write(
+                    f"  {item['product_name']} @ {item['warehouse_name']}: "
+                    f"{item['quantity']}/{item['alert_quantity']}, "
+                    f"order {item['suggested_quantity']}"
+                )
+        total = sum(len(items) for items in suggestions.values())
+        self.stdout.write(self.style.SUCCESS(f"{total} low-stock items."))
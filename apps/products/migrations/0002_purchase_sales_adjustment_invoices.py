@@ -0,0 +1,163 @@
+# Generated by Django 4.2.5 on 2026-10-18 19:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_biller_otp_fields'),
+        ('store', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Adjustment',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='adjustment_images/')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('warehouse', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='store.warehouse')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Purchase',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('order_tax', models.CharField(choices=[('8', 'Vat @8%'), ('9', 'Vat @9%'), ('10', 'Vat @10%'), ('11', 'Vat @11%'), ('12', 'Vat @12%'), ('13', 'Vat @13%')], max_length=10)),
+                ('order_discount', models.FloatField()),
+                ('shipping', models.FloatField()),
+                ('sales_status', models.CharField(choices=[('Complete', 'Complete'), ('Incomplete', 'Incomplete'), ('Drafts', 'Drafts')], max_length=15)),
+                ('purchase_note', models.TextField()),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Sales',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('sales_tax', models.CharField(choices=[('8', 'Vat @8%'), ('9', 'Vat @9%'), ('10', 'Vat @10%'), ('11', 'Vat @11%'), ('12', 'Vat @12%'), ('13', 'Vat @13%')], max_length=10)),
+                ('discount', models.FloatField()),
+                ('shipping', models.FloatField()),
+                ('sales_status', models.CharField(choices=[('Complete', 'Complete'), ('Incomplete', 'Incomplete'), ('Drafts', 'Drafts')], max_length=15)),
+                ('payment_status', models.CharField(choices=[('Complete', 'Complete'), ('Incomplete', 'Incomplete'), ('Drafts', 'Drafts')], max_length=15)),
+                ('sales_image', models.ImageField(blank=True, null=True, upload_to='sales/')),
+                ('sales_note', models.TextField()),
+                ('staff_remark', models.TextField()),
+                ('biller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_biller', to='accounts.biller')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_customer', to='accounts.customer')),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='barcode',
+            name='barcode_image',
+            field=models.ImageField(blank=True, null=True, upload_to='barcode-image/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='barcode',
+            field=models.CharField(max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='warehouse',
+            field=models.ManyToManyField(blank=True, to='store.warehouse'),
+        ),
+        migrations.CreateModel(
+            name='SalesInvoice',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('sales', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.sales')),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_supplier', to='accounts.supplier')),
+                ('warehouse', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_warehouse', to='store.warehouse')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='product',
+            field=models.ManyToManyField(to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_warehouse', to='store.warehouse'),
+        ),
+        migrations.CreateModel(
+            name='PurchaseInvoice',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('purchases', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.purchase')),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_supplier', to='accounts.supplier')),
+                ('warehouse', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_warehouse', to='store.warehouse')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='product',
+            field=models.ManyToManyField(to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='supplier',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_supplier', to='accounts.supplier'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_warehouse', to='store.warehouse'),
+        ),
+        migrations.CreateModel(
+            name='AdjustmentItems',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('type', models.CharField(choices=[('Addition', 'Addition'), ('Subtraction', 'Subtraction')], default='Addition', max_length=20)),
+                ('adjustment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_adjustment', to='products.adjustment')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_product', to='products.product')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_purchase_sales_adjustment_invoices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adjustment',
+            index=models.Index(fields=['created_on', 'id'], name='adjustment_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adjustmentitems',
+            index=models.Index(fields=['created_on', 'id'], name='adjustmentitems_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='barcode',
+            index=models.Index(fields=['created_on', 'id'], name='barcode_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='brand',
+            index=models.Index(fields=['created_on', 'id'], name='brand_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['created_on', 'id'], name='category_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_on', 'id'], name='product_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['created_on', 'id'], name='purchase_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseinvoice',
+            index=models.Index(fields=['created_on', 'id'], name='purchaseinvoice_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['created_on', 'id'], name='sales_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesinvoice',
+            index=models.Index(fields=['created_on', 'id'], name='salesinvoice_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='unit',
+            index=models.Index(fields=['created_on', 'id'], name='unit_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.5 on 2026-10-18 19:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+BACKFILL_SEARCH_VECTOR = """
+    UPDATE products_product AS p SET search_vector =
+        setweight(to_tsvector('simple', coalesce(p.product_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(p.barcode, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(b.brand_name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(c.main_category, '') || ' ' || coalesce(c.sub_category, '')), 'C')
+    FROM products_brand AS b, products_category AS c
+    WHERE b.id = p.brand_id AND c.id = p.category_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTOR, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['product_name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.5 on 2026-10-18 19:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0004_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adjustmentitems',
+            name='quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Stock',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('quantity', models.IntegerField(default=0)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stocks', to='products.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stocks', to='store.warehouse')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['created_on', 'id'], name='stock_created_id_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(fields=('product', 'warehouse'), name='stock_product_warehouse_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gte', 0)), name='stock_quantity_non_negative'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.5 on 2026-10-18 19:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0005_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CostOfSale',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('issued_on', models.DateTimeField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('fifo_cost', models.DecimalField(decimal_places=4, max_digits=18)),
+                ('average_cost', models.DecimalField(decimal_places=4, max_digits=18)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='costs_of_sale', to='products.product')),
+                ('sales', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='costs_of_sale', to='products.sales')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='costs_of_sale', to='store.warehouse')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CostLayer',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('received_on', models.DateTimeField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('remaining', models.PositiveIntegerField()),
+                ('unit_cost', models.DecimalField(decimal_places=4, max_digits=18)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='products.product')),
+                ('purchase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cost_layers', to='products.purchase')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='store.warehouse')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='StockValuation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('quantity', models.IntegerField(default=0)),
+                ('fifo_value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('average_value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuations', to='products.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuations', to='store.warehouse')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['created_on', 'id'], name='stockvaluation_created_id_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockvaluation',
+            constraint=models.UniqueConstraint(fields=('product', 'warehouse'), name='valuation_product_warehouse_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='costofsale',
+            index=models.Index(fields=['created_on', 'id'], name='costofsale_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='costofsale',
+            index=models.Index(fields=['issued_on', 'warehouse'], name='costofsale_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='costlayer',
+            index=models.Index(fields=['created_on', 'id'], name='costlayer_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='costlayer',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['product', 'warehouse', 'received_on', 'id'], name='costlayer_open_fifo_idx'),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def copy_links(apps, schema_editor):
+    """
+    Turns every existing purchase/sale product link into a one-unit line at
+    the product's cost (purchases) or selling price (sales).
+    """
+    Purchase = apps.get_model("products", "Purchase")
+    Sales = apps.get_model("products", "Sales")
+    PurchaseItem = apps.get_model("products", "PurchaseItem")
+    SalesItem = apps.get_model("products", "SalesItem")
+
+    links = Purchase.product.through.objects.values_list(
+        "purchase_id", "product_id", "product__product_price", "product__product_tax"
+    )
+    PurchaseItem.objects.bulk_create(
+        [
+            PurchaseItem(purchase_id=parent, product_id=product, unit_price=price, tax_rate=tax)
+            for parent, product, price, tax in links.iterator()
+        ],
+        batch_size=1000,
+    )
+    links = Sales.product.through.objects.values_list(
+        "sales_id", "product_id", "product__unit_price", "product__product_tax"
+    )
+    SalesItem.objects.bulk_create(
+        [
+            SalesItem(sales_id=parent, product_id=product, unit_price=price, tax_rate=tax)
+            for parent, product, price, tax in links.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0006_inventory_valuation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesItem',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('tax_rate', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_product', to='products.product')),
+                ('sales', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='products.sales')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['created_on', 'id'], name='salesitem_created_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PurchaseItem',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('tax_rate', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_product', to='products.product')),
+                ('purchase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='products.purchase')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['created_on', 'id'], name='purchaseitem_created_id_idx')],
+            },
+        ),
+        migrations.RunPython(copy_links, migrations.RunPython.noop),
+        migrations.RemoveField(model_name='purchase', name='product'),
+        migrations.RemoveField(model_name='sales', name='product'),
+        migrations.AddField(
+            model_name='purchase',
+            name='product',
+            field=models.ManyToManyField(through='products.PurchaseItem', to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='product',
+            field=models.ManyToManyField(through='products.SalesItem', to='products.product'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_line_items'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='discount_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='grand_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='shipping_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='tax_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='totals_stale',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='discount_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='grand_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='shipping_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='tax_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='totals_stale',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseinvoice',
+            index=models.Index(condition=models.Q(('totals_stale', True)), fields=['id'], name='purchaseinvoice_stale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesinvoice',
+            index=models.Index(condition=models.Q(('totals_stale', True)), fields=['id'], name='salesinvoice_stale_idx'),
+        ),
+    ]
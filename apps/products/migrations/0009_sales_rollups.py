@@ -0,0 +1,40 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_invoice_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('warehouse', 'Warehouse'), ('brand', 'Brand'), ('category', 'Category'), ('biller', 'Biller'), ('customer_group', 'Customer group')], max_length=20)),
+                ('key', models.CharField(max_length=64)),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('tax', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('discount', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesRollupSource',
+            fields=[
+                ('sales', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup_source', serialize=False, to='products.sales')),
+                ('day', models.DateField()),
+                ('cells', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(fields=('dimension', 'day', 'key'), name='salesrollup_cell_unique'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='alert_quantity',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE products_stock
+            SET alert_quantity = products_product.stock_alert
+            FROM products_product
+            WHERE products_product.id = products_stock.product_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('quantity__lte', models.F('alert_quantity'))), fields=['warehouse', 'created_on', 'id'], name='stock_low_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_low_stock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['modified_on'], name='product_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_modified_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseinvoice',
+            name='number',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='salesinvoice',
+            name='number',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddConstraint(
+            model_name='purchaseinvoice',
+            constraint=models.UniqueConstraint(condition=models.Q(('number', ''), _negated=True), fields=('warehouse', 'number'), name='purchaseinvoice_number_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='salesinvoice',
+            constraint=models.UniqueConstraint(condition=models.Q(('number', ''), _negated=True), fields=('warehouse', 'number'), name='salesinvoice_number_uniq'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.5 on 2026-10-18 22:40
+
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def create_missing_stock(apps, schema_editor):
+    """
+    Gives every existing product/warehouse link without a stock row an empty
+    one, so low stock alerts cover products that were never received.
+    """
+    Product = apps.get_model("products", "Product")
+    Stock = apps.get_model("products", "Stock")
+
+    links = (
+        Product.warehouse.through.objects.filter(
+            ~Exists(
+                Stock.objects.filter(
+                    product_id=OuterRef("product_id"),
+                    warehouse_id=OuterRef("warehouse_id"),
+                )
+            )
+        )
+        .values_list("product_id", "warehouse_id", "product__stock_alert")
+    )
+    Stock.objects.bulk_create(
+        [
+            Stock(product_id=product, warehouse_id=warehouse, quantity=0, alert_quantity=alert)
+            for product, warehouse, alert in links.iterator()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_invoice_numbers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_stock, migrations.RunPython.noop),
+    ]
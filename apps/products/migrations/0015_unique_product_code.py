@@ -0,0 +1,52 @@
+# Generated by Django 4.2.5 on 2026-10-18 23:05
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+from utils.numbering import PRODUCT_CODE
+
+
+def check_product_codes(apps, schema_editor):
+    """
+    Stops with the products sharing a code, for an operator to renumber,
+    then moves the code sequence past the highest code entered by hand.
+    """
+    Product = apps.get_model("products", "Product")
+    shared = (
+        Product.objects.values("product_code")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("product_code", flat=True)
+    )
+    conflicts = Product.objects.filter(product_code__in=shared).order_by(
+        "product_code", "created_on"
+    )
+    if conflicts:
+        lines = [
+            f"  {product.product_code}: {product.pk} {product.product_name}"
+            for product in conflicts
+        ]
+        raise RuntimeError(
+            "These products share a product_code, give each its own code and "
+            "migrate again:\n" + "\n".join(lines)
+        )
+
+    last = Product.objects.aggregate(last=Max("product_code"))["last"]
+    if last is not None:
+        PRODUCT_CODE.advance(last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_table_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_product_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='product_code',
+            field=models.IntegerField(unique=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from apps.products.constants import (
     PRODUCT_TYPE_CHOICES,
@@ -7,13 +9,18 @@ from apps.products.constants import (
     ORDER_TAX,
     SALE_STATUS,
     TYPE,
+    ROLLUP_DIMENSION,
 )
 from utils.models import CommonInfo
 from apps.store.models import Warehouse
 from apps.accounts.models import User, Customer, Supplier, Biller
 
-
-from utils.threads import get_request
+from utils.audit import AuditQuerySet, current_user
+from utils.numbering import (
+    PRODUCT_CODE,
+    PURCHASE_INVOICE_NUMBER,
+    SALES_INVOICE_NUMBER,
+)
 
 
 # Create your models here.
@@ -21,6 +28,11 @@ class Brand(CommonInfo):
     brand_name = models.CharField(max_length=30)
     brand_image = models.ImageField(upload_to="profile/", blank=True, null=True)
 
+    class Meta(CommonInfo.Meta):
+        indexes = CommonInfo.Meta.indexes + [
+            models.Index(fields=["modified_on"], name="brand_modified_idx"),
+        ]
+
     def __str__(self):
         return self.brand_name
 
@@ -29,6 +41,11 @@ class Category(CommonInfo):
     main_category = models.CharField(max_length=30)
     sub_category = models.CharField(max_length=30)
 
+    class Meta(CommonInfo.Meta):
+        indexes = CommonInfo.Meta.indexes + [
+            models.Index(fields=["modified_on"], name="category_modified_idx"),
+        ]
+
     def __str__(self):
         return self.main_category
 
@@ -37,6 +54,11 @@ class Unit(CommonInfo):
     unit_name = models.CharField(max_length=20)
     short_name = models.CharField(max_length=5)
 
+    class Meta(CommonInfo.Meta):
+        indexes = CommonInfo.Meta.indexes + [
+            models.Index(fields=["modified_on"], name="unit_modified_idx"),
+        ]
+
     def __str__(self):
         return self.short_name
 
@@ -47,7 +69,7 @@ class Product(CommonInfo):
     category = models.ForeignKey(
         Category, on_delete=models.CASCADE, related_name="product_category"
     )
-    product_code = models.IntegerField()
+    product_code = models.IntegerField(unique=True)
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name="brand")
     barcode = models.CharField(max_length=16)
     product_unit = models.ForeignKey(
@@ -71,11 +93,28 @@ class Product(CommonInfo):
     add_promotional_sale = models.BooleanField(default=True)
     has_multi_variant = models.BooleanField(default=True)
     has_imie_code = models.BooleanField(default=True)
+    # maintained by apps.products.search.update_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta(CommonInfo.Meta):
+        indexes = CommonInfo.Meta.indexes + [
+            GinIndex(fields=["search_vector"], name="product_search_vector_idx"),
+            GinIndex(
+                fields=["product_name"],
+                opclasses=["gin_trgm_ops"],
+                name="product_name_trgm_idx",
+            ),
+            # latest modified_on for conditional GETs, see utils.conditional
+            models.Index(fields=["modified_on"], name="product_modified_idx"),
+        ]
 
     def save(self, *args, **kwargs):
-        current_user = get_request().user
-        self.user = current_user
-        self.created_by = current_user
+        if self.user_id is None:
+            self.user = current_user()
+        if self.product_code is None:
+            self.product_code = PRODUCT_CODE.next()
+        elif self._state.adding:
+            PRODUCT_CODE.advance(self.product_code)
         super(Product, self).save(*args, **kwargs)
 
     def __str__(self) -> str:
@@ -101,7 +140,7 @@ class Purchase(CommonInfo):
         on_delete=models.CASCADE,
         related_name="%(app_label)s_%(class)s_supplier",
     )
-    product = models.ManyToManyField(Product)
+    product = models.ManyToManyField(Product, through="PurchaseItem")
     order_tax = models.CharField(choices=ORDER_TAX, max_length=10)
     order_discount = models.FloatField()
     shipping = models.FloatField()
@@ -112,6 +151,48 @@ class Purchase(CommonInfo):
         return self.product.product_name
 
 
+class LineItemQuerySet(AuditQuerySet):
+    def with_totals(self):
+        """
+        Annotates `line_total` (after discount) and `tax_amount` so order
+        totals can be summed in SQL.
+        """
+        decimal = models.DecimalField(max_digits=18, decimal_places=4)
+        line_total = models.ExpressionWrapper(
+            models.F("quantity") * models.F("unit_price") - models.F("discount"),
+            output_field=decimal,
+        )
+        return self.annotate(line_total=line_total).annotate(
+            tax_amount=models.ExpressionWrapper(
+                models.F("line_total") * models.F("tax_rate") / 100,
+                output_field=decimal,
+            )
+        )
+
+
+class LineItem(CommonInfo):
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="%(app_label)s_%(class)s_product",
+    )
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2)
+    discount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+
+    objects = LineItemQuerySet.as_manager()
+
+    class Meta(CommonInfo.Meta):
+        abstract = True
+
+
+class PurchaseItem(LineItem):
+    purchase = models.ForeignKey(
+        Purchase, on_delete=models.CASCADE, related_name="items"
+    )
+
+
 class Sales(CommonInfo):
     customer = models.ForeignKey(
         Customer,
@@ -126,7 +207,7 @@ class Sales(CommonInfo):
     biller = models.ForeignKey(
         Biller, on_delete=models.CASCADE, related_name="%(app_label)s_%(class)s_biller"
     )
-    product = models.ManyToManyField(Product)
+    product = models.ManyToManyField(Product, through="SalesItem")
     sales_tax = models.CharField(choices=ORDER_TAX, max_length=10)
     discount = models.FloatField()
     shipping = models.FloatField()
@@ -137,6 +218,10 @@ class Sales(CommonInfo):
     staff_remark = models.TextField()
 
 
+class SalesItem(LineItem):
+    sales = models.ForeignKey(Sales, on_delete=models.CASCADE, related_name="items")
+
+
 class Adjustment(CommonInfo):
     warehouse = models.OneToOneField(
         Warehouse,
@@ -163,7 +248,45 @@ class AdjustmentItems(CommonInfo):
         related_name="%(app_label)s_%(class)s_product",
     )
     type = models.CharField(max_length=20, choices=TYPE, default=TYPE[0][0])
-    
+    quantity = models.PositiveIntegerField(default=0)
+
+
+class Stock(CommonInfo):
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="stocks",
+    )
+    warehouse = models.ForeignKey(
+        Warehouse,
+        on_delete=models.CASCADE,
+        related_name="stocks",
+    )
+    quantity = models.IntegerField(default=0)
+    # copy of product.stock_alert so low stock can be found from this table
+    # alone, through stock_low_idx
+    alert_quantity = models.IntegerField(default=0)
+
+    class Meta(CommonInfo.Meta):
+        indexes = CommonInfo.Meta.indexes + [
+            models.Index(
+                fields=["warehouse", "created_on", "id"],
+                condition=models.Q(quantity__lte=models.F("alert_quantity")),
+                name="stock_low_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "warehouse"], name="stock_product_warehouse_unique"
+            ),
+            models.CheckConstraint(
+                check=models.Q(quantity__gte=0), name="stock_quantity_non_negative"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product} @ {self.warehouse}: {self.quantity}"
+
     
 class Invoice(CommonInfo):
     warehouse = models.ForeignKey(
@@ -180,21 +303,185 @@ class Invoice(CommonInfo):
         blank=True,
         related_name="%(app_label)s_%(class)s_supplier",
     )
-
-    class Meta:
+    # allocated per warehouse by `numbering` (utils.numbering) on first save
+    number = models.CharField(max_length=40, blank=True, editable=False)
+    # cached by apps.products.invoice_totals, recomputed when the lines change
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    shipping_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    grand_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    totals_stale = models.BooleanField(default=True)
+
+    class Meta(CommonInfo.Meta):
         abstract = True
+        indexes = CommonInfo.Meta.indexes + [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(totals_stale=True),
+                name="%(class)s_stale_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["warehouse", "number"],
+                condition=~models.Q(number=""),
+                name="%(class)s_number_uniq",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.number:
+            self.number = self.numbering.next(self.warehouse_id)
+        super().save(*args, **kwargs)
 
 
 class PurchaseInvoice(Invoice):
+    numbering = PURCHASE_INVOICE_NUMBER
+
     purchases = models.OneToOneField(
         Purchase, on_delete=models.SET_NULL, null=True, blank=True
     )
 
 
-
 class SalesInvoice(Invoice):
+    numbering = SALES_INVOICE_NUMBER
+
     sales = models.OneToOneField(
         Sales, on_delete=models.SET_NULL, null=True, blank=True
     )
 
 
+class StockValuation(CommonInfo):
+    """
+    Running quantity and value of a product in a warehouse, kept under both
+    costing methods so either can be reported without replaying history.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="valuations"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, related_name="valuations"
+    )
+    quantity = models.IntegerField(default=0)
+    fifo_value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    average_value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+
+    class Meta(CommonInfo.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "warehouse"],
+                name="valuation_product_warehouse_unique",
+            ),
+        ]
+
+
+class CostLayer(CommonInfo):
+    """
+    A received quantity at one unit cost, consumed oldest first by FIFO.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="cost_layers"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, related_name="cost_layers"
+    )
+    purchase = models.ForeignKey(
+        Purchase,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="cost_layers",
+    )
+    received_on = models.DateTimeField()
+    quantity = models.PositiveIntegerField()
+    remaining = models.PositiveIntegerField()
+    unit_cost = models.DecimalField(max_digits=18, decimal_places=4)
+
+    class Meta(CommonInfo.Meta):
+        indexes = CommonInfo.Meta.indexes + [
+            models.Index(
+                fields=["product", "warehouse", "received_on", "id"],
+                condition=models.Q(remaining__gt=0),
+                name="costlayer_open_fifo_idx",
+            ),
+        ]
+
+
+class CostOfSale(CommonInfo):
+    """
+    Cost of one issued quantity, under both methods, dated for COGS reports.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="costs_of_sale"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, related_name="costs_of_sale"
+    )
+    sales = models.ForeignKey(
+        Sales,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="costs_of_sale",
+    )
+    issued_on = models.DateTimeField()
+    quantity = models.PositiveIntegerField()
+    fifo_cost = models.DecimalField(max_digits=18, decimal_places=4)
+    average_cost = models.DecimalField(max_digits=18, decimal_places=4)
+
+    class Meta(CommonInfo.Meta):
+        indexes = CommonInfo.Meta.indexes + [
+            models.Index(fields=["issued_on", "warehouse"], name="costofsale_issued_idx"),
+        ]
+
+
+class SalesRollup(models.Model):
+    """
+    Completed sales of one day summed for one value of one dimension, e.g.
+    everything sold by one brand on 2023-09-01. Maintained incrementally by
+    apps.products.rollups; never written directly.
+    """
+
+    dimension = models.CharField(choices=ROLLUP_DIMENSION, max_length=20)
+    key = models.CharField(max_length=64)
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    tax = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    discount = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dimension", "day", "key"], name="salesrollup_cell_unique"
+            ),
+        ]
+
+
+class SalesRollupSource(models.Model):
+    """
+    What one sale last added to the rollups, so a change can be applied as a
+    delta instead of re-aggregating the day.
+    """
+
+    sales = models.OneToOneField(
+        Sales, on_delete=models.CASCADE, primary_key=True, related_name="rollup_source"
+    )
+    day = models.DateField()
+    cells = models.JSONField(default=list)
+
+
+class TableVersion(models.Model):
+    """
+    How many times rows of a table were deleted or had their many-to-many
+    links changed. Neither moves the latest modified_on, so
+    utils.conditional adds this to its validators.
+    """
+
+    table = models.CharField(max_length=100, primary_key=True)
+    deletes = models.BigIntegerField(default=0)
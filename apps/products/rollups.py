@@ -0,0 +1,278 @@
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from apps.accounts.models import Biller
+from apps.products.models import (
+    Brand,
+    Category,
+    Sales,
+    SalesItem,
+    SalesRollup,
+    SalesRollupSource,
+)
+from apps.store.models import Warehouse
+from utils.transactions import queue_on_commit
+
+
+# dimensions taken from the sale itself, and from each line's product
+SALE_DIMENSIONS = {
+    "warehouse": "warehouse_id",
+    "biller": "biller_id",
+    "customer_group": "customer__customer_group",
+}
+LINE_DIMENSIONS = {
+    "brand": "product__brand_id",
+    "category": "product__category_id",
+}
+METRICS = ("quantity", "revenue", "tax", "discount")
+
+
+def sale_headers(sales):
+    return sales.values("id", "created_on", *SALE_DIMENSIONS.values())
+
+
+def sale_lines(sale_ids):
+    """
+    Line amounts of `sale_ids` grouped per sale, brand and category, ordered
+    by sale so they can be consumed as a stream.
+    """
+    return (
+        SalesItem.objects.filter(sales_id__in=sale_ids)
+        .with_totals()
+        .values("sales_id", *LINE_DIMENSIONS.values())
+        .annotate(
+            line_quantity=Sum("quantity"),
+            line_revenue=Sum("line_total"),
+            line_tax=Sum("tax_amount"),
+            line_discount=Sum("discount"),
+        )
+        .order_by("sales_id")
+    )
+
+
+def sale_cells(header, lines):
+    """
+    [dimension, key, quantity, revenue, tax, discount] rows one completed
+    sale adds to its day. Amounts are the line amounts after line discounts,
+    before order-level discount, tax and shipping.
+    """
+    cells = defaultdict(lambda: [0, Decimal("0"), Decimal("0"), Decimal("0")])
+    for line in lines:
+        values = [line[f"line_{metric}"] or 0 for metric in METRICS]
+        keys = [(name, header[field]) for name, field in SALE_DIMENSIONS.items()]
+        keys += [(name, line[field]) for name, field in LINE_DIMENSIONS.items()]
+        for dimension, key in keys:
+            cell = cells[(dimension, str(key))]
+            for index, value in enumerate(values):
+                cell[index] += value
+    return [
+        [dimension, key, quantity, str(revenue), str(tax), str(discount)]
+        for (dimension, key), (quantity, revenue, tax, discount) in sorted(cells.items())
+    ]
+
+
+def add_cells(day, cells, sign=1):
+    """
+    Adds (or with sign=-1 removes) one sale's cells to the rollups with a
+    single INSERT ... ON CONFLICT DO UPDATE, so concurrent sales on the same
+    day never lose each other's counts.
+    """
+    if not cells:
+        return
+    table = connection.ops.quote_name(SalesRollup._meta.db_table)
+    columns = ("orders",) + METRICS
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (dimension, key, day, {", ".join(columns)})
+            SELECT dimension, key, %s, %s, quantity, revenue, tax, discount
+            FROM unnest(%s::varchar[], %s::varchar[], %s::integer[],
+                        %s::numeric[], %s::numeric[], %s::numeric[])
+                AS cells(dimension, key, quantity, revenue, tax, discount)
+            ON CONFLICT (dimension, day, key) DO UPDATE SET
+            {", ".join(f"{column} = {table}.{column} + EXCLUDED.{column}" for column in columns)}
+            """,
+            [
+                day,
+                sign,
+                [cell[0] for cell in cells],
+                [cell[1] for cell in cells],
+                [sign * cell[2] for cell in cells],
+            ]
+            + [[sign * Decimal(cell[index]) for cell in cells] for index in (3, 4, 5)],
+        )
+
+
+def rollup_sales(sale_ids):
+    """
+    Brings the rollups up to date with the current state of `sale_ids`:
+    what each sale added before is taken out and what it adds now is put in.
+    Sales that are no longer complete, or no longer exist, just come out.
+    """
+    with transaction.atomic():
+        sources = SalesRollupSource.objects.select_for_update().in_bulk(list(sale_ids))
+        headers = {
+            header["id"]: header
+            for header in sale_headers(
+                Sales.objects.filter(id__in=sale_ids, sales_status="Complete")
+            )
+        }
+        lines = defaultdict(list)
+        for line in sale_lines(list(headers)):
+            lines[line["sales_id"]].append(line)
+
+        for sale_id in sale_ids:
+            source = sources.get(sale_id)
+            header = headers.get(sale_id)
+            day = timezone.localdate(header["created_on"]) if header else None
+            cells = sale_cells(header, lines[sale_id]) if header else []
+            if source and source.day == day and source.cells == cells:
+                continue
+            if source:
+                add_cells(source.day, source.cells, sign=-1)
+            if cells:
+                add_cells(day, cells)
+                SalesRollupSource.objects.update_or_create(
+                    sales_id=sale_id, defaults={"day": day, "cells": cells}
+                )
+            elif source:
+                source.delete()
+
+
+def schedule_rollup(sale_ids):
+    """
+    Rolls `sale_ids` up once the current transaction commits, so the lines
+    written after the sale itself are included.
+    """
+    queue_on_commit(rollup_sales, sale_ids)
+
+
+def remove_sale(sale_id):
+    source = SalesRollupSource.objects.filter(sales_id=sale_id).first()
+    if source:
+        add_cells(source.day, source.cells, sign=-1)
+
+
+def rebuild_rollups(since=None, chunk_size=5000):
+    """
+    Recomputes the rollups from raw sales (all of them, or those from the
+    `since` date on) chunk by chunk. Returns the number of sales rolled up.
+    """
+    sales = Sales.objects.filter(sales_status="Complete").order_by("id")
+    if since is not None:
+        since_start = timezone.make_aware(datetime.combine(since, time.min))
+        sales = sales.filter(created_on__gte=since_start)
+
+    with transaction.atomic():
+        rollups = SalesRollup.objects.all()
+        sources = SalesRollupSource.objects.all()
+        if since is not None:
+            rollups = rollups.filter(day__gte=since)
+            sources = sources.filter(day__gte=since)
+        rollups.delete()
+        sources.delete()
+
+        totals = defaultdict(lambda: [0, 0, Decimal("0"), Decimal("0"), Decimal("0")])
+        rolled_up, last = 0, None
+        while True:
+            chunk = sales if last is None else sales.filter(id__gt=last)
+            headers = list(sale_headers(chunk[:chunk_size]))
+            if not headers:
+                break
+            lines = defaultdict(list)
+            for line in sale_lines([header["id"] for header in headers]):
+                lines[line["sales_id"]].append(line)
+
+            new_sources = []
+            for header in headers:
+                day = timezone.localdate(header["created_on"])
+                cells = sale_cells(header, lines[header["id"]])
+                if not cells:
+                    continue
+                new_sources.append(
+                    SalesRollupSource(sales_id=header["id"], day=day, cells=cells)
+                )
+                for dimension, key, *values in cells:
+                    total = totals[(dimension, key, day)]
+                    total[0] += 1
+                    for index, value in enumerate(values, start=1):
+                        total[index] += Decimal(str(value))
+            SalesRollupSource.objects.bulk_create(new_sources)
+            rolled_up += len(new_sources)
+            last = headers[-1]["id"]
+
+        SalesRollup.objects.bulk_create(
+            [
+                SalesRollup(
+                    dimension=dimension,
+                    key=key,
+                    day=day,
+                    orders=orders,
+                    quantity=quantity,
+                    revenue=revenue,
+                    tax=tax,
+                    discount=discount,
+                )
+                for (dimension, key, day), (
+                    orders,
+                    quantity,
+                    revenue,
+                    tax,
+                    discount,
+                ) in totals.items()
+            ],
+            batch_size=5000,
+        )
+    return rolled_up
+
+
+def dimension_labels(dimension, keys):
+    """
+    Display names for rollup keys, one query per report.
+    """
+    if dimension == "customer_group":
+        return {key: key for key in keys}
+    if dimension == "warehouse":
+        rows = Warehouse.objects.filter(id__in=keys).values_list("id", "name")
+    elif dimension == "brand":
+        rows = Brand.objects.filter(id__in=keys).values_list("id", "brand_name")
+    elif dimension == "category":
+        rows = Category.objects.filter(id__in=keys).values_list("id", "main_category")
+    else:
+        rows = Biller.objects.filter(id__in=keys).values_list("id", "user__full_name")
+    return {str(pk): label for pk, label in rows}
+
+
+def sales_report(dimension, start, end, interval="month", key=None):
+    """
+    Rollup rows of one dimension between `start` and `end` (inclusive),
+    summed per key and day or month.
+    """
+    rollups = SalesRollup.objects.filter(
+        dimension=dimension, day__gte=start, day__lte=end
+    )
+    if key is not None:
+        rollups = rollups.filter(key=key)
+    period = TruncMonth("day") if interval == "month" else F("day")
+    rows = list(
+        rollups.annotate(period=period)
+        .values("key", "period")
+        .annotate(
+            orders=Sum("orders"),
+            quantity=Sum("quantity"),
+            revenue=Sum("revenue"),
+            tax=Sum("tax"),
+            discount=Sum("discount"),
+        )
+        .order_by("period", "key")
+    )
+    labels = dimension_labels(dimension, {row["key"] for row in rows})
+    for row in rows:
+        row["label"] = labels.get(row["key"])
+    return rows
@@ -10,7 +10,12 @@ from apps.products.views import (
     PurchaseInvoiceViewSet,
     SalesInvoiceViewSet,
     AdjustmentViewSet,
-    AdjustmentItemsViewSet
+    AdjustmentItemsViewSet,
+    StockViewSet,
+    LowStockViewSet,
+    StockValuationViewSet,
+    SalesReportViewSet,
+    ReferenceCacheViewSet,
 )
 
 router = DefaultRouter()
@@ -24,4 +29,9 @@ router.register("sales", SalesViewSet)
 router.register('purchase-invoice', PurchaseInvoiceViewSet)
 router.register('sales-invoice', SalesInvoiceViewSet)
 router.register('adjustment', AdjustmentViewSet)
-router.register('adjustment-items', AdjustmentItemsViewSet)
\ No newline at end of file
+router.register('adjustment-items', AdjustmentItemsViewSet)
+router.register('stock', StockViewSet)
+router.register('low-stock', LowStockViewSet, basename='low-stock')
+router.register('valuation', StockValuationViewSet)
+router.register('reports/sales', SalesReportViewSet, basename='sales-report')
+router.register('reference-cache', ReferenceCacheViewSet, basename='reference-cache')
\ No newline at end of file
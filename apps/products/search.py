@@ -0,0 +1,93 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from rest_framework import filters
+
+from apps.products.models import Brand, Category, Product
+
+
+SEARCH_CONFIG = "simple"
+
+# name and barcode outrank brand, which outranks category
+SEARCH_VECTOR_SQL = """
+    UPDATE {product} AS p SET search_vector =
+        setweight(to_tsvector('simple', coalesce(p.product_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(p.barcode, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(b.brand_name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(c.main_category, '') || ' ' || coalesce(c.sub_category, '')), 'C')
+    FROM {brand} AS b, {category} AS c
+    WHERE b.id = p.brand_id AND c.id = p.category_id
+"""
+
+
+def update_search_vectors(product_ids=None, brand_id=None, category_id=None):
+    """
+    Recomputes `Product.search_vector` for the given products, or for every
+    product of a brand/category, or for the whole catalog when nothing is given.
+    """
+    sql = SEARCH_VECTOR_SQL.format(
+        product=Product._meta.db_table,
+        brand=Brand._meta.db_table,
+        category=Category._meta.db_table,
+    )
+    params = []
+    if product_ids is not None:
+        sql += " AND p.id = ANY(%s)"
+        params.append(list(product_ids))
+    if brand_id is not None:
+        sql += " AND p.brand_id = %s"
+        params.append(brand_id)
+    if category_id is not None:
+        sql += " AND p.category_id = %s"
+        params.append(category_id)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def search_query(term):
+    """
+    Prefix query over every word of `term`, so "coca co" finds "Coca Cola".
+    """
+    words = re.findall(r"\w+", term)
+    if not words:
+        return None
+    return SearchQuery(
+        " & ".join(f"{word}:*" for word in words),
+        config=SEARCH_CONFIG,
+        search_type="raw",
+    )
+
+
+def search_products(queryset, term):
+    """
+    Full-text matches on the maintained search vector plus trigram matches on
+    the product name (for typos), both served by GIN indexes, best first.
+    """
+    query = search_query(term)
+    if query is None:
+        return queryset
+    return (
+        queryset.filter(Q(search_vector=query) | Q(product_name__trigram_word_similar=term))
+        .annotate(
+            rank=SearchRank(F("search_vector"), query),
+            similarity=TrigramWordSimilarity(term, "product_name"),
+        )
+        .order_by("-rank", "-similarity", "id")
+    )
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Keeps the `?search=` parameter but answers it from the search indexes
+    instead of an ILIKE scan over `search_fields`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = " ".join(self.get_search_terms(request))
+        if not term:
+            return queryset
+        return search_products(queryset, term)
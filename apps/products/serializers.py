@@ -1,4 +1,8 @@
+from decimal import Decimal
+
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.fields import empty
 from apps.products.models import (
     Brand,
     Sales,
@@ -7,11 +11,15 @@ from apps.products.models import (
     Unit,
     Barcode,
     Purchase,
+    PurchaseItem,
+    SalesItem,
     Adjustment,
     AdjustmentItems,
     Invoice,
     PurchaseInvoice,
     SalesInvoice,
+    Stock,
+    StockValuation,
 )
 from apps.accounts.serializers import (
     UserSerializer,
@@ -19,9 +27,17 @@ from apps.accounts.serializers import (
     BillerSerializer,
     CustomerSerializer,
 )
+from apps.products.constants import (
+    BARCODE_PAPER_SIZE,
+    REPORT_INTERVAL,
+    ROLLUP_DIMENSION,
+    VALUATION_METHOD,
+)
 from apps.store.serializers import WarehouseSerializer
 from apps.store.models import Warehouse
 from apps.accounts.models import Supplier
+from utils.numbering import PRODUCT_CODE
+from utils.reference_cache import CachedRelatedField, CachedRelatedListSerializer
 
 
 class BrandSerializers(serializers.ModelSerializer):
@@ -81,6 +97,9 @@ class ProductSerializer(serializers.ModelSerializer):
             "has_multi_variant",
             "has_imie_code",
         )
+        # allocated by utils.numbering when left out, a code given by hand
+        # moves the numbering past it
+        extra_kwargs = {"product_code": {"required": False}}
 
     def create(self, validated_data):
         warehouse_data = validated_data.pop("warehouse", [])  # Extract warehouse data
@@ -97,11 +116,33 @@ class ProductSerializer(serializers.ModelSerializer):
 
         return product
 
+    def update(self, instance, validated_data):
+        code = validated_data.get("product_code", instance.product_code)
+        if code != instance.product_code:
+            PRODUCT_CODE.advance(code)
+        return super().update(instance, validated_data)
+
 
 class BarcodeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Barcode
-        fields = [ "id", "information", "papersize"]
+        fields = [ "id", "information", "papersize", "barcode_image"]
+        read_only_fields = ["barcode_image"]
+
+
+class BarcodeBatchSerializer(serializers.Serializer):
+    products = serializers.ListField(child=serializers.UUIDField(), required=False)
+    warehouse = serializers.PrimaryKeyRelatedField(
+        queryset=Warehouse.objects.all(), required=False
+    )
+    papersize = serializers.ChoiceField(choices=BARCODE_PAPER_SIZE)
+
+    def validate(self, data):
+        if not data.get("products") and not data.get("warehouse"):
+            raise serializers.ValidationError(
+                {"products": "Pass the products or the warehouse to label."}
+            )
+        return data
 
 
 class GETBarcodeSerializer(serializers.ModelSerializer):
@@ -111,17 +152,18 @@ class GETBarcodeSerializer(serializers.ModelSerializer):
         fields = ['id', 'information', 'papersize']
 
 class GETProductSerializer(serializers.ModelSerializer):
-    brand = BrandSerializers()
-    category = CategorySerializer()
-    product_unit = UnitSerializer()
+    brand = CachedRelatedField(BrandSerializers)
+    category = CachedRelatedField(CategorySerializer)
+    product_unit = CachedRelatedField(UnitSerializer)
     created_by = UserSerializer()
     modified_by = UserSerializer()
     user = UserSerializer()
-    warehouse = WarehouseSerializer(many=True)
+    warehouse = CachedRelatedField(WarehouseSerializer, many=True)
 
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = ("search_vector",)
+        list_serializer_class = CachedRelatedListSerializer
 
 
 class GetCategorySeralizer(serializers.ModelSerializer):
@@ -161,7 +203,101 @@ class GetBrandSeralizer(serializers.ModelSerializer):
         )
 
 
-class PurchaseSerializer(serializers.ModelSerializer):
+class LineItemSerializer(serializers.Serializer):
+    product = serializers.UUIDField(source="product_id")
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    unit_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, min_value=0, required=False
+    )
+    discount = serializers.DecimalField(
+        max_digits=12, decimal_places=2, min_value=0, default=Decimal("0")
+    )
+    tax_rate = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False
+    )
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        # a PATCH skips field defaults, but its lines replace the old ones
+        # whole and need them like the lines of a create
+        for field in self._writable_fields:
+            if field.source not in value and field.default is not empty:
+                value[field.source] = field.default
+        return value
+
+
+class LineItemsSerializer(serializers.ModelSerializer):
+    """
+    Base for orders written with their lines in one payload. All lines are
+    checked against a single product lookup and stored with one bulk_create
+    in the same transaction as the order.
+    """
+
+    items = LineItemSerializer(many=True, required=False)
+
+    item_model = None
+    item_parent_field = None
+    # product field used when a line does not give its own unit price
+    default_price_field = None
+
+    def validate_items(self, items):
+        if not items:
+            raise serializers.ValidationError("Add at least one line.")
+        product_ids = {item["product_id"] for item in items}
+        products = Product.objects.only(
+            "id", "product_price", "unit_price", "product_tax"
+        ).in_bulk(product_ids)
+        missing = product_ids - set(products)
+        if missing:
+            raise serializers.ValidationError(
+                f"Unknown products: {', '.join(sorted(map(str, missing)))}"
+            )
+
+        for item in items:
+            product = products[item.pop("product_id")]
+            item["product"] = product
+            if item.get("unit_price") is None:
+                item["unit_price"] = Decimal(str(getattr(product, self.default_price_field)))
+            if item.get("tax_rate") is None:
+                item["tax_rate"] = Decimal(product.product_tax)
+            if item["discount"] > item["quantity"] * item["unit_price"]:
+                raise serializers.ValidationError(
+                    {product.product_name: "Discount is greater than the line amount."}
+                )
+        return items
+
+    def validate(self, data):
+        if self.instance is None and "items" not in data:
+            raise serializers.ValidationError({"items": "This field is required."})
+        return data
+
+    def write_items(self, instance, items):
+        self.item_model.objects.bulk_create(
+            [self.item_model(**{self.item_parent_field: instance}, **item) for item in items]
+        )
+
+    def create(self, validated_data):
+        items = validated_data.pop("items")
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            self.write_items(instance, items)
+        return instance
+
+    def update(self, instance, validated_data):
+        items = validated_data.pop("items", None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if items is not None:
+                instance.items.all().delete()
+                self.write_items(instance, items)
+        return instance
+
+
+class PurchaseSerializer(LineItemsSerializer):
+    item_model = PurchaseItem
+    item_parent_field = "purchase"
+    default_price_field = "product_price"
+
     class Meta:
         model = Purchase
         fields = [
@@ -169,26 +305,31 @@ class PurchaseSerializer(serializers.ModelSerializer):
             "warehouse",
             "supplier",
             "product",
+            "items",
             "order_tax",
             "order_discount",
             "shipping",
             "sales_status",
             "purchase_note",
         ]
+        read_only_fields = ["product"]
 
 
 class GetPurchaseSerializer(serializers.ModelSerializer):
-    warehouse = WarehouseSerializer()
+    warehouse = CachedRelatedField(WarehouseSerializer)
     supplier = SupplierSerializer()
     product = ProductSerializer(many=True)
+    items = LineItemSerializer(many=True)
 
     class Meta:
         model = Purchase
+        list_serializer_class = CachedRelatedListSerializer
         fields = [
             "id",
             "warehouse",
             "supplier",
             "product",
+            "items",
             "order_tax",
             "order_discount",
             "shipping",
@@ -197,7 +338,11 @@ class GetPurchaseSerializer(serializers.ModelSerializer):
         ]
 
 
-class SalesSerializer(serializers.ModelSerializer):
+class SalesSerializer(LineItemsSerializer):
+    item_model = SalesItem
+    item_parent_field = "sales"
+    default_price_field = "unit_price"
+
     class Meta:
         model = Sales
         fields = [
@@ -206,6 +351,7 @@ class SalesSerializer(serializers.ModelSerializer):
             "warehouse",
             "biller",
             "product",
+            "items",
             "sales_tax",
             "discount",
             "shipping",
@@ -215,23 +361,36 @@ class SalesSerializer(serializers.ModelSerializer):
             "sales_note",
             "staff_remark",
         ]
+        read_only_fields = ["product"]
+
+
+INVOICE_TOTAL_FIELDS = [
+    "number",
+    "subtotal",
+    "discount_total",
+    "tax_total",
+    "shipping_total",
+    "grand_total",
+]
 
 
 class PurchaseInvoiceSerializer(serializers.ModelSerializer):
     
-    purchases = PurchaseSerializer(many=True)
+    purchases = PurchaseSerializer()
     
     class Meta:
         model = PurchaseInvoice
-        fields = ['id', 'purchases']
+        fields = ['id', 'purchases'] + INVOICE_TOTAL_FIELDS
+        read_only_fields = INVOICE_TOTAL_FIELDS
     
 class SalesInvoiceSerializer(serializers.ModelSerializer):
     
-    sales = SalesSerializer(many=True)
+    sales = SalesSerializer()
     
     class Meta:
         model = SalesInvoice
-        fields = ['id', 'sales']
+        fields = ['id', 'sales'] + INVOICE_TOTAL_FIELDS
+        read_only_fields = INVOICE_TOTAL_FIELDS
         
         
 class AdjustmentSerializer(serializers.ModelSerializer):
@@ -241,27 +400,68 @@ class AdjustmentSerializer(serializers.ModelSerializer):
 
 
 class AdjustmentItemsSerializer(serializers.ModelSerializer):
-    quantity = serializers.IntegerField(write_only=True)
+    quantity = serializers.IntegerField(write_only=True, min_value=1)
 
     class Meta:
         model = AdjustmentItems
         fields = ["id", "adjustment", "product", "quantity", "type"]
 
-    def validate(self, data):
-        product = data.get("product")
-        type = data.get("type")
-        quantity = data.pop("quantity")
-        if type == "Subtraction" and product.stock_alert < quantity:
-            raise serializers.ValidationError(
-                {product.product_name: "Quantity is greater than stock"}
-            )
-        elif type == "Addition":
-            product.stock_alert += int(quantity)
-        else:
-            product.stock_alert -= int(quantity)
-        product.save()
 
+class StockSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Stock
+        fields = [
+            "id",
+            "product",
+            "warehouse",
+            "quantity",
+            "alert_quantity",
+            "modified_on",
+        ]
+
+
+class StockValuationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockValuation
+        fields = [
+            "id",
+            "product",
+            "warehouse",
+            "quantity",
+            "fifo_value",
+            "average_value",
+            "modified_on",
+        ]
+
+
+class ValuationQuerySerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=VALUATION_METHOD, default="FIFO")
+    warehouse = serializers.PrimaryKeyRelatedField(
+        queryset=Warehouse.objects.all(), required=False
+    )
+    product = serializers.PrimaryKeyRelatedField(
+        queryset=Product.objects.all(), required=False
+    )
+
+
+class CostOfGoodsSoldQuerySerializer(ValuationQuerySerializer):
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+
+    def validate(self, data):
+        if data["start"] >= data["end"]:
+            raise serializers.ValidationError({"end": "End must be after start."})
         return data
 
 
+class SalesReportQuerySerializer(serializers.Serializer):
+    dimension = serializers.ChoiceField(choices=ROLLUP_DIMENSION)
+    start = serializers.DateField()
+    end = serializers.DateField()
+    interval = serializers.ChoiceField(choices=REPORT_INTERVAL, default="month")
+    key = serializers.CharField(required=False)
 
+    def validate(self, data):
+        if data["start"] > data["end"]:
+            raise serializers.ValidationError({"end": "End must not be before start."})
+        return data
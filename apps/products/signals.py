@@ -0,0 +1,122 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.products.invoice_totals import PURCHASE, SALES, invalidate
+from apps.products.models import (
+    Brand,
+    Category,
+    Product,
+    Purchase,
+    PurchaseInvoice,
+    PurchaseItem,
+    Sales,
+    SalesInvoice,
+    SalesItem,
+    Unit,
+)
+from apps.products.low_stock import stock_links, sync_alert_quantity
+from apps.products.rollups import remove_sale, schedule_rollup
+from apps.products.search import update_search_vectors
+from apps.store.models import Warehouse
+from utils.conditional import count_delete, count_m2m_change
+from utils.reference_cache import invalidate_reference
+
+
+@receiver(post_save, sender=Product)
+def product_search_vector(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_vectors(product_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def product_stock_alert(sender, instance, created=False, raw=False, **kwargs):
+    if not (created or raw):
+        sync_alert_quantity(instance)
+
+
+@receiver(m2m_changed, sender=Product.warehouse.through)
+def product_warehouse_stock(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:
+        products = Product.objects.filter(pk__in=pk_set).only("id", "stock_alert")
+        stock_links((product, instance.pk) for product in products)
+    else:
+        stock_links((instance, warehouse_id) for warehouse_id in pk_set)
+
+
+@receiver(post_save, sender=Brand)
+def brand_search_vector(sender, instance, created=False, raw=False, **kwargs):
+    if not (created or raw):
+        update_search_vectors(brand_id=instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def category_search_vector(sender, instance, created=False, raw=False, **kwargs):
+    if not (created or raw):
+        update_search_vectors(category_id=instance.pk)
+
+
+# orders are saved whenever their lines are written through the serializers,
+# so they also cover lines added with bulk_create
+@receiver(post_save, sender=Purchase)
+def purchase_invoice_totals(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(PURCHASE, [instance.pk])
+
+
+@receiver(post_save, sender=Sales)
+def sales_invoice_totals(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(SALES, [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=PurchaseItem)
+def purchase_item_invoice_totals(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(PURCHASE, [instance.purchase_id])
+
+
+@receiver([post_save, post_delete], sender=SalesItem)
+def sales_item_invoice_totals(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(SALES, [instance.sales_id])
+
+
+@receiver(post_save, sender=PurchaseInvoice)
+def purchase_invoice_created(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and instance.purchases_id:
+        invalidate(PURCHASE, [instance.purchases_id])
+
+
+@receiver(post_save, sender=SalesInvoice)
+def sales_invoice_created(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and instance.sales_id:
+        invalidate(SALES, [instance.sales_id])
+
+
+@receiver(post_save, sender=Sales)
+def sales_rollup(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_rollup([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=SalesItem)
+def sales_item_rollup(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_rollup([instance.sales_id])
+
+
+@receiver(pre_delete, sender=Sales)
+def deleted_sales_rollup(sender, instance, **kwargs):
+    remove_sale(instance.pk)
+
+
+for model in (Brand, Category, Unit, Warehouse):
+    post_save.connect(invalidate_reference, sender=model)
+    post_delete.connect(invalidate_reference, sender=model)
+
+
+for model in (Brand, Category, Unit, Product, Warehouse):
+    post_delete.connect(count_delete, sender=model)
+m2m_changed.connect(count_m2m_change, sender=Product.warehouse.through)
@@ -0,0 +1,162 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.products.models import Stock
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product, warehouse, quantity):
+        self.product = product
+        self.warehouse = warehouse
+        self.quantity = quantity
+        super().__init__(
+            f"Cannot remove {quantity} of {product} from {warehouse}, not enough stock"
+        )
+
+
+def get_quantity(product, warehouse):
+    return (
+        Stock.objects.filter(product=product, warehouse=warehouse)
+        .values_list("quantity", flat=True)
+        .first()
+        or 0
+    )
+
+
+def add_stock(product, warehouse, quantity):
+    """
+    Atomically adds `quantity` to the (product, warehouse) row, creating it on
+    first use. Concurrent callers never lose each other's updates.
+    """
+    with transaction.atomic():
+        updated = Stock.objects.filter(product=product, warehouse=warehouse).update(
+            quantity=F("quantity") + quantity, modified_on=timezone.now()
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                Stock.objects.create(
+                    product=product,
+                    warehouse=warehouse,
+                    quantity=quantity,
+                    alert_quantity=product.stock_alert,
+                )
+        except IntegrityError:
+            # another transaction created the row first, add on top of it
+            Stock.objects.filter(product=product, warehouse=warehouse).update(
+                quantity=F("quantity") + quantity, modified_on=timezone.now()
+            )
+
+
+def remove_stock(product, warehouse, quantity):
+    """
+    Atomically removes `quantity` if, and only if, that much is in stock.
+    The check and the decrement are one conditional UPDATE, so there is no
+    window for another writer to drive the quantity negative.
+    """
+    updated = Stock.objects.filter(
+        product=product, warehouse=warehouse, quantity__gte=quantity
+    ).update(quantity=F("quantity") - quantity, modified_on=timezone.now())
+    if not updated:
+        raise InsufficientStock(product, warehouse, quantity)
+
+
+def _totals(movements):
+    """
+    {product: quantity} of (product, quantity) pairs, a product listed twice
+    moves once with the sum.
+    """
+    totals = {}
+    for product, quantity in movements:
+        totals[product] = totals.get(product, 0) + quantity
+    return totals
+
+
+def _move(warehouse, totals, sign, checked):
+    """
+    Moves every product of `totals` with one UPDATE ... FROM unnest(...),
+    returns the ids of the rows it changed. `checked` only changes rows that
+    hold at least the quantity moved.
+    """
+    table = connection.ops.quote_name(Stock._meta.db_table)
+    condition = "AND stock.quantity >= moved.quantity" if checked else ""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS stock
+            SET quantity = stock.quantity {sign} moved.quantity, modified_on = %s
+            FROM unnest(%s::uuid[], %s::integer[]) AS moved(product_id, quantity)
+            WHERE stock.warehouse_id = %s
+              AND stock.product_id = moved.product_id {condition}
+            RETURNING stock.product_id
+            """,
+            [
+                timezone.now(),
+                [str(product.pk) for product in totals],
+                list(totals.values()),
+                warehouse.pk,
+            ],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def add_stock_many(warehouse, movements):
+    """
+    add_stock for many (product, quantity) pairs of one warehouse: missing
+    rows are created in one INSERT and all of them moved in one UPDATE.
+    """
+    totals = _totals(movements)
+    if not totals:
+        return
+    with transaction.atomic():
+        Stock.objects.bulk_create(
+            [
+                Stock(
+                    product=product,
+                    warehouse=warehouse,
+                    quantity=0,
+                    alert_quantity=product.stock_alert,
+                )
+                for product in totals
+            ],
+            ignore_conflicts=True,
+        )
+        _move(warehouse, totals, "+", checked=False)
+
+
+def remove_stock_many(warehouse, movements):
+    """
+    remove_stock for many (product, quantity) pairs of one warehouse, in one
+    conditional UPDATE. Raises InsufficientStock for the first product that
+    is short, and then moves nothing.
+    """
+    totals = _totals(movements)
+    if not totals:
+        return
+    with transaction.atomic():
+        moved = _move(warehouse, totals, "-", checked=True)
+        for product, quantity in totals.items():
+            if product.pk not in moved:
+                raise InsufficientStock(product, warehouse, quantity)
+
+
+def apply_adjustment(item):
+    warehouse = item.adjustment.warehouse
+    if item.type == "Addition":
+        add_stock(item.product, warehouse, item.quantity)
+    else:
+        remove_stock(item.product, warehouse, item.quantity)
+
+
+def reverse_adjustment(item):
+    """
+    Undoes the movement of an applied adjustment item, before it is edited or
+    deleted. Raises InsufficientStock when the stock it added is gone.
+    """
+    warehouse = item.adjustment.warehouse
+    if item.type == "Addition":
+        remove_stock(item.product, warehouse, item.quantity)
+    else:
+        add_stock(item.product, warehouse, item.quantity)
@@ -0,0 +1,14 @@
+from apps.products.barcodes import generate_barcodes
+from apps.products.models import Product
+from apps.tasks.queue import register
+
+
+@register("barcodes.generate")
+def generate_queued_barcodes(payload):
+    """
+    Labels one chunk queued by apps.products.barcodes.queue_barcodes.
+    """
+    products = Product.objects.only("id", "product_code").filter(
+        id__in=payload["products"]
+    )
+    generate_barcodes(products, payload["papersize"])
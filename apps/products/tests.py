@@ -1,3 +1,1840 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from apps.accounts.models import Biller, Customer, User, Supplier
+from apps.products.barcodes import render_barcode, render_barcodes
+from apps.products.models import (
+    Adjustment,
+    Barcode,
+    Brand,
+    Category,
+    Unit,
+    Product,
+    CostLayer,
+    Purchase,
+    PurchaseInvoice,
+    Sales,
+    SalesInvoice,
+    SalesItem,
+    SalesRollup,
+    PurchaseItem,
+    Stock,
+    StockValuation,
+)
+from apps.products.imports import ProductImporter
+from apps.products.invoice_totals import PURCHASE, recompute_totals
+from apps.products.low_stock import low_stock, reorder_suggestions
+from apps.products.management.commands.benchmark_endpoints import (
+    Command as BenchmarkEndpointsCommand,
+)
+from apps.products.rollups import rebuild_rollups
+from apps.products.search import search_products, update_search_vectors
+from apps.products.serializers import GETProductSerializer, ProductSerializer
+from apps.products.stock import (
+    InsufficientStock,
+    add_stock,
+    get_quantity,
+    remove_stock,
+)
+from apps.products.valuation import (
+    cost_of_goods_sold,
+    inventory_value,
+    issue,
+    delete_order,
+    rebuild_valuation,
+    receive,
+    record_purchase,
+    record_sale,
+    update_order,
+    valuation_drift,
+)
+from apps.products.views import ProductViewSet, PurchaseViewSet
+from apps.store.models import Warehouse
+from apps.tasks.models import Task
+from apps.tasks.queue import work
+from apps.accounts.views import CustomerViewSet
+from config.urls import router
+from utils.audit import AuditContextMiddleware, audit_context, current_user
+from utils.benchmarks import compare, percentile
+from utils.diagnostics import (
+    QueryBudgetExceeded,
+    QueryDiagnosticsMiddleware,
+    fingerprint,
+)
+from utils.lazy import LazyModule, lazy_import
+from utils.numbering import PRODUCT_CODE
+from utils.paginations import KeysetPagination
+from utils.reference_cache import (
+    ReferenceCache,
+    boot_warm_up,
+    reference_cache,
+    warm_up,
+)
+from utils.transactions import queue_on_commit
+
+
+def create_user(index=0):
+    return User.objects.create_user(
+        email=f"user{index}@example.com",
+        password="secret-pass-123",
+        full_name=f"User {index}",
+        username=f"user{index}",
+        phone=f"+97798000000{index:02d}",
+    )
+
+
+def create_products(count, user, warehouses):
+    brand = Brand.objects.create(brand_name="Brand", created_by=user)
+    category = Category.objects.create(
+        main_category="Main", sub_category="Sub", created_by=user
+    )
+    unit = Unit.objects.create(unit_name="Piece", short_name="pc", created_by=user)
+    products = Product.objects.bulk_create(
+        [
+            Product(
+                product_name=f"Product {index}",
+                product_type="Food",
+                category=category,
+                product_code=code,
+                brand=brand,
+                barcode=str(index),
+                product_unit=unit,
+                product_price=10,
+                expense=1,
+                unit_price=12,
+                product_tax="13",
+                tax_method="Exclusive",
+                discount=0,
+                stock_alert=5,
+                user=user,
+                created_by=user,
+                modified_by=user,
+            )
+            for index, code in enumerate(PRODUCT_CODE.allocate_many(count))
+        ]
+    )
+    for product in products:
+        product.warehouse.set(warehouses)
+    return products
+
+
+class QueryPlanTestCase(TestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.user = create_user()
+        self.warehouses = [
+            Warehouse.objects.create(
+                name=f"Warehouse {index}",
+                phone=f"+97798100000{index:02d}",
+                email=f"warehouse{index}@example.com",
+            )
+            for index in range(3)
+        ]
+
+    def get_view(self, viewset_class, action, **kwargs):
+        view = viewset_class(action=action, format_kwarg=None, kwargs=kwargs)
+        view.request = Request(self.factory.get("/"))
+        return view
+
+    def count_list_queries(self, viewset_class):
+        view = self.get_view(viewset_class, "list")
+        # warm the reference data cache, its misses are not per row
+        view.get_serializer(view.get_queryset(), many=True).data
+        with CaptureQueriesContext(connection) as context:
+            view.get_serializer(view.get_queryset(), many=True).data
+        return len(context)
+
+    def count_retrieve_queries(self, viewset_class, pk):
+        view = self.get_view(viewset_class, "retrieve", pk=pk)
+        view.get_serializer(view.get_queryset().get(pk=pk)).data
+        with CaptureQueriesContext(connection) as context:
+            view.get_serializer(view.get_queryset().get(pk=pk)).data
+        return len(context)
+
+    def test_product_list_queries_are_flat(self):
+        create_products(1, self.user, self.warehouses)
+        single = self.count_list_queries(ProductViewSet)
+        create_products(99, self.user, self.warehouses)
+        self.assertEqual(self.count_list_queries(ProductViewSet), single)
+        self.assertLessEqual(single, 2)
+
+    def test_product_retrieve_loads_nested_relations_up_front(self):
+        product = create_products(1, self.user, self.warehouses)[0]
+        self.assertEqual(self.count_retrieve_queries(ProductViewSet, product.pk), 2)
+
+    def test_purchase_queries_are_flat(self):
+        supplier = Supplier.objects.create(
+            user=self.user, supplier_code=1, company="Supplier"
+        )
+
+        def create_purchases(count):
+            products = create_products(5, self.user, self.warehouses)
+            for _ in range(count):
+                purchase = Purchase.objects.create(
+                    warehouse=self.warehouses[0],
+                    supplier=supplier,
+                    order_tax="13",
+                    order_discount=0,
+                    shipping=0,
+                    sales_status="Complete",
+                    purchase_note="",
+                )
+                purchase.product.set(products, through_defaults={"unit_price": 10})
+            return purchase
+
+        purchase = create_purchases(1)
+        single = self.count_list_queries(PurchaseViewSet)
+        retrieve = self.count_retrieve_queries(PurchaseViewSet, purchase.pk)
+        purchase = create_purchases(99)
+        self.assertEqual(self.count_list_queries(PurchaseViewSet), single)
+        self.assertEqual(
+            self.count_retrieve_queries(PurchaseViewSet, purchase.pk), retrieve
+        )
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = create_user()
+        create_products(25, user, [])
+        # identical timestamps force the id tiebreaker to do the work
+        Product.objects.update(created_on=timezone.now())
+
+    def collect(self, url, link):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row["id"] for row in response.data["results"])
+            url = response.data[link]
+        return ids, response
+
+    def test_pages_cover_every_row_once(self):
+        ids, response = self.collect("/api/products/?page_size=10", "next")
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+        self.assertEqual(
+            ids, [str(pk) for pk in Product.objects.order_by("-id").values_list("id", flat=True)]
+        )
+
+        previous, _ = self.collect(response.data["previous"], "previous")
+        self.assertEqual(len(previous), 20)
+        self.assertEqual(set(previous), set(ids[:20]))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get("/api/products/?cursor=cD1ub3QtYS1wb3NpdGlvbg==")
+        self.assertEqual(response.status_code, 404)
+
+    def test_keyset_viewsets_do_not_advertise_ordering(self):
+        # the keyset ignores ?ordering=, no viewset paged by it may offer one
+        for prefix, viewset, basename in router.registry:
+            pagination_class = getattr(viewset, "pagination_class", None)
+            if not (pagination_class and issubclass(pagination_class, KeysetPagination)):
+                continue
+            with self.subTest(basename):
+                self.assertNotIn(OrderingFilter, viewset.filter_backends)
+                self.assertFalse(getattr(viewset, "ordering_fields", None))
+
+
+class ProductSearchTestCase(TestCase):
+    def setUp(self):
+        products = create_products(3, create_user(), [])
+        names = ["Coca Cola 500ml", "Cocoa Powder", "Green Tea"]
+        for product, name in zip(products, names):
+            product.product_name = name
+        Product.objects.bulk_update(products, ["product_name"])
+        Product.objects.filter(pk=products[2].pk).update(barcode="8901234567890")
+        update_search_vectors()
+
+    def search(self, term):
+        return list(
+            search_products(Product.objects.all(), term).values_list(
+                "product_name", flat=True
+            )
+        )
+
+    def test_prefix_words_match(self):
+        self.assertEqual(self.search("coca co"), ["Coca Cola 500ml"])
+
+    def test_barcode_and_brand_are_searchable(self):
+        self.assertEqual(self.search("8901234567890"), ["Green Tea"])
+        self.assertEqual(len(self.search("brand")), 3)
+
+    def test_typos_fall_back_to_trigram_similarity(self):
+        self.assertEqual(self.search("Coka Cola")[0], "Coca Cola 500ml")
+
+    def test_search_parameter_uses_the_index(self):
+        response = APIClient().get("/api/products/?search=cocoa")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["product_name"] for row in response.data["results"]], ["Cocoa Powder"]
+        )
+
+    def test_brand_rename_refreshes_its_products(self):
+        Brand.objects.update(brand_name="Acme")
+        brand = Brand.objects.get()
+        brand.save()
+        self.assertEqual(len(self.search("acme")), 3)
+
+
+class BarcodeCacheTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch("apps.products.barcodes.BARCODE_DIRECTORY", directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = directory.name
+        self.user = create_user()
+
+    def test_repeat_renders_reuse_the_file(self):
+        path = render_barcode("12345", "50")
+        with mock.patch("apps.products.barcodes.barcode.get_barcode_class") as get_class:
+            self.assertEqual(render_barcode("12345", "50"), path)
+        get_class.assert_not_called()
+        self.assertNotEqual(render_barcode("12345", "30"), path)
+
+    def test_batch_render_in_process_pool(self):
+        paths = render_barcodes(range(20), "40", processes=2)
+        self.assertEqual(len(paths), 20)
+        self.assertTrue(all(os.path.exists(path) for path in paths.values()))
+        self.assertEqual(len(os.listdir(self.directory)), 20)
+
+    def test_batch_endpoint_labels_a_warehouse(self):
+        warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        products = create_products(5, self.user, [warehouse])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            "/api/barcodes/batch/",
+            {"warehouse": str(warehouse.pk), "papersize": "50"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["data"]), 5)
+
+        call_command("generate_barcodes", "--papersize", "30", "--all", stdout=StringIO())
+        self.assertEqual(Barcode.objects.count(), len(products))
+        self.assertEqual(set(Barcode.objects.values_list("papersize", flat=True)), {"30"})
+
+    def test_large_batches_are_queued(self):
+        warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        products = create_products(5, self.user, [warehouse])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch("apps.products.views.BATCH_INLINE_LIMIT", 2), mock.patch(
+            "apps.products.barcodes.BATCH_CHUNK_SIZE", 3
+        ):
+            response = client.post(
+                "/api/barcodes/batch/",
+                {"warehouse": str(warehouse.pk), "papersize": "40"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {"queued": 5, "tasks": 2})
+        self.assertFalse(Barcode.objects.exists())
+
+        self.assertEqual(work(), 2)
+        self.assertEqual(Barcode.objects.count(), len(products))
+        self.assertFalse(Task.objects.exists())
+
+
+class ProductImportTestCase(TestCase):
+    header = (
+        "product_name,product_type,category,product_code,brand,barcode,"
+        "product_unit,product_price,expense,unit_price,product_tax,tax_method,"
+        "stock_alert,warehouse\n"
+    )
+
+    def setUp(self):
+        self.user = create_user()
+        self.user.is_staff = True
+        self.user.save()
+        Brand.objects.create(brand_name="Acme")
+        Category.objects.create(main_category="Drinks", sub_category="Soda")
+        Unit.objects.create(unit_name="Piece", short_name="pc")
+        for index, name in enumerate(["North", "South"]):
+            Warehouse.objects.create(
+                name=name, phone=f"+97798100000{index:02d}", email=f"{name}@example.com"
+            )
+
+    def test_csv_upload_reports_bad_rows(self):
+        rows = "".join(
+            f"Soda {index},Food,drinks,{index},Acme,{index},pc,1,0.1,1.5,13,Exclusive,5,North|South\n"
+            for index in range(30)
+        )
+        rows += "Bad,Food,Nope,1,Acme,1,pc,1,0.1,1.5,13,Exclusive,5,\n"
+        upload = SimpleUploadedFile("catalog.csv", (self.header + rows).encode())
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        # lookups, taken codes, creating and advancing the code sequence,
+        # product, link and empty stock inserts, search vectors
+        with self.assertNumQueries(16):
+            response = client.post("/api/products/import/", {"file": upload})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 30)
+        self.assertEqual(response.data["errors"][0]["row"], 31)
+        self.assertIn("category", response.data["errors"][0]["errors"])
+        self.assertEqual(Product.warehouse.through.objects.count(), 60)
+        self.assertEqual(Product.objects.filter(created_by=self.user).count(), 30)
+
+    def test_blank_optional_cells_take_their_defaults(self):
+        header = self.header.replace("warehouse\n", "warehouse,discount,featured\n")
+        rows = (
+            "Soda,Food,drinks,,Acme,1,pc,1,0.1,1.5,13,Exclusive,5,North,,\n"
+            "Cola,Food,drinks,,Acme,2,pc,1,0.1,1.5,13,Exclusive,5,,2.5,true\n"
+            "Tea,Food,drinks,,Acme,3,pc,,0.1,1.5,13,Exclusive,5,,,\n"
+        )
+        upload = SimpleUploadedFile("catalog.csv", (header + rows).encode())
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post("/api/products/import/", {"file": upload})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        # a blank required cell is reported as missing
+        self.assertEqual(response.data["errors"][0]["row"], 3)
+        self.assertIn("product_price", response.data["errors"][0]["errors"])
+        soda, cola = Product.objects.order_by("barcode")
+        self.assertEqual((soda.discount, soda.featured), (0, False))
+        self.assertEqual((cola.discount, cola.featured), (2.5, True))
+        # blank codes are allocated, one each
+        self.assertIsNotNone(soda.product_code)
+        self.assertNotEqual(soda.product_code, cola.product_code)
+        self.assertEqual(soda.warehouse.count(), 1)
+        self.assertEqual(cola.warehouse.count(), 0)
+
+    def test_taken_codes_are_reported(self):
+        Product.objects.create(
+            product_name="Old",
+            product_type="Food",
+            category=Category.objects.get(),
+            product_code=7,
+            brand=Brand.objects.get(),
+            barcode="0",
+            product_unit=Unit.objects.get(),
+            product_price=1,
+            expense=0,
+            unit_price=1,
+            product_tax="13",
+            tax_method="Exclusive",
+            discount=0,
+            stock_alert=1,
+        )
+        rows = (
+            "Soda,Food,drinks,7,Acme,1,pc,1,0.1,1.5,13,Exclusive,5,\n"
+            "Cola,Food,drinks,9,Acme,2,pc,1,0.1,1.5,13,Exclusive,5,\n"
+            "Tea,Food,drinks,9,Acme,3,pc,1,0.1,1.5,13,Exclusive,5,\n"
+            "Mate,Food,drinks,,Acme,4,pc,1,0.1,1.5,13,Exclusive,5,\n"
+        )
+        importer = ProductImporter(self.user)
+        report = importer.run(csv.DictReader(StringIO(self.header + rows)))
+
+        self.assertEqual(report["created"], 2)
+        self.assertEqual([error["row"] for error in report["errors"]], [1, 3])
+        self.assertIn("product_code", report["errors"][0]["errors"])
+        # the code left blank comes after the ones given by hand
+        self.assertEqual(Product.objects.get(product_name="Mate").product_code, 10)
+
+    def test_unknown_format_is_rejected(self):
+        upload = SimpleUploadedFile("catalog.xlsx", self.header.encode())
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            "/api/products/import/", {"file": upload, "file_format": "xlsx"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("file_format", response.data)
+        self.assertFalse(Product.objects.exists())
+
+    def test_jsonl_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as fileobj:
+            self.addCleanup(os.unlink, fileobj.name)
+            fileobj.write(
+                '{"product_name": "Soda", "product_type": "Food", "category": "Drinks", '
+                '"product_code": 1, "brand": "Acme", "barcode": "1", "product_unit": "Piece", '
+                '"product_price": 1, "expense": 0, "unit_price": 1, "product_tax": "13", '
+                '"tax_method": "Exclusive", "stock_alert": 1, "warehouse": ["North"]}\n'
+                "not json\n"
+            )
+        stderr = StringIO()
+        call_command(
+            "import_products",
+            fileobj.name,
+            "--chunk-size",
+            "1",
+            stdout=StringIO(),
+            stderr=stderr,
+        )
+        self.assertEqual(Product.objects.get().warehouse.get().name, "North")
+        self.assertIn("row 2", stderr.getvalue())
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.user.is_staff = True
+        self.user.save()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.products = create_products(30, self.user, [self.warehouse])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export_streams_every_row(self):
+        with mock.patch("utils.exports.ExportMixin.export_chunk_size", 7):
+            content = self.read(self.client.get("/api/products/export/"))
+        lines = content.splitlines()
+        self.assertEqual(len(lines), 31)
+        self.assertTrue(lines[0].startswith("id,product_name"))
+        self.assertIn(str(self.warehouse.pk), lines[1])
+
+    def test_ndjson_export_honours_list_filters(self):
+        other = create_user(1)
+        Product.objects.filter(pk=self.products[0].pk).update(created_by=other)
+        response = self.client.get(
+            f"/api/products/export/?export_format=ndjson&created_by={other.pk}"
+        )
+        rows = self.read(response).splitlines()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(json.loads(rows[0])["id"], str(self.products[0].pk))
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get("/api/sales/export/?export_format=xml")
+        self.assertEqual(response.status_code, 400)
+
+
+class StockTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.product = create_products(1, self.user, [self.warehouse])[0]
+
+    def run_concurrently(self, target, count):
+        results = []
+
+        def worker():
+            try:
+                target()
+                results.append(True)
+            except InsufficientStock:
+                results.append(False)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_additions_are_not_lost(self):
+        self.run_concurrently(lambda: add_stock(self.product, self.warehouse, 2), 20)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 40)
+        self.assertEqual(Stock.objects.count(), 1)
+
+    def test_concurrent_removals_never_oversell(self):
+        add_stock(self.product, self.warehouse, 10)
+        results = self.run_concurrently(
+            lambda: remove_stock(self.product, self.warehouse, 1), 25
+        )
+        self.assertEqual(results.count(True), 10)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 0)
+
+    def test_concurrent_saves_record_a_purchase_once(self):
+        supplier = Supplier.objects.create(
+            user=self.user, supplier_code=1, company="Supplier"
+        )
+        purchase = Purchase.objects.create(
+            warehouse=self.warehouse,
+            supplier=supplier,
+            order_tax="13",
+            order_discount=0,
+            shipping=0,
+            sales_status="Complete",
+            purchase_note="",
+        )
+        PurchaseItem.objects.create(
+            purchase=purchase, product=self.product, quantity=3, unit_price=2
+        )
+        recorded = []
+        self.run_concurrently(
+            lambda: recorded.append(record_purchase(Purchase.objects.get(pk=purchase.pk))),
+            8,
+        )
+        self.assertEqual(recorded.count(True), 1)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 3)
+        self.assertEqual(CostLayer.objects.count(), 1)
+
+    def test_database_rejects_negative_quantity(self):
+        with self.assertRaises(IntegrityError):
+            Stock.objects.create(product=self.product, warehouse=self.warehouse, quantity=-1)
+
+    def test_adjustment_endpoint_moves_stock(self):
+        self.user.is_staff = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        adjustment = Adjustment.objects.create(warehouse=self.warehouse)
+        payload = {"adjustment": str(adjustment.pk), "product": str(self.product.pk)}
+
+        response = client.post(
+            "/api/adjustment-items/", {**payload, "type": "Addition", "quantity": 5}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = client.post(
+            "/api/adjustment-items/", {**payload, "type": "Subtraction", "quantity": 6}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 5)
+        self.assertEqual(adjustment.products_adjustmentitems_adjustment.count(), 1)
+
+    def test_editing_and_deleting_items_moves_stock_back(self):
+        self.user.is_staff = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        adjustment = Adjustment.objects.create(warehouse=self.warehouse)
+        payload = {"adjustment": str(adjustment.pk), "product": str(self.product.pk)}
+        add_stock(self.product, self.warehouse, 10)
+        item = client.post(
+            "/api/adjustment-items/", {**payload, "type": "Addition", "quantity": 5}
+        ).data["data"]
+        self.assertEqual(get_quantity(self.product, self.warehouse), 15)
+
+        response = client.put(
+            f"/api/adjustment-items/{item['id']}/",
+            {**payload, "type": "Subtraction", "quantity": 3},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 7)
+
+        # undoing the subtraction and removing 20 would oversell
+        response = client.put(
+            f"/api/adjustment-items/{item['id']}/",
+            {**payload, "type": "Subtraction", "quantity": 20},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 7)
+
+        response = client.delete(f"/api/adjustment-items/{item['id']}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 10)
+
+        client.post("/api/adjustment-items/", {**payload, "type": "Addition", "quantity": 4})
+        self.assertEqual(get_quantity(self.product, self.warehouse), 14)
+        response = client.delete(f"/api/adjustment/{adjustment.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 10)
+
+
+class ValuationTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.product = create_products(1, self.user, [self.warehouse])[0]
+        self.now = timezone.now()
+
+    def receive(self, quantity, unit_cost, days_ago):
+        receive(
+            self.product.pk,
+            self.warehouse.pk,
+            quantity,
+            unit_cost,
+            received_on=self.now - timedelta(days=days_ago),
+        )
+
+    def test_fifo_and_average_costs(self):
+        self.receive(10, "2", days_ago=3)
+        self.receive(10, "4", days_ago=2)
+        issue(self.product.pk, self.warehouse.pk, 15, issued_on=self.now)
+
+        start, end = self.now - timedelta(days=1), self.now + timedelta(days=1)
+        fifo = cost_of_goods_sold(start, end, method="FIFO")
+        average = cost_of_goods_sold(start, end, method="Average")
+        self.assertEqual(fifo["cost"], Decimal("40"))
+        self.assertEqual(average["cost"], Decimal("45"))
+
+        self.assertEqual(inventory_value(method="FIFO")["value"], Decimal("20"))
+        self.assertEqual(inventory_value(method="Average")["value"], Decimal("15"))
+        self.assertEqual(inventory_value()["quantity"], 5)
+        self.assertEqual(
+            list(CostLayer.objects.order_by("received_on").values_list("remaining", flat=True)),
+            [0, 5],
+        )
+
+    def test_untracked_stock_uses_fallback_cost(self):
+        self.receive(2, "5", days_ago=1)
+        issue(self.product.pk, self.warehouse.pk, 3, fallback_cost=7)
+        valuation = StockValuation.objects.get()
+        self.assertEqual(valuation.quantity, 0)
+        self.assertEqual(valuation.fifo_value, 0)
+        totals = cost_of_goods_sold(self.now - timedelta(days=1), self.now + timedelta(days=1))
+        self.assertEqual(totals["cost"], Decimal("17"))
+
+    def test_value_is_read_without_replaying_history(self):
+        for days_ago in range(20):
+            self.receive(1, "1", days_ago=days_ago)
+        with self.assertNumQueries(1):
+            inventory_value(warehouse=self.warehouse)
+
+    def test_purchases_are_recorded_once_and_rebuilt(self):
+        supplier = Supplier.objects.create(
+            user=self.user, supplier_code=1, company="Supplier"
+        )
+        purchase = Purchase.objects.create(
+            warehouse=self.warehouse,
+            supplier=supplier,
+            order_tax="13",
+            order_discount=0,
+            shipping=0,
+            sales_status="Complete",
+            purchase_note="",
+        )
+        PurchaseItem.objects.create(
+            purchase=purchase, product=self.product, quantity=2, unit_price=6, discount=1
+        )
+
+        self.assertTrue(record_purchase(purchase))
+        self.assertFalse(record_purchase(purchase))
+        self.assertEqual(inventory_value()["value"], Decimal("11"))
+
+        StockValuation.objects.update(fifo_value=0)
+        self.assertEqual(rebuild_valuation(), 1)
+        self.assertEqual(inventory_value()["value"], Decimal("11"))
+
+    def create_order(self, model, quantity, days_ago, **fields):
+        if not hasattr(self, "supplier"):
+            self.supplier = Supplier.objects.create(
+                user=self.user, supplier_code=1, company="Supplier"
+            )
+            self.customer = Customer.objects.create(
+                user=create_user(1), supplier_name=self.supplier, customer_group="Walkin"
+            )
+            self.biller = Biller.objects.create(
+                user=create_user(2), NID="1", warehouse=self.warehouse, biller_code="B1"
+            )
+        if model is Purchase:
+            order = Purchase.objects.create(
+                warehouse=self.warehouse,
+                supplier=self.supplier,
+                order_tax="13",
+                order_discount=0,
+                shipping=0,
+                sales_status="Complete",
+                purchase_note="",
+            )
+            PurchaseItem.objects.create(
+                purchase=order, product=self.product, quantity=quantity, **fields
+            )
+        else:
+            order = Sales.objects.create(
+                customer=self.customer,
+                warehouse=self.warehouse,
+                biller=self.biller,
+                sales_tax="13",
+                discount=0,
+                shipping=0,
+                sales_status="Complete",
+                payment_status="Complete",
+                sales_note="",
+                staff_remark="",
+            )
+            SalesItem.objects.create(
+                sales=order, product=self.product, quantity=quantity, unit_price=12
+            )
+        model.objects.filter(pk=order.pk).update(
+            created_on=self.now - timedelta(days=days_ago)
+        )
+        order.refresh_from_db()
+        return order
+
+    def test_orders_move_stock_with_their_valuation(self):
+        purchase = self.create_order(Purchase, 10, days_ago=3, unit_price=2)
+        record_purchase(purchase)
+        sale = self.create_order(Sales, 4, days_ago=1)
+        record_sale(sale)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 6)
+        self.assertEqual(inventory_value()["quantity"], 6)
+        self.assertEqual(valuation_drift(), [])
+
+        oversold = self.create_order(Sales, 7, days_ago=0)
+        with self.assertRaises(InsufficientStock):
+            record_sale(oversold)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 6)
+
+    def test_edits_and_deletes_are_replayed(self):
+        first = self.create_order(Purchase, 10, days_ago=3, unit_price=2)
+        record_purchase(first)
+        second = self.create_order(Purchase, 10, days_ago=2, unit_price=4)
+        record_purchase(second)
+        sale = self.create_order(Sales, 5, days_ago=1)
+        record_sale(sale)
+        window = (self.now - timedelta(days=5), self.now + timedelta(days=1))
+        self.assertEqual(cost_of_goods_sold(*window)["cost"], Decimal("10"))
+
+        # the sale is costed again against what the first purchase now holds
+        def save():
+            PurchaseItem.objects.filter(purchase=first).update(quantity=2)
+            return first
+
+        update_order(first, save)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 7)
+        self.assertEqual(cost_of_goods_sold(*window)["cost"], Decimal("16"))
+        self.assertEqual(inventory_value()["value"], Decimal("28"))
+
+        delete_order(sale)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 12)
+        self.assertEqual(cost_of_goods_sold(*window)["quantity"], 0)
+        self.assertEqual(inventory_value()["value"], Decimal("44"))
+
+        # what the second purchase received is gone, it cannot be taken back
+        record_sale(self.create_order(Sales, 11, days_ago=0))
+        with self.assertRaises(InsufficientStock):
+            delete_order(second)
+        self.assertTrue(Purchase.objects.filter(pk=second.pk).exists())
+        self.assertEqual(valuation_drift(), [])
+
+    def test_editing_a_partly_sold_purchase(self):
+        purchase = self.create_order(Purchase, 10, days_ago=3, unit_price=2)
+        record_purchase(purchase)
+        record_sale(self.create_order(Sales, 8, days_ago=1))
+        self.user.is_superuser = self.user.is_staff = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f"/api/purchases/{purchase.pk}/"
+
+        # an edit that leaves lines, warehouse and status alone moves nothing
+        with mock.patch("apps.products.valuation.replay") as replay:
+            response = client.patch(url, {"purchase_note": "typo fix"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        replay.assert_not_called()
+        self.assertEqual(get_quantity(self.product, self.warehouse), 2)
+
+        # only the difference moves, what was sold stays sold
+        items = [
+            {"product": str(self.product.pk), "quantity": 9, "unit_price": "2", "discount": "0"}
+        ]
+        response = client.patch(url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 1)
+        self.assertEqual(inventory_value()["value"], Decimal("2"))
+
+        items[0]["quantity"] = 7
+        response = client.patch(url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(get_quantity(self.product, self.warehouse), 1)
+        self.assertEqual(valuation_drift(), [])
+
+    def test_recording_an_order_costs_the_same_queries_for_any_number_of_lines(self):
+        products = [self.product] + create_products(4, self.user, [self.warehouse])[1:]
+        self.create_order(Purchase, 1, days_ago=1, unit_price=2)
+        counts = []
+        for lines in (products[:1], products):
+            purchase = self.create_order(Purchase, 1, days_ago=1, unit_price=2)
+            PurchaseItem.objects.filter(purchase=purchase).delete()
+            PurchaseItem.objects.bulk_create(
+                [
+                    PurchaseItem(purchase=purchase, product=product, quantity=5, unit_price=2)
+                    for product in lines
+                ]
+            )
+            with CaptureQueriesContext(connection) as purchase_queries:
+                record_purchase(purchase)
+            sale = self.create_order(Sales, 1, days_ago=0)
+            SalesItem.objects.filter(sales=sale).delete()
+            SalesItem.objects.bulk_create(
+                [
+                    SalesItem(sales=sale, product=product, quantity=2, unit_price=12)
+                    for product in lines
+                ]
+            )
+            with CaptureQueriesContext(connection) as sale_queries:
+                record_sale(sale)
+            counts.append((len(purchase_queries), len(sale_queries)))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(valuation_drift(), [])
+
+    def test_drift_check(self):
+        self.receive(3, "1", days_ago=1)
+        add_stock(self.product, self.warehouse, 5)
+        self.assertEqual(
+            valuation_drift(), [(self.product.pk, self.warehouse.pk, 5, 3)]
+        )
+        with self.assertRaisesMessage(CommandError, "1 pairs disagree"):
+            call_command("rebuild_valuation", "--check", stdout=StringIO())
+
+    def test_summary_endpoint_validates_method(self):
+        self.user.is_staff = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.receive(4, "2.5", days_ago=1)
+
+        response = client.get("/api/valuation/summary/", {"method": "Average"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.data["value"])), Decimal("10"))
+        response = client.get("/api/valuation/summary/", {"method": "LIFO"})
+        self.assertEqual(response.status_code, 400)
+
+
+class LineItemTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.user.is_superuser = True
+        self.user.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.supplier = Supplier.objects.create(
+            user=self.user, supplier_code=1, company="Supplier"
+        )
+        self.products = create_products(300, self.user, [self.warehouse])
+
+    def payload(self, lines):
+        return {
+            "warehouse": str(self.warehouse.pk),
+            "supplier": str(self.supplier.pk),
+            "order_tax": "13",
+            "order_discount": 0,
+            "shipping": 0,
+            "sales_status": "Incomplete",
+            "purchase_note": "Restock",
+            "items": [
+                {"product": str(product.pk), "quantity": 3, "discount": "1.50"}
+                for product in self.products[:lines]
+            ],
+        }
+
+    def post(self, lines):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/api/purchases/", self.payload(lines), format="json"
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response, len(queries)
+
+    def test_lines_are_validated_and_inserted_in_bulk(self):
+        _, few = self.post(2)
+        response, many = self.post(300)
+        self.assertEqual(few, many)
+
+        purchase = Purchase.objects.get(pk=response.data["id"])
+        self.assertEqual(purchase.items.count(), 300)
+        self.assertEqual(purchase.product.count(), 300)
+        line = purchase.items.with_totals().first()
+        # 3 x product_price 10 - 1.50, taxed at the product's 13%
+        self.assertEqual(line.line_total, Decimal("28.50"))
+        self.assertEqual(line.tax_amount.quantize(Decimal("0.0001")), Decimal("3.7050"))
+
+    def test_lines_of_a_patch_take_their_defaults(self):
+        response, _ = self.post(2)
+        url = f"/api/purchases/{response.data['id']}/"
+        items = [{"product": str(self.products[0].pk)}]
+        response = self.client.patch(url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        line = PurchaseItem.objects.get()
+        self.assertEqual((line.quantity, line.discount), (1, Decimal("0")))
+
+    def test_unknown_products_reject_the_whole_order(self):
+        payload = self.payload(2)
+        payload["items"].append({"product": str(uuid.uuid4())})
+        response = self.client.post("/api/purchases/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Purchase.objects.exists())
+
+
+class InvoiceTotalsTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.supplier = Supplier.objects.create(
+            user=self.user, supplier_code=1, company="Supplier"
+        )
+        self.products = create_products(2, self.user, [self.warehouse])
+
+    def create_invoice(self, order_discount=5, shipping=3):
+        purchase = Purchase.objects.create(
+            warehouse=self.warehouse,
+            supplier=self.supplier,
+            order_tax="10",
+            order_discount=order_discount,
+            shipping=shipping,
+            sales_status="Incomplete",
+            purchase_note="",
+        )
+        PurchaseItem.objects.bulk_create(
+            [
+                PurchaseItem(
+                    purchase=purchase,
+                    product=self.products[0],
+                    quantity=2,
+                    unit_price=50,
+                    discount=10,
+                    tax_rate=13,
+                ),
+                PurchaseItem(
+                    purchase=purchase, product=self.products[1], quantity=1, unit_price=20
+                ),
+            ]
+        )
+        return PurchaseInvoice.objects.create(purchases=purchase)
+
+    def assertTotals(self, invoice, **expected):
+        invoice.refresh_from_db()
+        self.assertFalse(invoice.totals_stale)
+        for field, value in expected.items():
+            self.assertEqual(getattr(invoice, field), Decimal(value), field)
+
+    def test_totals_are_computed_when_the_invoice_is_created(self):
+        invoice = self.create_invoice()
+        # subtotal 120, discounts 10 + 5, line tax 90 x 13% = 11.70,
+        # order tax 105 x 10% = 10.50, shipping 3
+        self.assertTotals(
+            invoice,
+            subtotal="120.00",
+            discount_total="15.00",
+            tax_total="22.20",
+            shipping_total="3.00",
+            grand_total="130.20",
+        )
+
+    def test_tax_is_rounded_half_up_like_decimal(self):
+        # 10.05 at 10% is exactly 1.005, which float64 holds as 1.00499...
+        invoice = self.create_invoice(order_discount=10.05, shipping=0)
+        invoice.purchases.items.all().delete()
+        PurchaseItem.objects.create(
+            purchase=invoice.purchases,
+            product=self.products[0],
+            quantity=1,
+            unit_price=Decimal("10.05"),
+            tax_rate=10,
+        )
+        self.assertTotals(invoice, tax_total="1.01", grand_total="1.01")
+
+    def test_changing_lines_recomputes_once(self):
+        invoice = self.create_invoice()
+        line = invoice.purchases.items.get(product=self.products[1])
+        line.quantity = 3
+        line.save()
+        self.assertTotals(invoice, subtotal="160.00", grand_total="174.20")
+
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                invoice.purchases.items.all().delete()
+        self.assertTotals(invoice, subtotal="0.00", grand_total="3.00")
+        updates = [q for q in queries if "totals_stale" in q["sql"]]
+        # one invalidation and one write, however many lines were deleted
+        self.assertEqual(len(updates), 2)
+
+    def test_rolled_back_batches_are_not_reused(self):
+        calls = []
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.assertEqual(queue_on_commit(calls.append, [1, 2]), {1, 2})
+                raise RuntimeError
+        with transaction.atomic():
+            self.assertEqual(queue_on_commit(calls.append, [2, 3]), {2, 3})
+            self.assertEqual(queue_on_commit(calls.append, [3]), set())
+        self.assertEqual(calls, [{2, 3}])
+
+    def test_batch_recompute_uses_constant_queries(self):
+        invoices = [self.create_invoice(order_discount=index) for index in range(5)]
+        PurchaseInvoice.objects.update(totals_stale=True, grand_total=0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(recompute_totals(PURCHASE, chunk_size=2), 5)
+        # three chunks of (invoices, lines, update) and the empty read
+        self.assertEqual(len(queries), 3 * 3 + 1)
+        self.assertTotals(invoices[4], discount_total="14.00", grand_total="131.30")
+
+
+class SalesRollupTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        supplier = Supplier.objects.create(
+            user=self.user, supplier_code=1, company="Supplier"
+        )
+        self.customer = Customer.objects.create(
+            user=create_user(1), supplier_name=supplier, customer_group="Walkin"
+        )
+        self.biller = Biller.objects.create(
+            user=create_user(2), NID="1", warehouse=self.warehouse, biller_code="B1"
+        )
+        self.products = create_products(2, self.user, [self.warehouse])
+
+    def create_sale(self, status="Complete"):
+        with transaction.atomic():
+            sale = Sales.objects.create(
+                customer=self.customer,
+                warehouse=self.warehouse,
+                biller=self.biller,
+                sales_tax="13",
+                discount=0,
+                shipping=0,
+                sales_status=status,
+                payment_status="Complete",
+                sales_note="",
+                staff_remark="",
+            )
+            SalesItem.objects.bulk_create(
+                [
+                    SalesItem(sales=sale, product=product, quantity=2, unit_price=12)
+                    for product in self.products
+                ]
+            )
+        return sale
+
+    def cells(self, dimension):
+        return list(
+            SalesRollup.objects.filter(dimension=dimension, orders__gt=0)
+            .order_by("key")
+            .values_list("orders", "quantity", "revenue")
+        )
+
+    def test_completed_sales_are_rolled_up_incrementally(self):
+        self.create_sale()
+        sale = self.create_sale(status="Drafts")
+        self.assertEqual(self.cells("warehouse"), [(1, 4, Decimal("48"))])
+        self.assertEqual(self.cells("customer_group"), [(1, 4, Decimal("48"))])
+
+        sale.sales_status = "Complete"
+        sale.save()
+        self.assertEqual(self.cells("warehouse"), [(2, 8, Decimal("96"))])
+        # both products share one brand
+        self.assertEqual(self.cells("brand"), [(2, 8, Decimal("96"))])
+
+        line = sale.items.first()
+        line.quantity = 5
+        line.save()
+        self.assertEqual(self.cells("warehouse"), [(2, 11, Decimal("132"))])
+
+        sale.delete()
+        self.assertEqual(self.cells("warehouse"), [(1, 4, Decimal("48"))])
+
+    def test_rebuild_matches_incremental_state(self):
+        for status in ["Complete", "Complete", "Incomplete"]:
+            self.create_sale(status=status)
+        incremental = self.cells("biller")
+        SalesRollup.objects.update(orders=0)
+        self.assertEqual(rebuild_rollups(), 2)
+        self.assertEqual(self.cells("biller"), incremental)
+
+    def test_report_reads_rollups(self):
+        self.create_sale()
+        self.user.is_staff = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        today = timezone.localdate().isoformat()
+        query = {"dimension": "warehouse", "start": today, "end": today}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/api/reports/sales/", query)
+        self.assertEqual(response.status_code, 200)
+        [row] = response.data["results"]
+        self.assertEqual(row["label"], "Warehouse")
+        self.assertEqual(row["orders"], 1)
+        # the rollup read and the label lookup
+        self.assertEqual(len(queries), 2)
+
+        response = client.get("/api/reports/sales/", {**query, "dimension": "supplier"})
+        self.assertEqual(response.status_code, 400)
+
+
+class LowStockTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.supplier = Supplier.objects.create(
+            user=self.user, supplier_code=1, company="Supplier"
+        )
+        # stock_alert is 5 for every product
+        self.products = create_products(3, self.user, [self.warehouse])
+        for product, quantity in zip(self.products, [2, 5, 9]):
+            add_stock(product, self.warehouse, quantity)
+
+    def test_low_stock_follows_the_product_alert(self):
+        self.assertEqual(
+            sorted(low_stock().values_list("quantity", flat=True)), [2, 5]
+        )
+        product = self.products[2]
+        product.stock_alert = 10
+        with audit_context(self.user):
+            product.save()
+        self.assertEqual(low_stock(self.warehouse).count(), 3)
+
+    def test_linked_product_without_movements_is_low(self):
+        shop, depot = [
+            Warehouse.objects.create(
+                name=name, phone=f"+97798100000{index}", email=f"{index}@example.com"
+            )
+            for index, name in enumerate(["Shop", "Depot"], start=1)
+        ]
+        self.products[2].warehouse.add(shop)
+        depot.product_set.add(self.products[2])
+        for warehouse in (shop, depot):
+            [stock] = low_stock(warehouse)
+            self.assertEqual((stock.product, stock.quantity), (self.products[2], 0))
+        # the stock received before the links is untouched
+        self.assertFalse(low_stock(self.warehouse).filter(product=self.products[2]))
+
+    def test_low_stock_query_uses_partial_index(self):
+        with connection.cursor() as cursor:
+            # on a table this small the planner may pick any index; without
+            # scans or sorts only stock_low_idx can answer in this order
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+            queryset = low_stock(self.warehouse).order_by("-created_on", "-id")
+            plan = queryset.explain()
+        self.assertIn("stock_low_idx", plan)
+
+    def test_reorder_suggestions_group_by_last_supplier(self):
+        purchase = Purchase.objects.create(
+            warehouse=self.warehouse,
+            supplier=self.supplier,
+            order_tax="13",
+            order_discount=0,
+            shipping=0,
+            sales_status="Complete",
+            purchase_note="",
+        )
+        PurchaseItem.objects.create(
+            purchase=purchase, product=self.products[0], quantity=20, unit_price=10
+        )
+        suggestions = reorder_suggestions()
+        [ordered] = suggestions[self.supplier.pk]
+        # back to the alert quantity of 5 plus one typical order of 20
+        self.assertEqual(ordered["suggested_quantity"], 23)
+        [unknown] = suggestions[None]
+        self.assertEqual(unknown["suggested_quantity"], 5)
+
+        out = StringIO()
+        call_command("reorder_suggestions", stdout=out)
+        self.assertIn("Supplier", out.getvalue())
+
+    def test_alert_endpoint_pages_by_keyset(self):
+        self.user.is_staff = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get("/api/low-stock/", {"page_size": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+        response = client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.products = create_products(3, self.user, [self.warehouse])
+
+    def test_unchanged_list_answers_304_with_one_query(self):
+        response = self.client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        # index probes, not an aggregate over the filtered rows
+        self.assertNotIn("COUNT(", queries[0]["sql"])
+        self.assertIn("LIMIT 1", queries[0]["sql"])
+
+        response = self.client.get(
+            "/api/products/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # another page or filter is another representation
+        response = self.client.get(
+            "/api/products/", {"page_size": 1}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_invalidate_the_validators(self):
+        response = self.client.get("/api/products/")
+        etag = response["ETag"]
+        Product.objects.filter(pk=self.products[0].pk).delete()
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_warehouse_links_invalidate_the_validators(self):
+        other = Warehouse.objects.create(
+            name="Other", phone="+9779810000001", email="other@example.com"
+        )
+        list_url, url = "/api/products/", f"/api/products/{self.products[0].pk}/"
+        etags = [self.client.get(u)["ETag"] for u in (list_url, url)]
+        self.products[0].warehouse.add(other)
+        for u, etag in zip((list_url, url), etags):
+            response = self.client.get(u, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, u)
+
+        etag = self.client.get(url)["ETag"]
+        other.product_set.remove(self.products[0])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["warehouse"]), 1)
+
+    def test_rows_edited_out_of_the_filter_invalidate_the_list(self):
+        first = Brand.objects.create(brand_name="Shared")
+        Brand.objects.create(brand_name="Shared")
+        url = "/api/brands/?brand_name=Shared"
+        etag = self.client.get(url)["ETag"]
+
+        first.brand_name = "Other"
+        first.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_retrieve_follows_nested_rows(self):
+        url = f"/api/products/{self.products[0].pk}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        brand = self.products[0].brand
+        brand.brand_name = "Renamed"
+        brand.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["brand"]["brand_name"], "Renamed")
+
+    def test_reference_endpoints_send_validators(self):
+        for url in ["/api/brands/", "/api/category/", "/api/units/", "/api/warehouse/"]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn("ETag", response, url)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, 304, url)
+
+
+class ReferenceCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.product = create_products(1, self.user, [self.warehouse])[0]
+        self.cache = reference_cache(Brand)
+
+    def test_rows_are_read_through_both_tiers(self):
+        brand = self.product.brand
+        before = self.cache.stats()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cache.get(brand.pk).brand_name, "Brand")
+        with self.assertNumQueries(0):
+            self.cache.get(brand.pk)
+        # a fresh process only has the shared tier
+        ReferenceCache.local_cache().clear()
+        with self.assertNumQueries(0):
+            self.cache.get(brand.pk)
+
+        after = self.cache.stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        self.assertEqual(after["shared_hits"] - before["shared_hits"], 1)
+
+    def test_saving_a_row_bumps_the_generation(self):
+        brand = self.product.brand
+        self.cache.get(brand.pk)
+        brand.brand_name = "Renamed"
+        brand.save()
+        self.assertEqual(self.cache.get(brand.pk).brand_name, "Renamed")
+
+    def test_nested_rows_are_rendered_from_the_cache(self):
+        self.user.is_staff = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f"/api/products/{self.product.pk}/"
+        client.get(url)
+        before = self.cache.stats()
+        response = client.get(url)
+        self.assertEqual(response.data["brand"]["brand_name"], "Brand")
+        self.assertEqual(response.data["warehouse"][0]["name"], "Warehouse")
+        after = self.cache.stats()
+        self.assertEqual(after["misses"], before["misses"])
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+        response = client.get("/api/reference-cache/")
+        self.assertIn("products.brand", [row["model"] for row in response.data])
+
+    def test_a_cold_cache_reads_each_model_once_per_page(self):
+        products = create_products(4, self.user, [self.warehouse])
+        for index, product in enumerate(products):
+            product.brand = Brand.objects.create(brand_name=f"Brand {index}")
+            product.save()
+        for model in (Brand, Category, Unit, Warehouse):
+            reference_cache(model).invalidate()
+        ReferenceCache.local_cache().clear()
+
+        page = list(
+            Product.objects.select_related(
+                "created_by", "modified_by", "user"
+            ).prefetch_related("warehouse")
+        )
+        # one get_many per model for the whole page, not one per row
+        with self.assertNumQueries(4):
+            data = GETProductSerializer(page, many=True).data
+        self.assertEqual(
+            {row["brand"]["brand_name"] for row in data},
+            {"Brand", "Brand 0", "Brand 1", "Brand 2", "Brand 3"},
+        )
+        self.assertEqual({row["warehouse"][0]["name"] for row in data}, {"Warehouse"})
+
+    def test_warm_up_loads_the_configured_models(self):
+        ReferenceCache.local_cache().clear()
+        self.assertEqual(
+            warm_up(["products.Brand", "store.Warehouse"]),
+            {"products.Brand": 1, "store.Warehouse": 1},
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get(self.product.brand_id).brand_name, "Brand")
+
+
+class BootWarmUpTestCase(TransactionTestCase):
+    def test_warm_up_runs_inside_an_event_loop_and_closes_its_connection(self):
+        Brand.objects.create(brand_name="Brand")
+        ReferenceCache.local_cache().clear()
+
+        async def boot():
+            # what an ASGI server does when it imports config.asgi
+            return boot_warm_up(["products.Brand"])
+
+        self.assertEqual(asyncio.run(boot()), {"products.Brand": 1})
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()"
+                " AND pid <> pg_backend_pid()"
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class LazyImportTestCase(TestCase):
+    def test_modules_are_imported_on_first_attribute_access(self):
+        sys.modules.pop("colorsys", None)
+        colorsys = lazy_import("colorsys")
+        self.assertIsInstance(colorsys, LazyModule)
+        self.assertNotIn("colorsys", sys.modules)
+        self.assertEqual(colorsys.rgb_to_hsv(1, 0, 0), (0, 1, 1))
+        self.assertTrue(colorsys.is_loaded)
+        self.assertIs(lazy_import("colorsys"), sys.modules["colorsys"])
+
+    def test_workers_boot_without_the_heavy_dependencies(self):
+        out = StringIO()
+        call_command(
+            "benchmark_startup",
+            "--apps",
+            "apps.products",
+            "apps.accounts",
+            "--repeat",
+            "1",
+            "--imports-only",
+            stdout=out,
+        )
+        rows = [line.split() for line in out.getvalue().splitlines()[1:]]
+        self.assertEqual([row[0] for row in rows], ["apps.products", "apps.accounts"])
+        # nothing in the loaded column
+        self.assertEqual([row[3] for row in rows], ["-", "-"])
+
+
+class AuditContextTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user(1)
+
+    def test_saves_outside_a_request_are_unattributed(self):
+        product = create_products(1, self.user, [])[0]
+        product.pk = None
+        product._state.adding = True
+        product.user = product.created_by = product.modified_by = None
+        product.barcode, product.product_code = "copy", None
+        product.save()
+        self.assertIsNone(product.created_by)
+        self.assertIsNone(product.user)
+
+    def test_audit_context_attributes_saves(self):
+        with audit_context(self.user):
+            brand = Brand.objects.create(brand_name="Brand")
+        self.assertEqual(brand.created_by, self.user)
+        self.assertIsNone(brand.modified_by)
+        self.assertIsNone(current_user())
+
+        with audit_context(self.other):
+            brand.save()
+        brand.refresh_from_db()
+        self.assertEqual(brand.created_by, self.user)
+        self.assertEqual(brand.modified_by, self.other)
+
+    def test_bulk_writes_are_attributed(self):
+        with audit_context(self.user):
+            brands = Brand.objects.bulk_create(
+                [Brand(brand_name=f"Brand {index}") for index in range(3)]
+                + [Brand(brand_name="Explicit", created_by=self.other)]
+            )
+        self.assertEqual(
+            sorted(Brand.objects.values_list("brand_name", "created_by")),
+            [
+                ("Brand 0", self.user.pk),
+                ("Brand 1", self.user.pk),
+                ("Brand 2", self.user.pk),
+                ("Explicit", self.other.pk),
+            ],
+        )
+
+        before = Brand.objects.get(pk=brands[0].pk).modified_on
+        for brand in brands:
+            brand.brand_name += "!"
+        with audit_context(self.other):
+            with self.assertNumQueries(1):
+                Brand.objects.bulk_update(brands, ["brand_name"])
+        brand = Brand.objects.get(pk=brands[0].pk)
+        self.assertEqual(brand.brand_name, "Brand 0!")
+        self.assertEqual(brand.modified_by, self.other)
+        self.assertGreater(brand.modified_on, before)
+
+    def test_middleware_attributes_writes_to_the_request_user(self):
+        def view(request):
+            request.user = self.user
+            Brand.objects.create(brand_name="Brand")
+            return None
+
+        request = APIRequestFactory().get("/")
+        AuditContextMiddleware(view)(request)
+        self.assertEqual(Brand.objects.get().created_by, self.user)
+        self.assertIsNone(current_user())
+
+
+class AsyncReadTestCase(TestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.products = create_products(3, self.user, [self.warehouse])
+
+    async def call(self, viewset_class, action, path="/", user=None, **kwargs):
+        view = viewset_class.as_view({"get": action, "post": "create"})
+        request = self.factory.get(path, **kwargs.pop("headers", {}))
+        if user is not None:
+            force_authenticate(request, user)
+        response = await view(request, **kwargs)
+        return response.render() if hasattr(response, "render") else response
+
+    def test_reads_are_coroutines(self):
+        view = ProductViewSet.as_view({"get": "list", "post": "create"})
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        view = ProductViewSet.as_view({"post": "bulk_import"})
+        self.assertFalse(asyncio.iscoroutinefunction(view))
+
+    async def test_async_list_keeps_the_response_shape(self):
+        response = await self.call(ProductViewSet, "list", "/?page_size=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {"next", "previous", "results"})
+        self.assertEqual(
+            [row["product_name"] for row in response.data["results"]],
+            ["Product 2", "Product 1"],
+        )
+        self.assertIsNotNone(response.data["next"])
+        self.assertIn("ETag", response)
+
+    async def test_async_retrieve_checks_permissions(self):
+        pk = self.products[0].pk
+        response = await self.call(ProductViewSet, "retrieve", pk=pk)
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.call(ProductViewSet, "retrieve", user=self.user, pk=pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["brand"]["brand_name"], "Brand")
+        self.assertEqual(response.data["warehouse"][0]["name"], "Warehouse")
+
+        etag = response["ETag"]
+        response = await self.call(
+            ProductViewSet,
+            "retrieve",
+            user=self.user,
+            headers={"HTTP_IF_NONE_MATCH": etag},
+            pk=pk,
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.call(
+            ProductViewSet, "retrieve", user=self.user, pk="not-a-uuid"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_customer_lookup(self):
+        supplier = await Supplier.objects.acreate(
+            user=self.user, supplier_code=1, company="Supplier"
+        )
+        await Customer.objects.acreate(
+            user=self.user, supplier_name=supplier, customer_group="General"
+        )
+        response = await self.call(CustomerViewSet, "list")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_writes_still_go_through_the_sync_view(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            "/api/warehouse/",
+            {"name": "Second", "phone": "+9779810000001", "email": "second@example.com"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Warehouse.objects.count(), 2)
+
+
+class ProductNumberingTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.product = create_products(3, self.user, [self.warehouse])[2]
+
+    def test_products_without_a_code_get_the_next_one(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.pk, product.product_code, product.barcode = None, None, "new"
+        product._state.adding = True
+        product.save()
+        self.assertEqual(product.product_code, self.product.product_code + 1)
+
+    def test_codes_given_by_hand_are_never_handed_out(self):
+        def copy(code):
+            product = Product.objects.get(pk=self.product.pk)
+            product.pk, product.product_code, product.barcode = None, code, "new"
+            product._state.adding = True
+            product.save()
+            return product
+
+        last = self.product.product_code
+        copy(last + 10)
+        self.assertEqual(copy(None).product_code, last + 11)
+
+        serializer = ProductSerializer(
+            self.product, {"product_code": last + 20}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(copy(None).product_code, last + 21)
+
+        serializer = ProductSerializer(
+            self.product, {"product_code": last + 10}, partial=True
+        )
+        self.assertFalse(serializer.is_valid())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            copy(last + 10)
+
+    def test_invoice_numbers_run_per_warehouse(self):
+        other = Warehouse.objects.create(
+            name="Other", phone="+9779810000001", email="other@example.com"
+        )
+        numbers = [
+            PurchaseInvoice.objects.create(warehouse=warehouse).number
+            for warehouse in [self.warehouse, self.warehouse, other]
+        ]
+        self.assertEqual(numbers, ["PI-000001", "PI-000002", "PI-000001"])
+        self.assertEqual(SalesInvoice.objects.create(warehouse=other).number, "SI-000001")
+
+
+class QueryDiagnosticsTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.warehouse = Warehouse.objects.create(
+            name="Warehouse", phone="+9779810000000", email="warehouse@example.com"
+        )
+        self.products = create_products(3, self.user, [self.warehouse])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_reports_queries_view_and_render(self):
+        self.user.is_staff = True
+        self.user.save()
+        # plain ViewSets are covered too, without a serialize metric
+        for url, serialize in [
+            ("/api/products/", {"serialize"}),
+            ("/api/reference-cache/", set()),
+        ]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            metrics = {
+                metric.split(";")[0]: metric
+                for metric in response["Server-Timing"].split(", ")
+            }
+            self.assertEqual(
+                set(metrics), {"db", "render", "total", "view"} | serialize, url
+            )
+            self.assertRegex(metrics["db"], r'^db;dur=[\d.]+;desc="\d+ queries"$')
+
+    def test_streamed_queries_are_recorded(self):
+        self.user.is_staff = True
+        self.user.save()
+        with override_settings(QUERY_DIAGNOSTICS={"SLOW_QUERY_COUNT": 1}):
+            response = self.client.get("/api/products/export/")
+            self.assertNotIn("Server-Timing", response)
+            with self.assertLogs("utils.diagnostics", "WARNING") as logs:
+                b"".join(response.streaming_content)
+        self.assertRegex(logs.output[0], r"products/export/ \(200\) took [\d.]+ ms, [1-9]")
+
+    def test_in_lists_share_a_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT 1 FROM "t" WHERE "id" IN (%s, %s, %s)'),
+            fingerprint('SELECT 1 FROM "t" WHERE "id" IN (%s)'),
+        )
+
+    def test_repeated_statements_are_logged(self):
+        def view(request):
+            for product in Product.objects.all():
+                Brand.objects.get(pk=product.brand_id)
+            return HttpResponse()
+
+        middleware = QueryDiagnosticsMiddleware(view)
+        with override_settings(QUERY_DIAGNOSTICS={"DUPLICATE_THRESHOLD": 3}):
+            with self.assertLogs("utils.diagnostics", "WARNING") as logs:
+                response = middleware(APIRequestFactory().get("/n-plus-one/"))
+        self.assertIn('4 queries', response["Server-Timing"])
+        self.assertIn("repeated 3x", logs.output[0])
+        self.assertIn('"products_brand"', logs.output[0])
+
+    def test_strict_mode_enforces_the_query_budget(self):
+        # STRICT is on for the test run, see config/settings.py
+        for _ in range(2):
+            self.assertEqual(self.client.get("/api/products/").status_code, 200)
+        with mock.patch.object(ProductViewSet, "query_budget_by_action", {"list": 1}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "budget is 1"):
+                self.client.get("/api/products/")
+
+
+class EndpointBenchmarkTestCase(TransactionTestCase):
+    def test_run_size_measures_reads_and_writes(self):
+        command = BenchmarkEndpointsCommand(stdout=StringIO())
+        results = command.run_size(
+            5, 3, only=["product:", "cogs", "token:", "sales:create"]
+        )
+        self.assertEqual(
+            {key: result["status"] for key, result in results.items()},
+            {
+                "product:list@5": 200,
+                "product:retrieve@5": 200,
+                "product:create@5": 201,
+                "product:import@5": 201,
+                "product:export@5": 200,
+                "stockvaluation:cogs@5": 200,
+                "token:create@5": 201,
+                "token:refresh@5": 201,
+                "token:logout@5": 204,
+                "sales:create@5": 201,
+            },
+        )
+        # logout authenticates with a token of its own and revokes it
+        self.assertGreater(results["token:logout@5"]["queries"], 0)
+        result = results["product:list@5"]
+        self.assertLessEqual(result["p50"], result["p95"])
+        self.assertLessEqual(result["p95"], result["p99"])
+        self.assertGreater(result["queries"], 0)
+        self.assertGreater(result["memory_kib"], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {
+            "product:list@5": {
+                "status": 200, "p50": 10.0, "queries": 3, "memory_kib": 100.0,
+            },
+        }
+        results = {
+            "product:list@5": {
+                "status": 200, "p50": 14.0, "queries": 4, "memory_kib": 100.0,
+            },
+            "product:new@5": {
+                "status": 200, "p50": 1.0, "queries": 1, "memory_kib": 1.0,
+            },
+        }
+        self.assertEqual(
+            compare(results, baseline, tolerance=0.5),
+            ["product:list@5: 4 queries, baseline 3"],
+        )
+        self.assertEqual(compare(results, baseline, 0.5, query_tolerance=1), [])
+        self.assertEqual(
+            compare(results, baseline, 0.2, query_tolerance=1, slack_ms=2), []
+        )
+        self.assertEqual(
+            compare(results, baseline, tolerance=0.2),
+            [
+                "product:list@5: 4 queries, baseline 3",
+                "product:list@5: p50 14.0, baseline 10.0",
+            ],
+        )
+
+    def test_compare_flags_endpoints_missing_from_the_results(self):
+        measurement = {"status": 200, "p50": 1.0, "queries": 1, "memory_kib": 1.0}
+        baseline = {"product:list@5": measurement, "sales:create@5": measurement}
+        self.assertEqual(
+            compare({"product:list@5": measurement}, baseline, tolerance=0.5),
+            ["sales:create@5: missing from the results"],
+        )
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 21))
+        self.assertEqual(percentile(values, 0.5), 10)
+        self.assertEqual(percentile(values, 0.95), 19)
+        self.assertEqual(percentile(values, 0.99), 20)
@@ -0,0 +1,630 @@
+from collections import defaultdict, deque
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.products.models import (
+    AdjustmentItems,
+    CostLayer,
+    CostOfSale,
+    Product,
+    PurchaseItem,
+    SalesItem,
+    Stock,
+    StockValuation,
+    Purchase,
+    Sales,
+)
+from apps.products.stock import add_stock_many, remove_stock_many
+from apps.store.models import Warehouse
+
+
+ZERO = Decimal("0")
+METHOD_FIELDS = {
+    "FIFO": ("fifo_value", "fifo_cost"),
+    "Average": ("average_value", "average_cost"),
+}
+
+
+def to_decimal(value):
+    return Decimal(str(value or 0))
+
+
+def _locked_valuations(warehouse_id, product_ids):
+    """
+    {product id: valuation} of a warehouse, missing rows created in one
+    INSERT and all of them locked with one SELECT ... FOR UPDATE.
+    """
+    StockValuation.objects.bulk_create(
+        [
+            StockValuation(product_id=product_id, warehouse_id=warehouse_id)
+            for product_id in product_ids
+        ],
+        ignore_conflicts=True,
+    )
+    valuations = StockValuation.objects.select_for_update().filter(
+        warehouse_id=warehouse_id, product_id__in=product_ids
+    )
+    return {valuation.product_id: valuation for valuation in valuations}
+
+
+def _save_valuations(valuations):
+    StockValuation.objects.bulk_update(
+        valuations, ["quantity", "fifo_value", "average_value"]
+    )
+
+
+@transaction.atomic
+def receive_many(warehouse_id, lines, purchase=None, received_on=None):
+    """
+    Adds a cost layer per (product id, quantity, unit cost) line and folds
+    them into the running FIFO and average values, with one query per
+    table whatever the number of lines.
+    """
+    received_on = received_on or timezone.now()
+    valuations = _locked_valuations(warehouse_id, {line[0] for line in lines})
+    layers = []
+    for product_id, quantity, unit_cost in lines:
+        unit_cost = to_decimal(unit_cost)
+        layers.append(
+            CostLayer(
+                product_id=product_id,
+                warehouse_id=warehouse_id,
+                purchase=purchase,
+                received_on=received_on,
+                quantity=quantity,
+                remaining=quantity,
+                unit_cost=unit_cost,
+            )
+        )
+        valuation = valuations[product_id]
+        valuation.quantity += quantity
+        valuation.fifo_value += quantity * unit_cost
+        valuation.average_value += quantity * unit_cost
+    CostLayer.objects.bulk_create(layers)
+    _save_valuations(valuations.values())
+
+
+def receive(product_id, warehouse_id, quantity, unit_cost, purchase=None, received_on=None):
+    """
+    Adds a cost layer and folds it into the running FIFO and average values.
+    """
+    receive_many(
+        warehouse_id,
+        [(product_id, quantity, unit_cost)],
+        purchase=purchase,
+        received_on=received_on,
+    )
+
+
+def _open_layers(warehouse_id, product_ids):
+    """
+    {product id: deque of open layers, oldest first}, locked.
+    """
+    layers = (
+        CostLayer.objects.select_for_update()
+        .filter(warehouse_id=warehouse_id, product_id__in=product_ids, remaining__gt=0)
+        .order_by("received_on", "id")
+    )
+    open_layers = defaultdict(deque)
+    for layer in layers:
+        open_layers[layer.product_id].append(layer)
+    return open_layers
+
+
+def _consume_layers(layers, quantity, consumed):
+    """
+    Takes `quantity` from the oldest of `layers`, returns (cost, shortfall).
+    """
+    cost, needed = ZERO, quantity
+    while needed and layers:
+        layer = layers[0]
+        taken = min(layer.remaining, needed)
+        layer.remaining -= taken
+        cost += taken * layer.unit_cost
+        needed -= taken
+        consumed[layer.pk] = layer
+        if not layer.remaining:
+            layers.popleft()
+    return cost, needed
+
+
+@transaction.atomic
+def issue_many(warehouse_id, lines, sales=None, issued_on=None):
+    """
+    Removes each (product id, quantity, fallback unit cost) line at its FIFO
+    and weighted-average cost and records its cost of sale, with one query
+    per table whatever the number of lines. Quantities never received
+    (stock that predates tracking) are costed at the fallback cost.
+    """
+    issued_on = issued_on or timezone.now()
+    product_ids = {line[0] for line in lines}
+    valuations = _locked_valuations(warehouse_id, product_ids)
+    open_layers = _open_layers(warehouse_id, product_ids)
+    consumed, costs = {}, []
+    for product_id, quantity, fallback_cost in lines:
+        valuation = valuations[product_id]
+        fallback_cost = to_decimal(fallback_cost)
+
+        # cost of the part of `quantity` that is covered by tracked stock
+        fifo_tracked, untracked_fifo = _consume_layers(
+            open_layers[product_id], quantity, consumed
+        )
+        on_hand = min(quantity, max(valuation.quantity, 0))
+        average_tracked = ZERO
+        if on_hand:
+            average_tracked = valuation.average_value / valuation.quantity * on_hand
+
+        costs.append(
+            CostOfSale(
+                product_id=product_id,
+                warehouse_id=warehouse_id,
+                sales=sales,
+                issued_on=issued_on,
+                quantity=quantity,
+                fifo_cost=fifo_tracked + untracked_fifo * fallback_cost,
+                average_cost=average_tracked + (quantity - on_hand) * fallback_cost,
+            )
+        )
+
+        valuation.quantity -= on_hand
+        if valuation.quantity:
+            valuation.fifo_value = max(valuation.fifo_value - fifo_tracked, ZERO)
+            valuation.average_value = max(valuation.average_value - average_tracked, ZERO)
+        else:
+            valuation.fifo_value = valuation.average_value = ZERO
+    CostLayer.objects.bulk_update(consumed.values(), ["remaining"])
+    CostOfSale.objects.bulk_create(costs)
+    _save_valuations(valuations.values())
+
+
+def issue(product_id, warehouse_id, quantity, fallback_cost=0, sales=None, issued_on=None):
+    """
+    Removes `quantity` at its FIFO and weighted-average cost and records the
+    cost of sale. Quantities never received (stock that predates tracking)
+    are costed at `fallback_cost`.
+    """
+    issue_many(
+        warehouse_id,
+        [(product_id, quantity, fallback_cost)],
+        sales=sales,
+        issued_on=issued_on,
+    )
+
+
+def purchase_movements(purchase):
+    """
+    (product id, quantity, unit cost net of the line discount) per line.
+    """
+    lines = purchase.items.values_list("product_id", "quantity", "unit_price", "discount")
+    for product_id, quantity, unit_price, discount in lines:
+        yield product_id, quantity, unit_price - discount / quantity
+
+
+def sale_movements(sale):
+    """
+    (product id, quantity, fallback unit cost) per line.
+    """
+    yield from sale.items.values_list("product_id", "quantity", "product__product_price")
+
+
+def _lock(order):
+    """
+    Locks the row of `order`, concurrent saves of one order wait here so
+    only the first records it. Returns its stored (warehouse id, status).
+    """
+    return (
+        type(order)
+        .objects.select_for_update()
+        .filter(pk=order.pk)
+        .values_list("warehouse_id", "sales_status")
+        .first()
+    )
+
+
+def _products(movements):
+    return Product.objects.in_bulk({movement[0] for movement in movements})
+
+
+def record_purchase(purchase):
+    """
+    Receives a completed purchase once, into both the stock and its
+    valuation; calling it again is a no-op.
+    """
+    if purchase.sales_status != "Complete":
+        return False
+    with transaction.atomic():
+        _lock(purchase)
+        if purchase.cost_layers.exists():
+            return False
+        movements = list(purchase_movements(purchase))
+        products = _products(movements)
+        add_stock_many(
+            purchase.warehouse,
+            [(products[product_id], quantity) for product_id, quantity, _ in movements],
+        )
+        receive_many(
+            purchase.warehouse_id,
+            movements,
+            purchase=purchase,
+            received_on=purchase.created_on,
+        )
+    return True
+
+
+def record_sale(sale):
+    """
+    Issues a completed sale once, from both the stock and its valuation;
+    calling it again is a no-op. Raises InsufficientStock when it would
+    oversell.
+    """
+    if sale.sales_status != "Complete":
+        return False
+    with transaction.atomic():
+        _lock(sale)
+        if sale.costs_of_sale.exists():
+            return False
+        movements = list(sale_movements(sale))
+        products = _products(movements)
+        remove_stock_many(
+            sale.warehouse,
+            [(products[product_id], quantity) for product_id, quantity, _ in movements],
+        )
+        issue_many(sale.warehouse_id, movements, sales=sale, issued_on=sale.created_on)
+    return True
+
+
+def _by_warehouse(rows):
+    warehouses = defaultdict(list)
+    for row in rows:
+        warehouses[row.warehouse].append((row.product, row.quantity))
+    return warehouses.items()
+
+
+def unrecord_purchase(purchase):
+    """
+    Takes a recorded purchase back out of the stock and drops its cost
+    layers, before it is deleted. Returns the (product id, warehouse id)
+    pairs to replay. Raises InsufficientStock when what it received has
+    been sold since.
+    """
+    with transaction.atomic():
+        _lock(purchase)
+        layers = list(purchase.cost_layers.select_related("product", "warehouse"))
+        for warehouse, movements in _by_warehouse(layers):
+            remove_stock_many(warehouse, movements)
+        CostLayer.objects.filter(pk__in=[layer.pk for layer in layers]).delete()
+    return {(layer.product_id, layer.warehouse_id) for layer in layers}
+
+
+def unrecord_sale(sale):
+    """
+    Puts a recorded sale back into the stock and drops its costs of sale,
+    before it is deleted. Returns the pairs to replay.
+    """
+    with transaction.atomic():
+        _lock(sale)
+        costs = list(sale.costs_of_sale.select_related("product", "warehouse"))
+        for warehouse, movements in _by_warehouse(costs):
+            add_stock_many(warehouse, movements)
+        CostOfSale.objects.filter(pk__in=[cost.pk for cost in costs]).delete()
+    return {(cost.product_id, cost.warehouse_id) for cost in costs}
+
+
+def _recorded_lines(order, warehouse_id, status):
+    """
+    {(product id, warehouse id): sorted (quantity, unit cost) lines} that
+    stock and valuation hold for `order` in that warehouse and status.
+    """
+    if status != "Complete":
+        return {}
+    movements, _ = ORDER_MOVEMENTS[type(order)]
+    lines = defaultdict(list)
+    for product_id, quantity, unit_cost in movements(order):
+        lines[(product_id, warehouse_id)].append((quantity, unit_cost))
+    return {pair: sorted(pair_lines) for pair, pair_lines in lines.items()}
+
+
+def _move_stock(pairs, before, after, sign):
+    """
+    Moves the stock of `pairs` by the change in quantity between the
+    `before` and `after` lines, one batch per warehouse and direction.
+    """
+    added, removed = defaultdict(list), defaultdict(list)
+    for product_id, warehouse_id in pairs:
+        change = sign * (
+            sum(quantity for quantity, _ in after.get((product_id, warehouse_id), ()))
+            - sum(quantity for quantity, _ in before.get((product_id, warehouse_id), ()))
+        )
+        if change > 0:
+            added[warehouse_id].append((product_id, change))
+        elif change < 0:
+            removed[warehouse_id].append((product_id, -change))
+    if not added and not removed:
+        return
+    products = Product.objects.in_bulk({product_id for product_id, _ in pairs})
+    warehouses = Warehouse.objects.in_bulk(added.keys() | removed.keys())
+    for moves, function in ((removed, remove_stock_many), (added, add_stock_many)):
+        for warehouse_id, movements in moves.items():
+            function(
+                warehouses[warehouse_id],
+                [(products[product_id], quantity) for product_id, quantity in movements],
+            )
+
+
+def update_order(order, save):
+    """
+    Saves an edit of a purchase or sale, `save()` writes it and returns the
+    order. Only what the edit changed is moved: an edit that leaves lines,
+    warehouse and status alone touches neither stock nor valuation,
+    otherwise the stock moves by the difference per product and warehouse
+    and the pairs whose lines changed are replayed, so later movements are
+    costed as if the edit had always been there.
+    """
+    _, sign = ORDER_MOVEMENTS[type(order)]
+    with transaction.atomic():
+        before = _recorded_lines(order, *_lock(order))
+        order = save()
+        after = _recorded_lines(order, order.warehouse_id, order.sales_status)
+        changed = {
+            pair
+            for pair in before.keys() | after.keys()
+            if before.get(pair) != after.get(pair)
+        }
+        if changed:
+            _move_stock(changed, before, after, sign)
+            replay(changed)
+    return order
+
+
+def delete_order(order):
+    """
+    Takes a purchase or sale out of stock and valuation and deletes it.
+    """
+    _, unrecord = ORDER_RECORDERS[type(order)]
+    with transaction.atomic():
+        pairs = unrecord(order)
+        order.delete()
+        replay(pairs)
+
+
+ORDER_RECORDERS = {
+    Purchase: (record_purchase, unrecord_purchase),
+    Sales: (record_sale, unrecord_sale),
+}
+# how an order's lines move stock: received (+1) or issued (-1)
+ORDER_MOVEMENTS = {
+    Purchase: (purchase_movements, 1),
+    Sales: (sale_movements, -1),
+}
+
+
+def record_adjustment(item):
+    """
+    Values an applied adjustment item: additions are received and
+    subtractions issued at the product's price.
+    """
+    if item.type == "Addition":
+        receive(
+            item.product_id,
+            item.adjustment.warehouse_id,
+            item.quantity,
+            item.product.product_price,
+            received_on=item.created_on,
+        )
+    else:
+        issue(
+            item.product_id,
+            item.adjustment.warehouse_id,
+            item.quantity,
+            fallback_cost=item.product.product_price,
+            issued_on=item.created_on,
+        )
+
+
+def inventory_value(method="FIFO", warehouse=None, product=None):
+    """
+    Current value of stock on hand, read from one row per product/warehouse.
+    """
+    value_field, _ = METHOD_FIELDS[method]
+    valuations = StockValuation.objects.all()
+    if warehouse is not None:
+        valuations = valuations.filter(warehouse=warehouse)
+    if product is not None:
+        valuations = valuations.filter(product=product)
+    totals = valuations.aggregate(quantity=Sum("quantity"), value=Sum(value_field))
+    return {
+        "method": method,
+        "quantity": totals["quantity"] or 0,
+        "value": totals["value"] or ZERO,
+    }
+
+
+def cost_of_goods_sold(start, end, method="FIFO", warehouse=None, product=None):
+    """
+    Cost of everything issued in [start, end).
+    """
+    _, cost_field = METHOD_FIELDS[method]
+    costs = CostOfSale.objects.filter(issued_on__gte=start, issued_on__lt=end)
+    if warehouse is not None:
+        costs = costs.filter(warehouse=warehouse)
+    if product is not None:
+        costs = costs.filter(product=product)
+    totals = costs.aggregate(quantity=Sum("quantity"), cost=Sum(cost_field))
+    return {
+        "method": method,
+        "quantity": totals["quantity"] or 0,
+        "cost": totals["cost"] or ZERO,
+    }
+
+
+def _pairs(pairs, product="product_id", warehouse="warehouse_id"):
+    condition = Q(pk__in=[])
+    for product_id, warehouse_id in pairs:
+        condition |= Q(**{product: product_id, warehouse: warehouse_id})
+    return condition
+
+
+def _events(pairs=None):
+    """
+    Every movement of completed purchases and sales and of adjustments, as
+    (when, order, function, args, kwargs), optionally only of `pairs`.
+    Receipts sort before issues of the same moment.
+    """
+    purchase_lines = PurchaseItem.objects.filter(purchase__sales_status="Complete")
+    sale_lines = SalesItem.objects.filter(sales__sales_status="Complete")
+    adjustment_items = AdjustmentItems.objects.all()
+    if pairs is not None:
+        purchase_lines = purchase_lines.filter(
+            _pairs(pairs, warehouse="purchase__warehouse_id")
+        )
+        sale_lines = sale_lines.filter(_pairs(pairs, warehouse="sales__warehouse_id"))
+        adjustment_items = adjustment_items.filter(
+            _pairs(pairs, warehouse="adjustment__warehouse_id")
+        )
+
+    lines = purchase_lines.order_by("purchase__created_on", "purchase_id", "id")
+    for line in lines.values(
+        "purchase_id",
+        "purchase__created_on",
+        "purchase__warehouse_id",
+        "product_id",
+        "quantity",
+        "unit_price",
+        "discount",
+    ):
+        yield (
+            line["purchase__created_on"],
+            0,
+            receive,
+            (
+                line["product_id"],
+                line["purchase__warehouse_id"],
+                line["quantity"],
+                line["unit_price"] - line["discount"] / line["quantity"],
+            ),
+            {
+                "purchase": Purchase(pk=line["purchase_id"]),
+                "received_on": line["purchase__created_on"],
+            },
+        )
+
+    lines = sale_lines.order_by("sales__created_on", "sales_id", "id")
+    for line in lines.values(
+        "sales_id",
+        "sales__created_on",
+        "sales__warehouse_id",
+        "product_id",
+        "quantity",
+        "product__product_price",
+    ):
+        yield (
+            line["sales__created_on"],
+            1,
+            issue,
+            (line["product_id"], line["sales__warehouse_id"], line["quantity"]),
+            {
+                "fallback_cost": line["product__product_price"],
+                "sales": Sales(pk=line["sales_id"]),
+                "issued_on": line["sales__created_on"],
+            },
+        )
+
+    items = adjustment_items.order_by("created_on", "id")
+    for item in items.values(
+        "created_on",
+        "adjustment__warehouse_id",
+        "product_id",
+        "type",
+        "quantity",
+        "product__product_price",
+    ):
+        args = (item["product_id"], item["adjustment__warehouse_id"], item["quantity"])
+        if item["type"] == "Addition":
+            yield (
+                item["created_on"],
+                0,
+                receive,
+                args + (item["product__product_price"],),
+                {"received_on": item["created_on"]},
+            )
+        else:
+            yield (
+                item["created_on"],
+                1,
+                issue,
+                args,
+                {
+                    "fallback_cost": item["product__product_price"],
+                    "issued_on": item["created_on"],
+                },
+            )
+
+
+def replay(pairs=None):
+    """
+    Drops the stored valuation of `pairs` (every pair by default) and
+    replays their movements in the order they happened, after an order or
+    adjustment was edited or deleted. Returns the number of movements.
+    """
+    with transaction.atomic():
+        valuations = StockValuation.objects.all()
+        costs = CostOfSale.objects.all()
+        layers = CostLayer.objects.all()
+        if pairs is not None:
+            pairs = set(pairs)
+            if not pairs:
+                return 0
+            valuations = valuations.filter(_pairs(pairs))
+            costs = costs.filter(_pairs(pairs))
+            layers = layers.filter(_pairs(pairs))
+        # writers of these pairs wait for the replay, see _locked_valuations
+        list(valuations.select_for_update().values_list("pk", flat=True))
+        costs.delete()
+        layers.delete()
+        valuations.delete()
+
+        events = sorted(_events(pairs), key=lambda event: (event[0], event[1]))
+        for _, _, function, args, kwargs in events:
+            function(*args, **kwargs)
+        return len(events)
+
+
+def rebuild_valuation():
+    """
+    Drops the stored valuation and replays every completed purchase and
+    sale and every adjustment in the order they happened.
+    """
+    return replay()
+
+
+def valuation_drift():
+    """
+    (product id, warehouse id, stock quantity, valued quantity) of every pair
+    whose valuation does not account for exactly the stock on hand. Both are
+    moved together, drift means stock that predates valuation or rows
+    written around record_purchase, record_sale and record_adjustment.
+    """
+    valued = StockValuation.objects.filter(
+        product_id=OuterRef("product_id"), warehouse_id=OuterRef("warehouse_id")
+    ).values("quantity")
+    on_hand = Stock.objects.filter(
+        product_id=OuterRef("product_id"), warehouse_id=OuterRef("warehouse_id")
+    ).values("quantity")
+    zero = Value(0, output_field=IntegerField())
+    stock = (
+        Stock.objects.annotate(valued=Coalesce(Subquery(valued), zero))
+        .exclude(valued=F("quantity"))
+        .values_list("product_id", "warehouse_id", "quantity", "valued")
+    )
+    # valued pairs without a stock row at all
+    unstocked = (
+        StockValuation.objects.annotate(on_hand=Subquery(on_hand))
+        .filter(on_hand__isnull=True)
+        .exclude(quantity=0)
+        .values_list("product_id", "warehouse_id", Value(0), "quantity")
+    )
+    return list(stock) + list(unstocked)
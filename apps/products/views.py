@@ -1,5 +1,14 @@
+from contextlib import contextmanager
+
 from django.shortcuts import render
-from rest_framework.viewsets import ModelViewSet
+from django.db import transaction
+from rest_framework.mixins import ListModelMixin
+from rest_framework.viewsets import (
+    GenericViewSet,
+    ModelViewSet,
+    ReadOnlyModelViewSet,
+    ViewSet,
+)
 from apps.products.models import (
     Brand,
     Sales,
@@ -11,6 +20,8 @@ from apps.products.models import (
     SalesInvoice,
     Adjustment,
     AdjustmentItems,
+    Stock,
+    StockValuation,
 )
 
 from apps.products.serializers import (
@@ -20,6 +31,7 @@ from apps.products.serializers import (
     GETProductSerializer,
     UnitSerializer,
     BarcodeSerializer,
+    BarcodeBatchSerializer,
     GETBarcodeSerializer,
     GetCategorySeralizer,
     GetUnitSeralizer,
@@ -31,16 +43,27 @@ from apps.products.serializers import (
     SalesInvoiceSerializer,
     AdjustmentSerializer,
     AdjustmentItemsSerializer,
+    StockSerializer,
+    StockValuationSerializer,
+    ValuationQuerySerializer,
+    CostOfGoodsSoldQuerySerializer,
+    SalesReportQuerySerializer,
 )
 from apps.accounts.serializers import UserSerializer
 from rest_framework import serializers
-from utils.paginations import MyPagination
+from utils.paginations import KeysetPagination, CustomPagination
 from rest_framework.permissions import BasePermission
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.decorators import action
 from utils.permissions import SupplierPermission
+from utils.query_plans import QueryPlanMixin
+from utils.exports import ExportMixin
+from utils.conditional import ConditionalGetMixin
+from utils.async_views import AsyncReadMixin
+from utils.reference_cache import registry as reference_caches
 from rest_framework.permissions import (
     AllowAny,
     IsAdminUser,
@@ -50,22 +73,41 @@ from django.shortcuts import get_object_or_404
 
 from apps.store.models import Warehouse
 from apps.products.models import Barcode
-
-import barcode
-from PIL import Image
-from io import BytesIO
-import uuid
-import os
-from barcode.writer import ImageWriter
+from apps.products.search import ProductSearchFilter
+from apps.products.barcodes import (
+    BATCH_INLINE_LIMIT,
+    generate_barcodes,
+    queue_barcodes,
+    render_barcode,
+)
+from apps.products.imports import ProductImporter
+from utils.imports import ImportFileSerializer
+from apps.products.stock import (
+    InsufficientStock,
+    apply_adjustment,
+    reverse_adjustment,
+)
+from apps.products.low_stock import low_stock
+from apps.products.rollups import sales_report
+from apps.products.valuation import (
+    cost_of_goods_sold,
+    delete_order,
+    inventory_value,
+    record_adjustment,
+    record_purchase,
+    record_sale,
+    replay,
+    update_order,
+)
 
 # Create your views here.
 
 
-class MyPagination(ModelViewSet):
-    pagination_class = MyPagination
+class MyPagination(QueryPlanMixin, ModelViewSet):
+    pagination_class = KeysetPagination
 
 
-class BrandViewSet(MyPagination):
+class BrandViewSet(ConditionalGetMixin, MyPagination):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializers
     http_method_names = ["get", "post", "put", "delete"]
@@ -90,7 +132,7 @@ class BrandViewSet(MyPagination):
         return super().get_serializer_class()
 
 
-class CategoryViewSet(MyPagination):
+class CategoryViewSet(ConditionalGetMixin, MyPagination):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     http_method_names = ["get", "post", "delete"]
@@ -107,14 +149,14 @@ class CategoryViewSet(MyPagination):
         return super().get_serializer_class()
 
 
-class UnitViewSet(ModelViewSet):
+class UnitViewSet(ConditionalGetMixin, QueryPlanMixin, ModelViewSet):
     queryset = Unit.objects.all()
     serializer_class = UnitSerializer
     http_method_names = ["get", "post", "put", "patch", "delete"]
     # permission_classes = [IsUserAdmin]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # no OrderingFilter, the keyset pagination fixes the order
+    filter_backends = [filters.SearchFilter]
     search_fields = ["=short_name"]
-    ordering_fields = ["short_name"]
 
     def create(self, request, *args, **kwargs):
         serializers = UnitSerializer(data=request.data)
@@ -128,18 +170,31 @@ class UnitViewSet(ModelViewSet):
         return super().get_serializer_class()
 
 
-class ProductViewSet(ModelViewSet):
-    queryset = Product.objects.all()
+class ProductViewSet(
+    ConditionalGetMixin, AsyncReadMixin, ExportMixin, QueryPlanMixin, ModelViewSet
+):
+    queryset = Product.objects.defer("search_vector")
     serializer_class = ProductSerializer
     http_method_names = ["get", "post", "put", "patch", "delete"]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter]
     filterset_fields = ["created_by"]
     search_fields = ["product_name"]
+    # ranked search results are ordered by relevance, not by the keyset
+    search_pagination_class = CustomPagination
     permission_classes_by_action = {
         "list": [AllowAny],
         "retrieve": [IsAuthenticated],
         "create": [IsAdminUser | SupplierPermission],
         "update": [IsAuthenticated | SupplierPermission],
+        "bulk_import": [IsAdminUser | SupplierPermission],
+    }
+    # list renders ids only: validators, page (and its count for ranked
+    # search results) and warehouse ids; retrieve adds one query per
+    # reference model (brand, category, unit, warehouse) missing from a cold
+    # reference cache
+    query_budget_by_action = {
+        "list": 4,
+        "retrieve": 7,
     }
 
     def get_permissions(self):
@@ -156,46 +211,113 @@ class ProductViewSet(ModelViewSet):
             return GETProductSerializer
         return super().get_serializer_class()
 
-
-class BarcodeViewset(ModelViewSet):
+    @action(methods=["POST"], detail=False, url_path="import")
+    def bulk_import(self, request):
+        '''
+            for importing a whole catalog from a csv or jsonl file, returns
+            the number of created products and the errors of every bad row
+        '''
+        upload = ImportFileSerializer(data=request.data)
+        upload.is_valid(raise_exception=True)
+
+        importer = ProductImporter(user=request.user)
+        report = importer.run(upload.rows())
+        return Response(report, status=status.HTTP_201_CREATED)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator") and self.request.query_params.get(
+            ProductSearchFilter.search_param
+        ):
+            self._paginator = self.search_pagination_class()
+        return super().paginator
+
+
+class BarcodeViewset(QueryPlanMixin, ModelViewSet):
     queryset = Barcode.objects.all()
     serializer_class = BarcodeSerializer
 
     def create(self, request, *args, **kwargs):
-        product_infromation = request.data.get("information")
-        get_current_product = Product.objects.get(id=product_infromation)
+        serializer = BarcodeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        get_current_product = serializer.validated_data["information"]
         get_current_product_code = str(get_current_product.product_code)
         if not get_current_product_code:
-            # print(product_infromation.product_code)
             return Response(
                 {"error": "Product code is required."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        barcode_class = barcode.get_barcode_class("code128")
-        code = barcode_class(get_current_product_code, writer=ImageWriter())
-
-        unique_filename = f"barcode_{uuid.uuid4()}"
-
-        directory_path = "barcode-image/"
-        if not os.path.exists(directory_path):
-            os.makedirs(directory_path)
-        barcode_image = code.save(f"barcode-image/{unique_filename}")
-
-        serializer = BarcodeSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        # the same code on the same paper is rendered once and then reused
+        barcode_image = render_barcode(
+            get_current_product_code, serializer.validated_data["papersize"]
+        )
         serializer.save(barcode_image=barcode_image)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(methods=["POST"], detail=False, url_path="batch")
+    def batch(self, request):
+        '''
+            for labelling many products at once, either the given products
+            or every product of a warehouse. Batches over BATCH_INLINE_LIMIT
+            products are queued for the worker and answered with 202
+        '''
+        serializer = BarcodeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        papersize = serializer.validated_data["papersize"]
+
+        products = Product.objects.only("id", "product_code").order_by("id")
+        if serializer.validated_data.get("products"):
+            products = products.filter(id__in=serializer.validated_data["products"])
+        if serializer.validated_data.get("warehouse"):
+            products = products.filter(warehouse=serializer.validated_data["warehouse"])
+
+        batch = list(products[: BATCH_INLINE_LIMIT + 1])
+        if len(batch) > BATCH_INLINE_LIMIT:
+            # too many to render while the client waits, the worker labels them
+            product_ids = list(products.values_list("id", flat=True))
+            tasks = queue_barcodes(product_ids, papersize)
+            return Response(
+                {"queued": len(product_ids), "tasks": len(tasks)},
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        # small enough that a process pool would cost more than it saves
+        barcodes = generate_barcodes(batch, papersize, processes=1)
+        return Response(
+            {"data": BarcodeSerializer(barcodes, many=True).data},
+            status=status.HTTP_201_CREATED,
+        )
+
     def get_serializer_class(self):
         if self.action == "retrieve":
             return GETBarcodeSerializer
         return super().get_serializer_class()
 
 
-class PurchaseViewSet(ModelViewSet):
+@contextmanager
+def moving_stock():
+    """
+    Stock movements and the rows they belong to commit together, a movement
+    that would oversell is a validation error.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except InsufficientStock as exc:
+        raise serializers.ValidationError(
+            {exc.product.product_name: "Quantity is greater than stock"}
+        )
+
+
+class PurchaseViewSet(ExportMixin, QueryPlanMixin, ModelViewSet):
     queryset = Purchase.objects.all()
     serializer_class = PurchaseSerializer
+    filterset_fields = ["warehouse", "supplier", "sales_status"]
+    # the page, its products and its lines; retrieve also loads the
+    # products' warehouses and checks SupplierPermission, plus one query
+    # when the reference cache is cold
+    query_budget_by_action = {"list": 3, "retrieve": 6}
 
     permission_classes_by_action = {
         "list": [AllowAny],
@@ -203,6 +325,7 @@ class PurchaseViewSet(ModelViewSet):
         "create": [SupplierPermission],
         "update": [SupplierPermission],
         "destroy": [SupplierPermission],
+        "export": [IsAdminUser],
     }
 
     def get_permissions(self):
@@ -219,16 +342,38 @@ class PurchaseViewSet(ModelViewSet):
             return GetPurchaseSerializer
         return super().get_serializer_class()
 
+    def perform_create(self, serializer):
+        with moving_stock():
+            record_purchase(serializer.save())
 
-class SalesViewSet(ModelViewSet):
+    def perform_update(self, serializer):
+        with moving_stock():
+            update_order(serializer.instance, serializer.save)
+
+    def perform_destroy(self, instance):
+        with moving_stock():
+            delete_order(instance)
+
+
+class SalesViewSet(ExportMixin, QueryPlanMixin, ModelViewSet):
     queryset = Sales.objects.all()
     serializer_class = SalesSerializer
+    # the page or the row, its products and its lines
+    query_budget_by_action = {"list": 3, "retrieve": 3}
+    filterset_fields = [
+        "warehouse",
+        "customer",
+        "biller",
+        "sales_status",
+        "payment_status",
+    ]
     permission_classes_by_action = {
         "list": [AllowAny],
         "retrieve": [IsAuthenticated],
         "create": [IsAdminUser],
         "update": [IsAdminUser],
         "destroy": [IsAdminUser],
+        "export": [IsAdminUser],
     }
 
     def get_permissions(self):
@@ -240,8 +385,20 @@ class SalesViewSet(ModelViewSet):
         except:
             return [permission() for permission in self.permission_classes]
 
+    def perform_create(self, serializer):
+        with moving_stock():
+            record_sale(serializer.save())
+
+    def perform_update(self, serializer):
+        with moving_stock():
+            update_order(serializer.instance, serializer.save)
+
+    def perform_destroy(self, instance):
+        with moving_stock():
+            delete_order(instance)
 
-class PurchaseInvoiceViewSet(ModelViewSet):
+
+class PurchaseInvoiceViewSet(QueryPlanMixin, ModelViewSet):
     queryset = PurchaseInvoice.objects.all()
     serializer_class = PurchaseInvoiceSerializer
 
@@ -263,7 +420,7 @@ class PurchaseInvoiceViewSet(ModelViewSet):
             return [permission() for permission in self.permission_classes]
 
 
-class SalesInvoiceViewSet(ModelViewSet):
+class SalesInvoiceViewSet(QueryPlanMixin, ModelViewSet):
     queryset = SalesInvoice.objects.all()
     serializer_class = SalesInvoiceSerializer
 
@@ -285,7 +442,7 @@ class SalesInvoiceViewSet(ModelViewSet):
             return [permission() for permission in self.permission_classes]
 
 
-class AdjustmentViewSet(ModelViewSet):
+class AdjustmentViewSet(QueryPlanMixin, ModelViewSet):
     queryset = Adjustment.objects.all()
     serializer_class = AdjustmentSerializer
     permission_classes_by_action = {
@@ -306,6 +463,41 @@ class AdjustmentViewSet(ModelViewSet):
         serializer = AdjustmentSerializer(adjustment)
         return Response({"success": "ok", "data": serializer.data})
 
+    def perform_update(self, serializer):
+        # items move the stock of their adjustment's warehouse
+        with moving_stock():
+            adjustment = Adjustment.objects.select_for_update().get(
+                pk=serializer.instance.pk
+            )
+            items = list(self.items(adjustment))
+            for item in items:
+                reverse_adjustment(item)
+            adjustment = serializer.save()
+            pairs = set()
+            for item in items:
+                pairs.add((item.product_id, item.adjustment.warehouse_id))
+                item.adjustment = adjustment
+                apply_adjustment(item)
+                pairs.add((item.product_id, adjustment.warehouse_id))
+            replay(pairs)
+
+    def perform_destroy(self, instance):
+        # deleting the adjustment deletes its items, undo what they moved
+        with moving_stock():
+            instance = Adjustment.objects.select_for_update().get(pk=instance.pk)
+            items = list(self.items(instance))
+            for item in items:
+                reverse_adjustment(item)
+            instance.delete()
+            replay({(item.product_id, instance.warehouse_id) for item in items})
+
+    def items(self, adjustment):
+        return (
+            AdjustmentItems.objects.select_for_update()
+            .select_related("adjustment__warehouse", "product")
+            .filter(adjustment=adjustment)
+        )
+
     def get_permissions(self):
         try:
             return [
@@ -316,7 +508,7 @@ class AdjustmentViewSet(ModelViewSet):
             return [permission() for permission in self.permission_classes]
 
 
-class AdjustmentItemsViewSet(ModelViewSet):
+class AdjustmentItemsViewSet(QueryPlanMixin, ModelViewSet):
     queryset = AdjustmentItems.objects.all()
     serializer_class = AdjustmentItemsSerializer
     permission_classes_by_action = {
@@ -330,10 +522,44 @@ class AdjustmentItemsViewSet(ModelViewSet):
     def create(self, request):
         serializer = AdjustmentItemsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        adjustment = AdjustmentItems.objects.create(**serializer.validated_data)
+
+        # the item and its stock movement are committed together or not at all
+        with moving_stock():
+            adjustment = AdjustmentItems.objects.create(**serializer.validated_data)
+            apply_adjustment(adjustment)
+            record_adjustment(adjustment)
         serializer = AdjustmentItemsSerializer(adjustment)
         return Response({"data": serializer.data})
 
+    def perform_update(self, serializer):
+        # the old movement is undone and the edited one applied in one go, the
+        # row lock keeps two edits from both undoing the same movement; the
+        # valuation of both the old and the new pair is replayed
+        with moving_stock():
+            serializer.instance = self.locked(serializer.instance)
+            old = self.pair(serializer.instance)
+            reverse_adjustment(serializer.instance)
+            item = serializer.save()
+            apply_adjustment(item)
+            replay({old, self.pair(item)})
+
+    def perform_destroy(self, instance):
+        with moving_stock():
+            instance = self.locked(instance)
+            reverse_adjustment(instance)
+            instance.delete()
+            replay({self.pair(instance)})
+
+    def pair(self, item):
+        return item.product_id, item.adjustment.warehouse_id
+
+    def locked(self, instance):
+        return (
+            AdjustmentItems.objects.select_for_update()
+            .select_related("adjustment__warehouse", "product")
+            .get(pk=instance.pk)
+        )
+
     def get_permissions(self):
         try:
             return [
@@ -342,3 +568,70 @@ class AdjustmentItemsViewSet(ModelViewSet):
             ]
         except:
             return [permission() for permission in self.permission_classes]
+
+
+class StockViewSet(QueryPlanMixin, ReadOnlyModelViewSet):
+    queryset = Stock.objects.all()
+    serializer_class = StockSerializer
+    filterset_fields = ["product", "warehouse"]
+    query_budget_by_action = {"list": 1, "retrieve": 1}
+
+
+class LowStockViewSet(QueryPlanMixin, ListModelMixin, GenericViewSet):
+    # stock at or below its alert quantity, paged by keyset over stock_low_idx
+    queryset = low_stock()
+    serializer_class = StockSerializer
+    pagination_class = KeysetPagination
+    permission_classes = [IsAdminUser]
+    filterset_fields = ["warehouse"]
+    query_budget_by_action = {"list": 1}
+
+
+class StockValuationViewSet(QueryPlanMixin, ReadOnlyModelViewSet):
+    queryset = StockValuation.objects.all()
+    serializer_class = StockValuationSerializer
+    permission_classes = [IsAdminUser]
+    filterset_fields = ["product", "warehouse"]
+
+    @action(methods=["GET"], detail=False, url_path="summary")
+    def summary(self, request):
+        '''
+            current stock value under ?method=FIFO|Average, optionally for
+            one warehouse and/or product
+        '''
+        query = ValuationQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(inventory_value(**query.validated_data))
+
+    @action(methods=["GET"], detail=False, url_path="cogs")
+    def cogs(self, request):
+        '''
+            cost of goods sold between ?start and ?end
+        '''
+        query = CostOfGoodsSoldQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(cost_of_goods_sold(**query.validated_data))
+
+
+class SalesReportViewSet(ViewSet):
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        '''
+            sales per ?dimension (warehouse, brand, category, biller or
+            customer_group) and day or month, read from the daily rollups
+        '''
+        query = SalesReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        results = sales_report(**query.validated_data)
+        return Response({**query.validated_data, "results": results})
+
+
+class ReferenceCacheViewSet(ViewSet):
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        '''
+            hit and miss counters of this process's reference data cache
+        '''
+        return Response([cache.stats() for cache in reference_caches.values()])
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['created_on', 'id'], name='warehouse_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.5 on 2026-10-18 20:32
+
+from django.db import migrations
+import utils.phones
+import utils.validations
+
+
+def normalize_phones(apps, schema_editor):
+    utils.phones.normalize_stored(apps.get_model("store", "Warehouse"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_phones, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='warehouse',
+            name='phone',
+            field=utils.phones.PhoneNumberField(max_length=255, unique=True, validators=[utils.validations.validate_mobile_number]),
+        ),
+    ]
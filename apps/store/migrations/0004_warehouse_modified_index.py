@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_e164_phones'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['modified_on'], name='warehouse_modified_idx'),
+        ),
+    ]
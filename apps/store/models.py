@@ -1,15 +1,23 @@
 from django.db import models
 from utils.models import CommonInfo, Address
 from utils.validations import validate_mobile_number
+from utils.phones import PhoneNumberField
 
 
 # Create your models here.
 class Warehouse(CommonInfo, Address):
     name = models.CharField(max_length=100)
-    phone = models.CharField(
-         unique=True, validators=[validate_mobile_number]
+    # stored in E.164 form; the column was unbounded before and a number
+    # that does not parse keeps its raw form
+    phone = PhoneNumberField(
+         max_length=255, unique=True, validators=[validate_mobile_number]
     )
     email = models.EmailField(unique=True)
 
+    class Meta(CommonInfo.Meta):
+        indexes = CommonInfo.Meta.indexes + [
+            models.Index(fields=["modified_on"], name="warehouse_modified_idx"),
+        ]
+
     def __str__(self):
         return self.name 
\ No newline at end of file
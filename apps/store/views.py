@@ -2,8 +2,11 @@ from rest_framework.viewsets import ModelViewSet
 from rest_framework import serializers
 from apps.store.models import Warehouse
 from apps.store.serializers import WarehouseSerializer
+from utils.async_views import AsyncReadMixin
+from utils.conditional import ConditionalGetMixin
+from utils.query_plans import QueryPlanMixin
 
-class WarehouseViewset(ModelViewSet):
+class WarehouseViewset(ConditionalGetMixin, AsyncReadMixin, QueryPlanMixin, ModelViewSet):
     queryset = Warehouse.objects.all()
     serializer_class = WarehouseSerializer
     http_method_names = ['get','post','put','delete']
\ No newline at end of file
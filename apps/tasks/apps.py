@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TasksConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.tasks'
+
+    def ready(self):
+        # handlers register themselves in each app's tasks module
+        import apps.tasks.mail  # noqa: F401
+        autodiscover_modules("tasks")
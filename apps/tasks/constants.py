@@ -0,0 +1,9 @@
+QUEUED = "queued"
+RUNNING = "running"
+FAILED = "failed"
+
+TASK_STATUS = [
+    (QUEUED, "Queued"),
+    (RUNNING, "Running"),
+    (FAILED, "Failed"),
+]
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from apps.tasks.queue import enqueue, register
+
+
+def send_mail_later(subject, message, recipient_list, from_email=None):
+    """
+    Queues a plain text email for the worker instead of talking SMTP inside
+    the request.
+    """
+    return enqueue(
+        "mail.send",
+        {
+            "subject": subject,
+            "body": message,
+            "from_email": from_email or settings.EMAIL_HOST_USER,
+            "to": list(recipient_list),
+        },
+    )
+
+
+def deliver(messages):
+    """
+    Sends `messages` over one SMTP connection and returns, per message, None
+    or the exception the server answered with. When the connection cannot
+    be opened the exception propagates.
+    """
+    results = []
+    with get_connection(fail_silently=False) as mail_connection:
+        for message in messages:
+            try:
+                mail_connection.send_messages([message])
+            except Exception as exc:
+                results.append(exc)
+            else:
+                results.append(None)
+    return results
+
+
+@register("mail.send", batch=True)
+def send_queued_mail(payloads):
+    """
+    Sends a claimed batch over one SMTP connection. A message the server
+    rejects fails (and is retried) on its own; when the connection cannot
+    be opened the whole batch is retried.
+    """
+    return deliver([EmailMessage(**payload) for payload in payloads])
@@ -0,0 +1,46 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from apps.tasks.queue import queue_setting, run_worker
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the task table until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads", type=int, default=1, help="Worker threads (and connections)."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=queue_setting("BATCH_SIZE"),
+            help="Tasks a thread claims at once.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=queue_setting("POLL_INTERVAL"),
+            help="Seconds an idle thread waits before polling again.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once no task is due."
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop.set())
+
+        self.stdout.write(f"Worker started with {options['threads']} thread(s).")
+        run_worker(
+            threads=options["threads"],
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+            once=options["once"],
+            stop=stop,
+        )
+        self.stdout.write(self.style.SUCCESS("Worker stopped."))
@@ -0,0 +1,40 @@
+from django.db import models
+from django.utils import timezone
+
+from apps.tasks.constants import QUEUED, RUNNING, TASK_STATUS
+
+
+class Task(models.Model):
+    """
+    One unit of background work, see apps.tasks.queue. Finished tasks are
+    deleted, failed ones are kept with their last error.
+    """
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(choices=TASK_STATUS, max_length=10, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # a running task whose worker died is queued again after this
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # workers claim due tasks in run_after order, see queue.claim()
+            models.Index(
+                fields=["run_after", "id"],
+                name="task_due_idx",
+                condition=models.Q(status=QUEUED),
+            ),
+            models.Index(
+                fields=["locked_until"],
+                name="task_running_idx",
+                condition=models.Q(status=RUNNING),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
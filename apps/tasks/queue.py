@@ -0,0 +1,208 @@
+import logging
+import random
+import threading
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.tasks.constants import FAILED, QUEUED, RUNNING
+from apps.tasks.models import Task
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # tasks a worker thread claims at once
+    "BATCH_SIZE": 50,
+    # seconds an idle worker thread waits before polling again
+    "POLL_INTERVAL": 1.0,
+    # seconds a claimed task may run before another worker takes it over
+    "LEASE": 300,
+    # retry n waits RETRY_DELAY * 2 ** (n - 1) seconds, at most RETRY_MAX_DELAY
+    "RETRY_DELAY": 10,
+    "RETRY_MAX_DELAY": 3600,
+}
+
+
+def queue_setting(name):
+    return getattr(settings, "TASK_QUEUE", {}).get(name, DEFAULTS[name])
+
+
+class Handler:
+    def __init__(self, func, batch):
+        self.func = func
+        self.batch = batch
+
+
+registry = {}
+
+
+def register(name, batch=False):
+    """
+    Registers the decorated function as the handler of `name` tasks. A
+    handler takes one payload; with batch=True it takes the list of payloads
+    a worker claimed together and returns one result per payload, an
+    exception instance marking that payload as failed.
+    """
+
+    def decorator(func):
+        registry[name] = Handler(func, batch)
+        return func
+
+    return decorator
+
+
+def enqueue(name, payload=None, delay=None, max_attempts=None):
+    """
+    Queues a `name` task. Inside a transaction workers only see it once the
+    transaction commits.
+    """
+    task = Task(name=name, payload=payload or {})
+    if delay is not None:
+        task.run_after = timezone.now() + timedelta(seconds=delay)
+    if max_attempts is not None:
+        task.max_attempts = max_attempts
+    task.save()
+    return task
+
+
+def retry_delay(attempts):
+    delay = min(
+        queue_setting("RETRY_DELAY") * 2 ** (attempts - 1),
+        queue_setting("RETRY_MAX_DELAY"),
+    )
+    # spread retries of tasks that failed together
+    return delay * random.uniform(0.8, 1.2)
+
+
+def release_expired():
+    """
+    Queues again the tasks whose worker died (or hung) past its lease.
+    """
+    return Task.objects.filter(status=RUNNING, locked_until__lt=timezone.now()).update(
+        status=QUEUED, locked_until=None
+    )
+
+
+def claim(batch_size=None):
+    """
+    Locks up to `batch_size` due tasks for this worker. SKIP LOCKED lets
+    concurrent workers claim disjoint batches without waiting on each other.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=QUEUED, run_after__lte=now)
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)[: batch_size or queue_setting("BATCH_SIZE")]
+        )
+        if not ids:
+            return []
+        Task.objects.filter(id__in=ids).update(
+            status=RUNNING,
+            attempts=F("attempts") + 1,
+            locked_until=now + timedelta(seconds=queue_setting("LEASE")),
+        )
+        return list(Task.objects.filter(id__in=ids).order_by("run_after", "id"))
+
+
+def run_handler(name, tasks):
+    """
+    [(task, exception or None)] for `tasks`, all named `name`.
+    """
+    handler = registry.get(name)
+    if handler is None:
+        error = LookupError(f"No handler registered for {name!r} tasks.")
+        return [(task, error) for task in tasks]
+
+    if handler.batch:
+        try:
+            results = list(handler.func([task.payload for task in tasks]))
+            if len(results) != len(tasks):
+                raise ValueError(f"{name!r} handler returned {len(results)} results.")
+        except Exception as exc:
+            results = [exc] * len(tasks)
+        return [
+            (task, result if isinstance(result, Exception) else None)
+            for task, result in zip(tasks, results)
+        ]
+
+    outcomes = []
+    for task in tasks:
+        try:
+            handler.func(task.payload)
+        except Exception as exc:
+            outcomes.append((task, exc))
+        else:
+            outcomes.append((task, None))
+    return outcomes
+
+
+def finish(task, error):
+    if error is None:
+        Task.objects.filter(pk=task.pk).delete()
+        return
+
+    message = "".join(traceback.format_exception(error)).strip()
+    if task.attempts >= task.max_attempts:
+        logger.error("Task %s failed for good: %s", task, error)
+        Task.objects.filter(pk=task.pk).update(
+            status=FAILED, locked_until=None, last_error=message
+        )
+    else:
+        logger.warning("Task %s failed, retrying: %s", task, error)
+        Task.objects.filter(pk=task.pk).update(
+            status=QUEUED,
+            locked_until=None,
+            last_error=message,
+            run_after=timezone.now() + timedelta(seconds=retry_delay(task.attempts)),
+        )
+
+
+def work(batch_size=None):
+    """
+    Claims and runs one batch, handing tasks of the same name to their
+    handler together. Returns the number of tasks processed.
+    """
+    tasks = claim(batch_size)
+    by_name = defaultdict(list)
+    for task in tasks:
+        by_name[task.name].append(task)
+    for name, named_tasks in by_name.items():
+        for task, error in run_handler(name, named_tasks):
+            finish(task, error)
+    return len(tasks)
+
+
+def run_worker(threads=1, batch_size=None, poll_interval=None, once=False, stop=None):
+    """
+    Runs `threads` polling loops until `stop` is set, or with once=True until
+    no task is due. Each thread uses its own database connection.
+    """
+    stop = stop or threading.Event()
+    poll_interval = poll_interval or queue_setting("POLL_INTERVAL")
+
+    def loop(index):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                if index == 0:
+                    release_expired()
+                if work(batch_size):
+                    continue
+                if once:
+                    break
+                stop.wait(poll_interval)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(loop, index) for index in range(threads)]:
+            future.result()
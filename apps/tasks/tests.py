@@ -0,0 +1,208 @@
+import socketserver
+import threading
+from datetime import timedelta
+from email import message_from_bytes
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.tasks.constants import FAILED, QUEUED, RUNNING
+from apps.tasks.mail import send_mail_later
+from apps.tasks.models import Task
+from apps.tasks.queue import claim, enqueue, register, release_expired, work
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for smtplib: records every message and rejects the
+    recipients listed in server.rejected.
+    """
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost debugging server")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                address = line.split(":", 1)[1].strip("<> ")
+                if address in self.server.rejected:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b""
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b".\r\n", b""):
+                        break
+                    data += chunk
+                self.server.messages.append((recipients, message_from_bytes(data)))
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class DebuggingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.rejected = set()
+
+
+class SMTPServerMixin:
+    def setUp(self):
+        super().setUp()
+        self.smtp = DebuggingSMTPServer()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+        settings = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=self.smtp.server_address[1],
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_USE_TLS=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+calls = []
+
+
+@register("tests.flaky")
+def flaky(payload):
+    calls.append(payload)
+    if payload.get("fail"):
+        raise RuntimeError("boom")
+
+
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_claimed_tasks_are_locked_and_leased(self):
+        first = enqueue("tests.flaky", {"n": 1})
+        enqueue("tests.flaky", {"n": 2}, delay=60)
+        tasks = claim()
+        self.assertEqual([task.pk for task in tasks], [first.pk])
+        self.assertEqual(tasks[0].status, RUNNING)
+        self.assertEqual(tasks[0].attempts, 1)
+        self.assertEqual(claim(), [])
+
+        Task.objects.filter(pk=first.pk).update(locked_until=timezone.now())
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual([task.pk for task in claim()], [first.pk])
+
+    def test_claim_uses_the_due_index(self):
+        plan = (
+            Task.objects.filter(status=QUEUED, run_after__lte=timezone.now())
+            .order_by("run_after", "id")
+            .explain()
+        )
+        self.assertIn("task_due_idx", plan)
+
+    def test_finished_tasks_are_deleted_and_failures_retried(self):
+        enqueue("tests.flaky", {"n": 1})
+        failing = enqueue("tests.flaky", {"fail": True}, max_attempts=2)
+        self.assertEqual(work(), 2)
+        self.assertEqual(len(calls), 2)
+
+        failing.refresh_from_db()
+        self.assertEqual(list(Task.objects.values_list("pk", flat=True)), [failing.pk])
+        self.assertEqual(failing.status, QUEUED)
+        self.assertIn("RuntimeError: boom", failing.last_error)
+        # backoff of RETRY_DELAY (10s) give or take the jitter
+        self.assertGreater(failing.run_after, timezone.now() + timedelta(seconds=7))
+
+        self.assertEqual(work(), 0)
+        Task.objects.filter(pk=failing.pk).update(run_after=timezone.now())
+        work()
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, FAILED)
+        self.assertEqual(failing.attempts, 2)
+
+    def test_unknown_tasks_fail(self):
+        task = enqueue("tests.missing", max_attempts=1)
+        work()
+        task.refresh_from_db()
+        self.assertEqual(task.status, FAILED)
+        self.assertIn("No handler registered", task.last_error)
+
+
+class MailTaskTestCase(SMTPServerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email="user@example.com",
+            password="secret-pass-123",
+            full_name="User",
+            username="user",
+            phone="+9779800000000",
+        )
+
+    def test_forgot_password_only_queues_the_mail(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            "/api/user/forgot-password/", {"email": self.user.email}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.smtp.messages, [])
+        self.assertEqual(Task.objects.get().name, "otp.send")
+
+        work()
+        recipients, message = self.smtp.messages[0]
+        self.assertEqual(recipients, [self.user.email])
+        self.assertEqual(message["Subject"], "Your OTP Code")
+        self.assertFalse(Task.objects.exists())
+
+    def test_a_batch_shares_one_connection(self):
+        self.smtp.rejected.add("nobody@example.com")
+        for index in range(5):
+            send_mail_later("Hello", "Body", [f"user{index}@example.com"])
+        send_mail_later("Hello", "Body", ["nobody@example.com"])
+
+        self.assertEqual(work(), 6)
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 5)
+        rejected = Task.objects.get()
+        self.assertEqual(rejected.status, QUEUED)
+        self.assertIn("nobody@example.com", rejected.last_error)
+
+
+class RunWorkerTestCase(SMTPServerMixin, TransactionTestCase):
+    def test_worker_threads_drain_the_queue(self):
+        for index in range(20):
+            send_mail_later("Hello", "Body", [f"user{index}@example.com"])
+        call_command(
+            "runworker", "--threads", "3", "--batch-size", "4", "--once", stdout=StringIO()
+        )
+        self.assertEqual(len(self.smtp.messages), 20)
+        self.assertFalse(Task.objects.exists())
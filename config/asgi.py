@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# fill the reference cache before the worker takes its first request
+from utils.reference_cache import boot_warm_up  # noqa: E402
+
+boot_warm_up()
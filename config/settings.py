@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 from decouple import config
 
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     
     # Third Party Apps
     "rest_framework",
@@ -48,24 +50,30 @@ INSTALLED_APPS = [
     "apps.accounts",
     "apps.products",
     "apps.store",
+    "apps.tasks",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "utils.diagnostics.QueryDiagnosticsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "utils.audit.AuditContextMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "apps.accounts.middlewares.CustomMiddleware",
 ]
 
 REST_FRAMEWORK = {
-    "DEFAULT_PAGINATION_CLASS" : "rest_framework.pagination.PageNumberPagination",
-    "PAGE_SIZE" : 1,
+    "DEFAULT_PAGINATION_CLASS" : "utils.paginations.KeysetPagination",
+    "PAGE_SIZE" : 10,
     
     
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "apps.accounts.authentication.SignedTokenAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+    ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
@@ -73,6 +81,66 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS" : ['django_filters.rest_framework.DjangoFilterBackend']
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# utils.reference_cache: in-process LRU in front of the CACHES alias below
+REFERENCE_CACHE = {
+    "ALIAS": "default",
+    "TTL": 30,
+    "MAXSIZE": 4096,
+    "TIMEOUT": 3600,
+    "WARM_UP": [
+        "products.Brand",
+        "products.Category",
+        "products.Unit",
+        "store.Warehouse",
+    ],
+}
+
+# apps.tasks.queue, see the runworker command
+TASK_QUEUE = {
+    "BATCH_SIZE": 50,
+    "POLL_INTERVAL": 1.0,
+    "LEASE": 300,
+    "RETRY_DELAY": 10,
+    "RETRY_MAX_DELAY": 3600,
+}
+
+# apps.accounts.tokens, lifetimes and revocation sync in seconds
+AUTH_TOKENS = {
+    "ACCESS_LIFETIME": 300,
+    "REFRESH_LIFETIME": 7 * 24 * 3600,
+    "REVOCATION_SYNC": 30,
+}
+
+# utils.phones, numbers are stored in E.164 form
+PHONE_NUMBERS = {
+    "DEFAULT_REGION": None,
+    "CACHE_SIZE": 8192,
+}
+
+# utils.diagnostics, thresholds in ms and queries
+QUERY_DIAGNOSTICS = {
+    "ENABLED": True,
+    "SERVER_TIMING": True,
+    "SLOW_REQUEST_MS": 500,
+    "SLOW_QUERY_COUNT": 50,
+    "DUPLICATE_THRESHOLD": 5,
+    # an action over its query budget fails the test run
+    "STRICT": sys.argv[1:2] == ["test"],
+}
+
+# utils.numbering formats, {number} is the allocated number
+NUMBERING = {
+    "biller_code": "BC-{number:05d}",
+    "purchase_invoice": "PI-{number:06d}",
+    "sales_invoice": "SI-{number:06d}",
+}
+
 ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
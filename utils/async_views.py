@@ -0,0 +1,132 @@
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework.response import Response
+
+
+async def afetch(queryset):
+    """
+    Evaluates `queryset` without blocking the event loop. aiterator() does
+    not support prefetch_related() before Django 5.0, so querysets with
+    prefetches are fetched whole (their prefetch queries included) by
+    `async for` over the queryset instead.
+    """
+    if queryset._prefetch_related_lookups:
+        return [row async for row in queryset]
+    return [row async for row in queryset.aiterator()]
+
+
+async def aserialize(serializer):
+    # nested fields may still read the reference cache or the database
+    return await sync_to_async(lambda: serializer.data)()
+
+
+class AsyncReadMixin:
+    """
+    Serves the list and retrieve actions of a viewset as coroutines, so under
+    ASGI a slow query no longer holds a worker thread. Every other action is
+    handed to the regular synchronous view. Authentication, permissions,
+    throttling and filtering run through sync_to_async, the queries through
+    the async ORM, and the serializers and response shapes stay the same.
+
+    Viewsets customise the async path with alist() / aretrieve(); a
+    paginator may provide apaginate_queryset(), see KeysetPagination.
+    """
+
+    async_actions = ("list", "retrieve")
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not set(actions.values()) & set(cls.async_actions):
+            return view
+
+        async def async_view(request, *args, **kwargs):
+            method = request.method.lower()
+            action = actions.get(method)
+            if method == "head" and action is None:
+                action = actions.get("get")
+            if action not in cls.async_actions:
+                return await sync_to_async(view)(request, *args, **kwargs)
+
+            self = cls(**initkwargs)
+            # the same set up as ViewSetMixin.as_view()
+            self.action_map = actions
+            for method_name, action_name in actions.items():
+                setattr(self, method_name, getattr(self, action_name))
+            if hasattr(self, "get") and not hasattr(self, "head"):
+                self.head = self.get
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.adispatch(request, *args, **kwargs)
+
+        markcoroutinefunction(async_view)
+        async_view.__name__ = view.__name__
+        async_view.__qualname__ = view.__qualname__
+        async_view.cls = view.cls
+        async_view.initkwargs = view.initkwargs
+        async_view.actions = view.actions
+        async_view.csrf_exempt = True
+        return async_view
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        APIView.dispatch() for the async actions.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, f"a{self.action}")
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def afilter_queryset(self):
+        # filter backends may validate against the database
+        return await sync_to_async(self.filter_queryset)(self.get_queryset())
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, "apaginate_queryset"):
+            return await self.paginator.apaginate_queryset(
+                queryset, self.request, view=self
+            )
+        return await sync_to_async(self.paginator.paginate_queryset)(
+            queryset, self.request, view=self
+        )
+
+    async def aget_object(self):
+        queryset = await self.afilter_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset()
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(await aserialize(serializer))
+
+        serializer = self.get_serializer(await afetch(queryset), many=True)
+        return Response(await aserialize(serializer))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(await self.aget_object())
+        return Response(await aserialize(serializer))
@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import models
+from django.utils import timezone
+
+
+# the user (or the request whose user is resolved lazily, after DRF
+# authentication) that writes in the current context are attributed to
+_actor = ContextVar("audit_actor", default=None)
+
+
+def current_user():
+    """
+    User the current request, task or audit_context() acts as, or None.
+    """
+    actor = _actor.get()
+    if actor is None:
+        return None
+    user = getattr(actor, "user", actor) if hasattr(actor, "META") else actor
+    if not getattr(user, "is_authenticated", False):
+        return None
+    return user
+
+
+@contextmanager
+def audit_context(user):
+    """
+    Attributes writes made inside the block to `user`, for management
+    commands, scripts and workers:
+
+        with audit_context(admin):
+            Product.objects.bulk_create(products)
+    """
+    token = _actor.set(user)
+    try:
+        yield user
+    finally:
+        _actor.reset(token)
+
+
+class AuditContextMiddleware:
+    """
+    Makes the request's user the audit actor for the rest of the request.
+    Context variables are copied per task, so concurrent ASGI requests never
+    see each other's user.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _actor.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _actor.reset(token)
+
+    async def __acall__(self, request):
+        token = _actor.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _actor.reset(token)
+
+
+class AuditQuerySet(models.QuerySet):
+    """
+    bulk_create() and bulk_update() stamp created_by / modified_by from the
+    audit context, the way CommonInfo.save() does for single rows.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        user = current_user()
+        if user is not None:
+            for obj in objs:
+                if obj.created_by_id is None:
+                    obj.created_by = user
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        user = current_user()
+        # auto_now is only applied by save()
+        stamped = {"modified_on": timezone.now()}
+        if user is not None:
+            stamped["modified_by"] = user
+        for obj in objs:
+            for name, value in stamped.items():
+                setattr(obj, name, value)
+        fields = list(fields) + [name for name in stamped if name not in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
+AuditManager = models.Manager.from_queryset(AuditQuerySet)
@@ -0,0 +1,184 @@
+import gc
+import math
+import statistics
+import time
+import tracemalloc
+from collections import Counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class Endpoint:
+    """
+    One route to benchmark. `payload(index)` builds the body (the query
+    string of a GET) of the index-th request and `headers(index)` its extra
+    headers, both outside the timing.
+    """
+
+    def __init__(self, name, method, path, payload=None, headers=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.payload = payload
+        self.headers = headers
+
+    def __repr__(self):
+        return f"<Endpoint {self.name} {self.method.upper()} {self.path}>"
+
+
+def router_endpoints(registry, payloads, pks, prefix="/api/", headers=None):
+    """
+    (endpoints, skipped names) for the list, retrieve and create routes and
+    the extra actions of the viewsets in a router `registry`.
+
+    `payloads` maps "basename:action" to a payload builder, writes without
+    one are skipped and reads take it as their query string. `headers`
+    maps "basename:action" to a headers builder. `pks` maps a basename to
+    the pk its detail routes use.
+    """
+    headers = headers or {}
+    endpoints, skipped = [], []
+    for route, viewset, basename in registry:
+        base = f"{prefix}{route}/"
+        pk = pks.get(basename)
+        routes = [("list", "get", False), ("retrieve", "get", True), ("create", "post", False)]
+        routes = [
+            (action, method, detail, None)
+            for action, method, detail in routes
+            if hasattr(viewset, action)
+        ]
+        routes += [
+            (action.url_path, method, action.detail, action.url_path)
+            for action in viewset.get_extra_actions()
+            for method in action.mapping
+        ]
+        for action, method, detail, url_path in routes:
+            name = f"{basename}:{action}"
+            if detail and pk is None:
+                skipped.append(name)
+                continue
+            if method != "get" and name not in payloads:
+                skipped.append(name)
+                continue
+            path = f"{base}{pk}/" if detail else base
+            if url_path:
+                path = f"{path}{url_path}/"
+            endpoints.append(
+                Endpoint(name, method, path, payloads.get(name), headers.get(name))
+            )
+    return endpoints, skipped
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of `values`.
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def call(client, endpoint, index):
+    """
+    The index-th request as a callable, with its payload built already.
+    """
+    data = endpoint.payload(index) if endpoint.payload else None
+    extra = endpoint.headers(index) if endpoint.headers else {}
+    method = getattr(client, endpoint.method)
+    if data is None:
+        send = lambda: method(endpoint.path, **extra)
+    elif endpoint.method == "get":
+        # the query string
+        send = lambda: method(endpoint.path, data, **extra)
+    else:
+        # uploads go as multipart, everything else as json
+        uploads = isinstance(data, dict) and any(
+            hasattr(value, "read") for value in data.values()
+        )
+        fmt = "multipart" if uploads else "json"
+        send = lambda: method(endpoint.path, data, format=fmt, **extra)
+
+    def request():
+        response = send()
+        # exports stream, their queries run while the body is read
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    return request
+
+
+def measure(client, endpoint, requests):
+    """
+    Latency percentiles (ms), queries per request (the most any request
+    ran), the most common status and the peak memory (KiB) allocated by
+    one request. Memory is traced on an extra request, tracing slows the
+    timed ones down.
+    """
+    latencies, queries, statuses = [], [], Counter()
+    for index in range(requests):
+        request = call(client, endpoint, index)
+        # like timeit, keep collections of earlier garbage out of the timing
+        gc.collect()
+        gc.disable()
+        try:
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = request()
+                latencies.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+        queries.append(len(context))
+        statuses[response.status_code] += 1
+
+    request = call(client, endpoint, requests)
+    tracemalloc.start()
+    try:
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": statuses.most_common(1)[0][0],
+        "p50": round(statistics.median(latencies) * 1000, 2),
+        "p95": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99": round(percentile(latencies, 0.99) * 1000, 2),
+        "queries": max(queries),
+        "memory_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance, query_tolerance=0, slack_ms=0):
+    """
+    Regressions of `results` against `baseline` (both {key: measurement}):
+    a different status, more queries than the baseline plus
+    `query_tolerance`, or a median latency or memory peak more than
+    `tolerance` (a fraction) above the baseline's. Latency may also be
+    `slack_ms` over, a millisecond of jitter is a lot for a fast endpoint.
+    p95 and p99 are reported but not compared, over a few dozen requests
+    they move with every scheduler hiccup of the machine.
+    A baseline key missing from `results` is a regression too, an endpoint
+    that stopped being measured can't be compared.
+    """
+    missing = sorted(baseline.keys() - results.keys())
+    regressions = [f"{key}: missing from the results" for key in missing]
+    for key, result in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result["status"] != base["status"]:
+            regressions.append(
+                f"{key}: status {result['status']}, baseline {base['status']}"
+            )
+        if result["queries"] > base["queries"] + query_tolerance:
+            regressions.append(
+                f"{key}: {result['queries']} queries, baseline {base['queries']}"
+            )
+        for metric, slack in (("p50", slack_ms), ("memory_kib", 0)):
+            if result[metric] > base[metric] * (1 + tolerance) + slack:
+                regressions.append(
+                    f"{key}: {metric} {result[metric]:.1f}, baseline {base[metric]:.1f}"
+                )
+    return regressions
@@ -0,0 +1,233 @@
+import hashlib
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework import serializers
+from rest_framework.permissions import BasePermission
+
+from utils.query_plans import _related_field
+from utils.reference_cache import CachedRelatedField
+
+
+def _nested_models(serializer):
+    """
+    Models whose rows are rendered inline by `serializer`, e.g. Brand and
+    Category for a product serializer nesting both.
+    """
+    model = getattr(getattr(serializer, "Meta", None), "model", None)
+    if model is None:
+        return []
+
+    models = []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*" or "." in field.source:
+            continue
+        if isinstance(field, CachedRelatedField):
+            models.append(field.related_model)
+            continue
+        related = _related_field(field)
+        if not isinstance(related, serializers.BaseSerializer):
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+        models.append(model_field.related_model)
+        models += _nested_models(related)
+    return models
+
+
+@lru_cache(maxsize=None)
+def nested_models(serializer_class):
+    """
+    The nested models with a modified_on column, each listed once.
+    """
+    return tuple(
+        dict.fromkeys(
+            model
+            for model in _nested_models(serializer_class())
+            if any(f.name == "modified_on" for f in model._meta.get_fields())
+        )
+    )
+
+
+def _latest(queryset):
+    return queryset.order_by("-modified_on").values("modified_on")
+
+
+def _bump(model):
+    TableVersion = apps.get_model("products", "TableVersion")
+    table = model._meta.label_lower
+    versions = TableVersion.objects.filter(table=table)
+    if not versions.update(deletes=F("deletes") + 1):
+        TableVersion.objects.bulk_create(
+            [TableVersion(table=table)], ignore_conflicts=True
+        )
+        versions.update(deletes=F("deletes") + 1)
+
+
+def count_delete(sender, **kwargs):
+    """
+    post_delete receiver for models served with ConditionalGetMixin.
+    """
+    _bump(sender)
+
+
+def count_m2m_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    m2m_changed receiver for the many-to-many fields of models served with
+    ConditionalGetMixin. Adding or removing links leaves modified_on alone,
+    so the model owning the field is counted like a delete.
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if pk_set is not None and not pk_set:
+        return
+    _bump(model if reverse else type(instance))
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for list and retrieve. The validators come
+    from one query made of LIMIT 1 probes on the modified_on indexes: the
+    latest row of the filtered queryset, the latest row of every table a
+    nested serializer renders (so renaming a brand changes the products that
+    embed it) and, for lists, the latest row of the own table (a row edited
+    out of the filter leaves the filtered maximum alone). Deletes and
+    many-to-many changes are counted in products.TableVersion by count_delete
+    and count_m2m_change. A matching If-None-Match or
+    If-Modified-Since gets a 304 without the page being loaded or the
+    serializer running.
+
+    The nested and table probes are per table, so any change to a nested
+    table refreshes every representation embedding it. Retrieve only answers
+    304 when no permission checks the object itself, because the object is
+    never loaded. Viewsets that also use utils.async_views.AsyncReadMixin
+    (listed after this mixin) get the same behaviour on their async list and
+    retrieve.
+    """
+
+    def validator_query(self, queryset, many):
+        TableVersion = apps.get_model("products", "TableVersion")
+        tables = nested_models(self.get_serializer_class())
+        if many:
+            tables = (queryset.model,) + tables
+        probes = {
+            f"table_{i}": Subquery(_latest(model._default_manager.all())[:1])
+            for i, model in enumerate(tables)
+        }
+        deletes = (
+            TableVersion.objects.filter(
+                table__in={
+                    model._meta.label_lower for model in (queryset.model,) + tables
+                }
+            )
+            .annotate(group=Value(1))
+            .values("group")
+            .annotate(total=Sum("deletes"))
+            .values("total")
+        )
+        return _latest(queryset).annotate(
+            deletes=Coalesce(Subquery(deletes), 0), **probes
+        )
+
+    def make_validators(self, validators):
+        if validators is None:
+            return None, None
+
+        deletes = validators.pop("deletes")
+        last_modified = max(value for value in validators.values() if value)
+        fingerprint = "|".join(
+            [
+                self.request.get_full_path(),
+                getattr(self.request.accepted_renderer, "format", ""),
+                str(deletes),
+                last_modified.isoformat(),
+            ]
+        )
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        return etag, int(last_modified.timestamp())
+
+    def get_validators(self, queryset, many=True):
+        return self.make_validators(self.validator_query(queryset, many).first())
+
+    async def aget_validators(self, queryset, many=True):
+        return self.make_validators(await self.validator_query(queryset, many).afirst())
+
+    def checks_object_permissions(self):
+        return any(
+            type(permission).has_object_permission
+            is not BasePermission.has_object_permission
+            for permission in self.get_permissions()
+        )
+
+    def object_queryset(self):
+        """
+        The single-row queryset retrieve reads, or None when the lookup is
+        malformed (get_object() answers 404 then).
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            return queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    def precondition_response(self, validators, request):
+        etag, last_modified = validators
+        if etag is None:
+            return None
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def add_validators(self, response, validators):
+        etag, last_modified = validators
+        if etag is not None and response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        validators = self.get_validators(self.filter_queryset(self.get_queryset()))
+        response = self.precondition_response(validators, request) or super().list(
+            request, *args, **kwargs
+        )
+        return self.add_validators(response, validators)
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = (None, None)
+        if not self.checks_object_permissions():
+            queryset = self.object_queryset()
+            if queryset is not None:
+                validators = self.get_validators(queryset, many=False)
+        response = self.precondition_response(validators, request) or super().retrieve(
+            request, *args, **kwargs
+        )
+        return self.add_validators(response, validators)
+
+    async def alist(self, request, *args, **kwargs):
+        validators = await self.aget_validators(await self.afilter_queryset())
+        response = self.precondition_response(validators, request) or (
+            await super().alist(request, *args, **kwargs)
+        )
+        return self.add_validators(response, validators)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        validators = (None, None)
+        if not self.checks_object_permissions():
+            queryset = await sync_to_async(self.object_queryset)()
+            if queryset is not None:
+                validators = await self.aget_validators(queryset, many=False)
+        response = self.precondition_response(validators, request) or (
+            await super().aretrieve(request, *args, **kwargs)
+        )
+        return self.add_validators(response, validators)
@@ -0,0 +1,303 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    # add a Server-Timing header (db, view, render and total durations)
+    "SERVER_TIMING": True,
+    # requests slower than this many ms, or running more queries, are logged
+    "SLOW_REQUEST_MS": 500,
+    "SLOW_QUERY_COUNT": 50,
+    # a statement repeated this often in one request is reported as N+1
+    "DUPLICATE_THRESHOLD": 5,
+    # raise QueryBudgetExceeded instead of logging when an action runs more
+    # queries than its viewset's query_budget_by_action allows, for tests
+    "STRICT": False,
+}
+
+
+def diagnostics_setting(name):
+    return getattr(settings, "QUERY_DIAGNOSTICS", {}).get(name, DEFAULTS[name])
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# statement text with any IN (%s, %s, ...) list collapsed, so a loop that
+# loads the same relation for every row has one fingerprint
+_IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+
+
+def fingerprint(sql):
+    return _IN_LIST.sub("(%s, ...)", sql)
+
+
+class RequestDiagnostics:
+    """
+    What one request spent on the database and on serialization.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.timings = Counter()
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def duplicates(self):
+        """
+        [(fingerprint, count)] of the statements run at least
+        DUPLICATE_THRESHOLD times, most repeated first.
+        """
+        threshold = diagnostics_setting("DUPLICATE_THRESHOLD")
+        return [
+            (sql, count)
+            for sql, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self):
+        metrics = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+        ]
+        for name, duration in sorted(self.timings.items()):
+            metrics.append(f"{name};dur={duration * 1000:.1f}")
+        metrics.append(f"total;dur={self.total_time * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_current = ContextVar("request_diagnostics", default=None)
+
+
+def current_diagnostics():
+    return _current.get()
+
+
+def record_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection, records into the
+    diagnostics of the current request, if any.
+    """
+    diagnostics = _current.get()
+    if diagnostics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        diagnostics.record_query(sql, time.perf_counter() - started)
+
+
+def install(connection):
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def _connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_connection_created)
+
+
+@contextmanager
+def timed(name):
+    """
+    Adds the time spent in the block to the `name` metric of the current
+    request.
+    """
+    diagnostics = _current.get()
+    if diagnostics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        diagnostics.timings[name] += time.perf_counter() - started
+
+
+class QueryDiagnosticsMiddleware:
+    """
+    Records the query count, database time, repeated statements, view time
+    (serializers included, QueryPlanMixin viewsets also report them as
+    `serialize`) and render time of every request. They are sent
+    as a Server-Timing header, slow requests and likely N+1 queries are
+    logged, and viewset actions are checked against their declared query
+    budget:
+
+        query_budget_by_action = {"list": 3, "retrieve": 2}
+
+    Streaming responses run their queries while the body is sent, after the
+    headers: they are recorded and logged once the body is consumed, but get
+    no Server-Timing header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not diagnostics_setting("ENABLED"):
+            return self.get_response(request)
+        # connections of this thread opened before the signal was connected
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        diagnostics = RequestDiagnostics()
+        token = _current.set(diagnostics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, diagnostics)
+
+    async def __acall__(self, request):
+        if not diagnostics_setting("ENABLED"):
+            return await self.get_response(request)
+        # queries run in sync_to_async threads, which inherit the context
+        diagnostics = RequestDiagnostics()
+        token = _current.set(diagnostics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, diagnostics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        diagnostics = _current.get()
+        if diagnostics is not None:
+            diagnostics.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook
+        diagnostics = _current.get()
+        if diagnostics is None:
+            return response
+        started = time.perf_counter()
+        view_started = getattr(diagnostics, "view_started", None)
+        if view_started is not None:
+            diagnostics.timings["view"] += started - view_started
+
+        def rendered(response):
+            diagnostics.timings["render"] += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, diagnostics):
+        if response.streaming:
+            response.streaming_content = self.record_stream(
+                request, response, diagnostics
+            )
+            return response
+        if diagnostics_setting("SERVER_TIMING"):
+            response["Server-Timing"] = diagnostics.server_timing()
+        self.check_budget(request, response, diagnostics)
+        self.log(request, response, diagnostics)
+        return response
+
+    def record_stream(self, request, response, diagnostics):
+        """
+        Wraps the body of a streaming response so the queries run while
+        producing each chunk count towards the request.
+        """
+        content = response.streaming_content
+        if response.is_async:
+
+            async def stream():
+                iterator = aiter(content)
+                try:
+                    while True:
+                        token = _current.set(diagnostics)
+                        try:
+                            chunk = await anext(iterator)
+                        except StopAsyncIteration:
+                            return
+                        finally:
+                            _current.reset(token)
+                        yield chunk
+                finally:
+                    self.log(request, response, diagnostics)
+
+            return stream()
+
+        def stream():
+            iterator = iter(content)
+            try:
+                while True:
+                    token = _current.set(diagnostics)
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        _current.reset(token)
+                    yield chunk
+            finally:
+                self.log(request, response, diagnostics)
+
+        return stream()
+
+    def check_budget(self, request, response, diagnostics):
+        view = (getattr(response, "renderer_context", None) or {}).get("view")
+        action = getattr(view, "action", None)
+        budget = getattr(view, "query_budget_by_action", {}).get(action)
+        if budget is None or diagnostics.queries <= budget:
+            return
+        message = (
+            f"{type(view).__name__}.{action} ran {diagnostics.queries} queries, "
+            f"its budget is {budget}."
+        )
+        if diagnostics_setting("STRICT"):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    def log(self, request, response, diagnostics):
+        duration = diagnostics.total_time * 1000
+        duplicates = diagnostics.duplicates()
+        if (
+            duration < diagnostics_setting("SLOW_REQUEST_MS")
+            and diagnostics.queries < diagnostics_setting("SLOW_QUERY_COUNT")
+            and not duplicates
+        ):
+            return
+        logger.warning(
+            "%s %s (%s) took %.1f ms, %d queries in %.1f ms%s",
+            request.method,
+            request.get_full_path(),
+            response.status_code,
+            duration,
+            diagnostics.queries,
+            diagnostics.db_time * 1000,
+            "".join(
+                f"\n  repeated {count}x: {sql}" for sql, count in duplicates[:5]
+            ),
+        )
@@ -1,13 +1,13 @@
-from django.core.mail import send_mail
-from django.conf import settings
-
-
-def send_otp_email(user_email, otp):
-    subject = "Your OTP Code"
-    message = f"Your otp code is {otp}"
-    from_email = settings.EMAIL_HOST_USER
-    recipient_list = [user_email]
-    
-    
-    send_mail(subject, message, from_email, recipient_list)
-    
\ No newline at end of file
+from apps.tasks.queue import enqueue
+
+
+def otp_message(otp):
+    subject = "Your OTP Code"
+    message = f"Your otp code is {otp}"
+    return subject, message
+
+
+def send_otp_email(user):
+    # the worker issues and renders the code when it sends the mail (see
+    # apps.accounts.tasks), so the plain code never sits in the task queue
+    enqueue("otp.send", {"user": str(user.pk)})
@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+
+from rest_framework import serializers
+
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+
+def read_rows(fileobj, file_format):
+    """
+    Yields one dict per CSV row / JSON line without reading the whole file.
+    `fileobj` may be a binary upload or a text file.
+    """
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        yield from csv.DictReader(fileobj)
+    elif file_format == "jsonl":
+        for line in fileobj:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # reported as an invalid row instead of aborting the import
+                yield None
+    else:
+        raise ValueError(f"Unsupported import format {file_format!r}")
+
+
+def guess_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+class ImportFileSerializer(serializers.Serializer):
+    """
+    An uploaded import file and its format, guessed from the file name when
+    not given.
+    """
+
+    file = serializers.FileField(
+        error_messages={"required": "A csv or jsonl file is required."}
+    )
+    file_format = serializers.ChoiceField(choices=IMPORT_FORMATS, required=False)
+
+    def validate(self, data):
+        data.setdefault("file_format", guess_format(data["file"].name))
+        return data
+
+    def rows(self):
+        return read_rows(
+            self.validated_data["file"], self.validated_data["file_format"]
+        )
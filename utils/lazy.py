@@ -0,0 +1,57 @@
+import sys
+import threading
+from importlib import import_module
+
+
+class LazyModule:
+    """
+    Stands in for a module until one of its attributes is read, then imports
+    it. For heavy dependencies only some endpoints use, so a worker does not
+    pay for them at boot:
+
+        barcode = lazy_import("barcode")
+        ...
+        barcode.get_barcode_class(symbology)  # imported here
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    @property
+    def is_loaded(self):
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    `name` itself when it is imported already, a LazyModule otherwise.
+    """
+    return sys.modules.get(name) or LazyModule(name)
@@ -1,6 +1,8 @@
 from django.db import models
 import uuid
 
+from utils.audit import AuditManager, current_user
+
 class CommonInfo(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     created_by = models.ForeignKey(
@@ -20,8 +22,25 @@ class CommonInfo(models.Model):
     created_on = models.DateTimeField(auto_now_add=True)
     modified_on = models.DateTimeField(auto_now=True)
 
+    objects = AuditManager()
+
     class Meta:
         abstract = True
+        indexes = [
+            # keyset pagination index, see utils.paginations.KeysetPagination
+            models.Index(fields=["created_on", "id"], name="%(class)s_created_id_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # attribution from utils.audit, explicit values win
+        user = current_user()
+        if user is not None:
+            if self._state.adding:
+                if self.created_by_id is None:
+                    self.created_by = user
+            else:
+                self.modified_by = user
+        super().save(*args, **kwargs)
         
 class Address(models.Model):
     zip_code = models.IntegerField(blank=True, null=True)
@@ -33,9 +52,12 @@ class Address(models.Model):
         abstract=True
         
 class OTP(models.Model):
-    otp = models.CharField(max_length=6, null=True)
-    otp_creation_at = models.DateTimeField(null=True)
-    otp_expiration_at = models.DateTimeField(null=True)
+    # keyed HMAC of the code, see apps.accounts.otp.hash_code
+    code_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+    # failed verifications, the code stops working at OTP_MAX_ATTEMPTS
+    attempts = models.PositiveSmallIntegerField(default=0)
     
     class Meta:
         abstract = True
\ No newline at end of file
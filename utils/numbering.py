@@ -0,0 +1,154 @@
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast, Substr
+
+
+# sequences known to exist (committed), so allocation is a bare nextval()
+_created = set()
+
+
+def after_max(model_label, field):
+    """
+    initial() for codes that were entered by hand until now: continue after
+    the highest one.
+    """
+
+    def initial(scope):
+        model = apps.get_model(model_label)
+        return (model._default_manager.aggregate(last=Max(field))["last"] or 0) + 1
+
+    return initial
+
+
+def after_max_suffix(model_label, field, prefix):
+    """
+    initial() for codes rendered as `prefix` followed by digits: continue
+    after the highest number among them. Codes in any other form are
+    ignored.
+    """
+
+    def initial(scope):
+        model = apps.get_model(model_label)
+        last = (
+            model._default_manager.filter(
+                **{f"{field}__regex": rf"^{re.escape(prefix)}[0-9]+$"}
+            )
+            .annotate(number=Cast(Substr(field, len(prefix) + 1), BigIntegerField()))
+            .aggregate(last=Max("number"))["last"]
+        )
+        return (last or 0) + 1
+
+    return initial
+
+
+class Numbering:
+    """
+    Hands out the numbers of one entity from a PostgreSQL sequence (one per
+    scope, e.g. per warehouse, when `scoped`). nextval() is O(1), never
+    waits on other transactions and never returns a number twice, though a
+    rolled back transaction leaves a gap.
+
+    Numbers are rendered with `template` (overridable in settings.NUMBERING)
+    or returned as integers when there is none. Sequences are created on
+    first use, starting at `initial(scope)`.
+    """
+
+    def __init__(self, name, template=None, scoped=False, initial=None):
+        self.name = name
+        self.default_template = template
+        self.scoped = scoped
+        self.initial = initial
+
+    @property
+    def template(self):
+        return getattr(settings, "NUMBERING", {}).get(self.name, self.default_template)
+
+    def sequence_name(self, scope=None):
+        if not self.scoped:
+            return f"numbering_{self.name}"
+        key = getattr(scope, "hex", None) or str(scope or "default")
+        return f"numbering_{self.name}_{key}"
+
+    def create_sequence(self, sequence, scope):
+        start = self.initial(scope) if self.initial else 1
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE SEQUENCE IF NOT EXISTS {connection.ops.quote_name(sequence)} "
+                    "START WITH %s",
+                    [start],
+                )
+        except DatabaseError:
+            # created by a concurrent transaction in the meantime
+            pass
+        # a sequence created in a transaction that rolls back is gone again
+        transaction.on_commit(lambda: _created.add(sequence))
+
+    def allocate_many(self, count, scope=None):
+        """
+        `count` raw numbers in one round trip, for bulk writers.
+        """
+        sequence = self.sequence_name(scope)
+        if sequence not in _created:
+            self.create_sequence(sequence, scope)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)", [sequence, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def advance(self, number, scope=None):
+        """
+        Moves the sequence past `number`, a code entered by hand, so it is
+        never handed out again. The sequence only ever moves forward.
+        """
+        sequence = self.sequence_name(scope)
+        if sequence not in _created:
+            self.create_sequence(sequence, scope)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT setval(%s, GREATEST(%s, CASE WHEN is_called THEN last_value "
+                f"ELSE last_value - 1 END)) FROM {connection.ops.quote_name(sequence)}",
+                [sequence, number],
+            )
+
+    def format(self, number, scope=None):
+        if self.template is None:
+            return number
+        return self.template.format(number=number, scope=scope)
+
+    def next(self, scope=None):
+        return self.format(self.allocate_many(1, scope)[0], scope)
+
+
+registry = {}
+
+
+def register(numbering):
+    registry[numbering.name] = numbering
+    return numbering
+
+
+SUPPLIER_CODE = register(
+    Numbering("supplier_code", initial=after_max("accounts.Supplier", "supplier_code"))
+)
+BILLER_CODE = register(
+    Numbering(
+        "biller_code",
+        template="BC-{number:05d}",
+        initial=after_max_suffix("accounts.Biller", "biller_code", "BC-"),
+    )
+)
+PRODUCT_CODE = register(
+    Numbering("product_code", initial=after_max("products.Product", "product_code"))
+)
+PURCHASE_INVOICE_NUMBER = register(
+    Numbering("purchase_invoice", template="PI-{number:06d}", scoped=True)
+)
+SALES_INVOICE_NUMBER = register(
+    Numbering("sales_invoice", template="SI-{number:06d}", scoped=True)
+)
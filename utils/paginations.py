@@ -1,4 +1,9 @@
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+
+from utils.async_views import afetch
 # from rest_framework.response import Response
 
 class MyPagination(pagination.PageNumberPagination):
@@ -16,3 +21,151 @@ class CustomPagination(pagination.LimitOffsetPagination):
     limit_query_param = 'limit'
     offset_query_param = 'offset'
 
+
+class KeysetPagination(pagination.CursorPagination):
+    """
+    Cursor pagination keyed on (created_on, id) instead of created_on alone,
+    so every position is unique and a page is always fetched with a single
+    index range scan, no COUNT(*) and no OFFSET however deep the client pages.
+    """
+    ordering = ('-created_on', '-id')
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    position_separator = '|'
+
+    def get_ordering(self, request, queryset, view):
+        # the keyset only matches its own index, so ?ordering= is not honoured
+        return self.ordering
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field_name in ordering:
+            field_name = field_name.lstrip('-')
+            if isinstance(instance, dict):
+                value = instance[field_name]
+            else:
+                value = getattr(instance, field_name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return self.position_separator.join(values)
+
+    def get_keyset_filter(self, queryset, position, reverse):
+        values = position.split(self.position_separator)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        keys = []
+        for field_name, value in zip(self.ordering, values):
+            name = field_name.lstrip('-')
+            try:
+                value = queryset.model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'lt' if field_name.startswith('-') != reverse else 'gt'
+            keys.append((name, lookup, value))
+
+        # (a, b) < (x, y)  ==  a < x OR (a = x AND b < y)
+        condition = Q()
+        for index, (name, lookup, value) in enumerate(keys):
+            term = Q(**{f'{name}__{lookup}': value})
+            for previous_name, _, previous_value in keys[:index]:
+                term &= Q(**{previous_name: previous_value})
+            condition |= term
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(await afetch(queryset))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        The query for the requested page, or None when pagination is off.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*pagination._reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(queryset, current_position, reverse)
+            )
+
+        self.reverse, self.current_position = reverse, current_position
+        # fetch one extra row to know whether there is a following page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        reverse, current_position = self.reverse, self.current_position
+        self.page = results[:self.page_size]
+
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                self.page[-1], self.ordering
+            )
+        else:
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = self.next_position
+        return self.encode_cursor(
+            pagination.Cursor(offset=0, reverse=False, position=position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.previous_position
+        return self.encode_cursor(
+            pagination.Cursor(offset=0, reverse=True, position=position)
+        )
+
+
+class UserKeysetPagination(KeysetPagination):
+    ordering = ('-date_joined', '-id')
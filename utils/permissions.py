@@ -1,11 +1,18 @@
 from rest_framework.permissions import (BasePermission,)
 from apps.accounts.models import Supplier
 
+def supplier_id(user):
+    # carried by signed access tokens, see apps.accounts.tokens
+    if hasattr(user, "supplier_id"):
+        return user.supplier_id
+    return Supplier.objects.filter(user=user).values_list("id", flat=True).first()
+
+
 class SupplierPermission(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_superuser or request.user.role == "Supplier"
+        return request.user.is_superuser or getattr(request.user, "role", None) == "Supplier"
     
     def has_object_permission(self, request, view, obj):
-        return obj.supplier == request.user.supplier
+        return obj.supplier_id == supplier_id(request.user)
     
 
@@ -0,0 +1,140 @@
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from utils.lazy import lazy_import
+from utils.reference_cache import LRUCache
+
+
+DEFAULTS = {
+    # region of numbers written without +<country code>, e.g. "NP"; None
+    # rejects them
+    "DEFAULT_REGION": None,
+    # parse results kept in-process
+    "CACHE_SIZE": 8192,
+}
+
+INVALID = _("Please enter valid phone numbers")
+NO_COUNTRY_CODE = _("Please enter phone number with country code, prefix must be +")
+
+
+def phone_setting(name):
+    return getattr(settings, "PHONE_NUMBERS", {}).get(name, DEFAULTS[name])
+
+
+# phonenumbers loads its metadata on import, so only processes that
+# actually parse a number pay for it
+phonenumbers = lazy_import("phonenumbers")
+
+_lock = threading.Lock()
+_parsed = None
+
+
+def _cache():
+    global _parsed
+    if _parsed is None:
+        with _lock:
+            if _parsed is None:
+                # a number's validity does not change, entries never expire
+                _parsed = LRUCache(phone_setting("CACHE_SIZE"), float("inf"))
+    return _parsed
+
+
+def parse(value, region=None):
+    """
+    (E.164 form, None) of a valid number, or (None, error message). Results
+    are memoized, importing a file full of repeated numbers parses each
+    once.
+    """
+    region = region or phone_setting("DEFAULT_REGION")
+    key = (value, region)
+    result = _cache().get(key)
+    if result is None:
+        result = _parse(value, region)
+        _cache().set(key, result)
+    return result
+
+
+def _parse(value, region):
+    try:
+        number = phonenumbers.parse(value, region)
+    except phonenumbers.NumberParseException:
+        return None, NO_COUNTRY_CODE
+    if not (phonenumbers.is_possible_number(number) and phonenumbers.is_valid_number(number)):
+        return None, INVALID
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164), None
+
+
+def normalize(value, region=None):
+    """
+    The E.164 form of `value` ("+9779800000000"), ValidationError if it is
+    not a valid number.
+    """
+    e164, error = parse(str(value), region)
+    if error is not None:
+        raise ValidationError(error)
+    return e164
+
+
+def normalize_or_keep(value):
+    if not value:
+        return value
+    e164, _ = parse(str(value))
+    return e164 or value
+
+
+def normalize_stored(model, field="phone"):
+    """
+    Rewrites the numbers stored in `model` (a migration's historical model)
+    in E.164 form. Nothing is written when two rows hold one number in
+    different spellings: the error lists them for an operator to fix, as
+    either row would be unsaveable once normalized.
+    """
+    manager = model._default_manager
+    rows = {}
+    for pk, value in manager.values_list("pk", field).iterator():
+        rows.setdefault(normalize_or_keep(value), []).append((pk, value))
+
+    conflicts = [
+        f"  {number}: " + ", ".join(f"{pk} ({value!r})" for pk, value in spellings)
+        for number, spellings in sorted(rows.items(), key=lambda item: str(item[0]))
+        if number and len(spellings) > 1
+    ]
+    if conflicts:
+        raise RuntimeError(
+            f"These {model._meta.label} rows store one {field} in different "
+            "spellings, give each its own number and migrate again:\n"
+            + "\n".join(conflicts)
+        )
+    for number, spellings in rows.items():
+        for pk, value in spellings:
+            if value != number:
+                manager.filter(pk=pk).update(**{field: number})
+
+
+class PhoneNumberField(models.CharField):
+    """
+    CharField storing numbers in E.164 form, so one number has one spelling
+    and exact lookups ("+977 980-0000000" as well) are a single probe of the
+    field's index. Values are normalized on save, in bulk writes and in
+    lookups; invalid values are left as they are for the validators.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # + and at most 15 digits
+        kwargs.setdefault("max_length", 16)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = normalize_or_keep(getattr(model_instance, self.attname))
+        setattr(model_instance, self.attname, value)
+        return value
+
+    def get_prep_value(self, value):
+        return normalize_or_keep(super().get_prep_value(value))
+
+    def to_python(self, value):
+        return normalize_or_keep(super().to_python(value))
@@ -0,0 +1,129 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+from utils.diagnostics import timed
+from utils.reference_cache import CachedRelatedField
+
+
+def empty_plan():
+    return {"select_related": [], "prefetch_related": [], "only": []}
+
+
+def _related_field(field):
+    """
+    Returns the serializer (or relation field) that renders the related
+    object(s) of `field`, or None when `field` does not touch a relation.
+    """
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, ManyRelatedField):
+        return field.child_relation
+    if isinstance(field, (serializers.BaseSerializer, RelatedField)):
+        return field
+    return None
+
+
+def _collect(serializer, prefix, plan):
+    model = getattr(getattr(serializer, "Meta", None), "model", None)
+    if model is None:
+        return plan
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*" or "." in field.source:
+            continue
+        if isinstance(field, CachedRelatedField):
+            # rows come from the reference cache, only their ids are loaded
+            if field.many:
+                plan["prefetch_related"].append(
+                    (prefix + field.source, field.related_model, {"only": ["pk"]})
+                )
+            continue
+        related = _related_field(field)
+        if related is None:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+
+        path = prefix + field.source
+        if model_field.many_to_many or model_field.one_to_many:
+            # every related object is loaded in one extra query; whatever the
+            # nested serializer needs is planned on that query, not per row
+            child_plan = empty_plan()
+            if isinstance(related, serializers.BaseSerializer):
+                _collect(related, "", child_plan)
+            plan["prefetch_related"].append(
+                (path, model_field.related_model, child_plan)
+            )
+        elif isinstance(related, serializers.BaseSerializer):
+            plan["select_related"].append(path)
+            _collect(related, path + "__", plan)
+        elif not related.use_pk_only_optimization():
+            plan["select_related"].append(path)
+    return plan
+
+
+@lru_cache(maxsize=None)
+def serializer_query_plan(serializer_class):
+    """
+    Derives the select_related / prefetch_related plan needed to render
+    `serializer_class` without any per-row queries.
+    """
+    return _collect(serializer_class(), "", empty_plan())
+
+
+def apply_query_plan(queryset, plan):
+    if plan.get("select_related"):
+        queryset = queryset.select_related(*plan["select_related"])
+    prefetches = []
+    for lookup in plan.get("prefetch_related", []):
+        if isinstance(lookup, tuple):
+            path, model, child_plan = lookup
+            lookup = Prefetch(
+                path, queryset=apply_query_plan(model._default_manager.all(), child_plan)
+            )
+        prefetches.append(lookup)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    if plan.get("only"):
+        queryset = queryset.only(*plan["only"])
+    return queryset
+
+
+class QueryPlanMixin:
+    """
+    Applies a per-action query plan to the viewset queryset so list and
+    retrieve run a fixed number of queries regardless of the page size.
+
+    Actions listed in `query_plan_by_action` use the declared plan, e.g.
+
+        query_plan_by_action = {
+            "list": {"select_related": ["brand"], "only": ["id", "brand__brand_name"]},
+        }
+
+    every other action gets a plan derived from its serializer class.
+    """
+
+    query_plan_by_action = {}
+
+    def get_query_plan(self):
+        try:
+            return self.query_plan_by_action[self.action]
+        except KeyError:
+            return serializer_query_plan(self.get_serializer_class())
+
+    def get_queryset(self):
+        return apply_query_plan(super().get_queryset(), self.get_query_plan())
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        # rendering the rows is reported as `serialize` in Server-Timing
+        serializer.to_representation = timed("serialize")(serializer.to_representation)
+        return serializer
@@ -0,0 +1,320 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections, models, transaction
+from rest_framework import serializers
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # Django cache alias used as the shared tier, locmem unless configured
+    "ALIAS": "default",
+    # seconds an in-process entry (and a model's generation) is trusted
+    "TTL": 30,
+    # entries kept in the in-process tier, across all models
+    "MAXSIZE": 4096,
+    # seconds an entry lives in the shared tier
+    "TIMEOUT": 3600,
+    # models ("app_label.Model") loaded into the cache when a worker boots
+    "WARM_UP": (),
+}
+
+
+def cache_setting(name):
+    return getattr(settings, "REFERENCE_CACHE", {}).get(name, DEFAULTS[name])
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class ReferenceCache:
+    """
+    Read-through cache of one model's rows by primary key: an in-process LRU
+    in front of a Django cache backend, in front of the database.
+
+    Keys carry a per-model generation counter kept in the shared tier. Saving
+    or deleting a row bumps it, which orphans every cached row of the model
+    at once; other processes see the new generation within `TTL` seconds.
+    """
+
+    local = None
+    stats_lock = threading.Lock()
+
+    def __init__(self, model):
+        self.model = model
+        self.label = model._meta.label_lower
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def local_cache(cls):
+        if cls.local is None:
+            cls.local = LRUCache(cache_setting("MAXSIZE"), cache_setting("TTL"))
+        return cls.local
+
+    @property
+    def shared(self):
+        return caches[cache_setting("ALIAS")]
+
+    def generation_key(self):
+        return f"refcache:{self.label}:generation"
+
+    def generation(self):
+        key = self.generation_key()
+        generation = self.local_cache().get(key)
+        if generation is None:
+            # never restart from a generation whose entries may still exist
+            generation = self.shared.get_or_set(key, time.time_ns(), timeout=None)
+            self.local_cache().set(key, generation)
+        return generation
+
+    def invalidate(self):
+        key = self.generation_key()
+        try:
+            generation = self.shared.incr(key)
+        except ValueError:
+            # not in the shared tier yet (or evicted)
+            generation = time.time_ns()
+            self.shared.set(key, generation, timeout=None)
+        self.local_cache().set(key, generation)
+
+    def count(self, **counters):
+        with self.stats_lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def get_many(self, pks):
+        """
+        {pk: instance} for every pk that exists.
+        """
+        local = self.local_cache()
+        generation = self.generation()
+        keys = {pk: f"refcache:{self.label}:{generation}:{pk}" for pk in pks}
+
+        found, missing = {}, []
+        for pk, key in keys.items():
+            instance = local.get(key)
+            if instance is None:
+                missing.append(pk)
+            else:
+                found[pk] = instance
+        hits = len(found)
+
+        shared_found = {}
+        if missing:
+            cached = self.shared.get_many([keys[pk] for pk in missing])
+            for pk in missing:
+                instance = cached.get(keys[pk])
+                if instance is not None:
+                    shared_found[pk] = instance
+                    local.set(keys[pk], instance)
+            missing = [pk for pk in missing if pk not in shared_found]
+
+        if missing:
+            loaded = self.model._default_manager.in_bulk(missing)
+            self.shared.set_many(
+                {keys[pk]: instance for pk, instance in loaded.items()},
+                timeout=cache_setting("TIMEOUT"),
+            )
+            for pk, instance in loaded.items():
+                local.set(keys[pk], instance)
+            found.update(loaded)
+
+        found.update(shared_found)
+        self.count(hits=hits, shared_hits=len(shared_found), misses=len(missing))
+        return found
+
+    def get(self, pk):
+        return self.get_many([pk]).get(pk)
+
+    def stats(self):
+        return {
+            "model": self.label,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+        }
+
+
+registry = {}
+
+
+def reference_cache(model):
+    if model not in registry:
+        registry[model] = ReferenceCache(model)
+    return registry[model]
+
+
+def warm_up(labels=None):
+    """
+    Loads the rows of the WARM_UP models into the reference cache, called
+    through boot_warm_up when a worker boots so its first requests find
+    them in memory. Returns {label: rows loaded}; a database that is not
+    reachable yet only skips the warm-up.
+    """
+    warmed = {}
+    for label in cache_setting("WARM_UP") if labels is None else labels:
+        model = apps.get_model(label)
+        try:
+            pks = list(
+                model._default_manager.values_list("pk", flat=True)[
+                    : cache_setting("MAXSIZE")
+                ]
+            )
+            warmed[label] = len(reference_cache(model).get_many(pks))
+        except DatabaseError as exc:
+            logger.warning("Reference cache warm-up of %s skipped: %s", label, exc)
+    return warmed
+
+
+def boot_warm_up(labels=None):
+    """
+    warm_up() for config/wsgi.py and config/asgi.py. It runs in a thread of
+    its own, because the ORM refuses to run where an event loop is running
+    (an ASGI server importing the application), and that thread closes its
+    connection: under gunicorn --preload every forked worker would share it.
+    """
+
+    def run():
+        try:
+            return warm_up(labels)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(run).result()
+
+
+def invalidate_reference(sender, **kwargs):
+    """
+    post_save / post_delete receiver for cached models. The generation is
+    bumped right away, so the writing transaction reads its own change, and
+    again on commit: another process may have cached the old row in between.
+    """
+    if not kwargs.get("raw"):
+        cache = reference_cache(sender)
+        cache.invalidate()
+        transaction.on_commit(cache.invalidate)
+
+
+class CachedRelatedField(serializers.Field):
+    """
+    Renders a foreign key (or, with many=True, a many-to-many) with
+    `serializer_class`, reading the related rows from the reference cache
+    instead of joining or querying them. The query plan only loads the
+    related ids.
+
+    Serializers using it render lists through CachedRelatedListSerializer
+    (Meta.list_serializer_class), which reads the rows of the whole page
+    at once; otherwise every row makes its own cache lookup.
+    """
+
+    def __init__(self, serializer_class, many=False, **kwargs):
+        kwargs["read_only"] = True
+        self.serializer_class = serializer_class
+        self.many = many
+        # {pk: instance} loaded for the page being rendered
+        self.loaded = None
+        super().__init__(**kwargs)
+
+    @property
+    def related_model(self):
+        return self.serializer_class.Meta.model
+
+    def get_attribute(self, instance):
+        if self.many:
+            return [related.pk for related in getattr(instance, self.source).all()]
+        return getattr(instance, instance._meta.get_field(self.source).attname)
+
+    def to_representation(self, value):
+        pks = value if self.many else [value]
+        if self.loaded is None:
+            instances = reference_cache(self.related_model).get_many(pks)
+        else:
+            instances = self.loaded
+        serializer = self.serializer_class(context=self.context)
+        rendered = [
+            serializer.to_representation(instances[pk]) for pk in pks if pk in instances
+        ]
+        if self.many:
+            return rendered
+        return rendered[0] if rendered else None
+
+
+class CachedRelatedListSerializer(serializers.ListSerializer):
+    """
+    Collects the related ids of every CachedRelatedField of the child over
+    the whole page and reads them with one get_many per model before the
+    rows are rendered.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        data = list(data)
+
+        fields = [
+            field
+            for field in self.child._readable_fields
+            if isinstance(field, CachedRelatedField)
+        ]
+        pks = defaultdict(set)
+        for field in fields:
+            for item in data:
+                value = field.get_attribute(item)
+                pks[field.related_model].update(value if field.many else [value])
+        loaded = {
+            model: reference_cache(model).get_many(
+                [pk for pk in model_pks if pk is not None]
+            )
+            for model, model_pks in pks.items()
+        }
+
+        for field in fields:
+            field.loaded = loaded[field.related_model]
+        try:
+            return super().to_representation(data)
+        finally:
+            for field in fields:
+                field.loaded = None
@@ -0,0 +1,48 @@
+from weakref import WeakKeyDictionary, WeakValueDictionary
+
+from django.db import transaction
+
+
+class CommitBatch:
+    """
+    on_commit callback that hands every key queued during a transaction to
+    `handler` in a single call.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.keys = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        self.handler(self.keys)
+
+
+# the batches still waiting for their transaction, per connection and handler.
+# Only Django holds them strongly, so a batch a rollback discards disappears
+# from here as well and the next transaction starts a new one.
+_pending = WeakKeyDictionary()
+
+
+def queue_on_commit(handler, keys):
+    """
+    Queues `keys` for `handler(keys)` once the current transaction commits,
+    sharing one call per handler however often it is queued. Outside a
+    transaction the handler runs immediately. Returns the keys that were not
+    already queued.
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        batches = _pending.setdefault(connection, WeakValueDictionary())
+        batch = batches.get(handler)
+        if batch is not None and not batch.done:
+            new = set(keys) - batch.keys
+            batch.keys |= new
+            return new
+    batch = CommitBatch(handler)
+    batch.keys = set(keys)
+    if connection.in_atomic_block:
+        batches[handler] = batch
+    transaction.on_commit(batch)
+    return batch.keys